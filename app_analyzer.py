@@ -0,0 +1,197 @@
+import argparse
+import json
+import re
+from collections import defaultdict
+from typing import Iterator
+
+# Roles of the protocols as labelled in the text logs
+ROLES = {
+    "UAVProtocol": "uav",
+    "SensorProtocol": "sensor",
+    "GroundStationProtocol": "ground_station",
+}
+
+## Text logs - the simulation's own log files, turned into the same events the event log holds
+## Lines look like: INFO     [it=12 time=0:00:01.500000 | UAVProtocol 3] Pinging network, current packet count 0
+
+LINE = re.compile(r"^\w+\s+\[it=\d+ time=(?:(\d+) days?, )?(\d+):(\d+):([\d.]+) \| (\w+) (\d+)[^\]]*\] (.*)$")
+
+# Older logs left the sensor out of some messages, those events have sensor None
+TEXT_EVENTS = [
+    ("round_started", re.compile(r"Coordinating host (?:pausing network and )?starting consensus(?: for sensor (?P<sensor>\d+))?")),
+    ("proposal_sent", re.compile(r"Sent proposal(?: for sensor (?P<sensor>\d+))? to coordinating host(?: (?P<leader>\d+))?")),
+    ("decided_alone", re.compile(r"Coordinating host (?P<leader>\d+) out of range, deciding sensor (?P<sensor>\d+) alone")),
+    ("proposals", re.compile(r"Proposals for consensus(?: of sensor (?P<sensor>\d+))?: (?P<proposals>.*)")),
+    ("no_room", re.compile(r"No UAV with room for sensor (?P<sensor>\d+)")),
+    ("decision", re.compile(r"Decision for consensus(?: of sensor (?P<sensor>\d+))?: \((?P<uav>\d+), (?P<value>[^)]*)\)")),
+    ("paused", re.compile(r"Pausing mobility due to consensus(?: for sensor (?P<sensor>\d+))?")),
+    ("resumed", re.compile(r"Resuming mobility after consensus for sensor (?P<sensor>\d+)")),
+    ("restart", re.compile(r"Restarting mission for uav")),
+    ("mission_started", re.compile(r"Mission: Starting mission")),
+    ("sensor_sent", re.compile(r"Sensor sent (?P<packets>\d+) packets to UAV (?P<uav>\d+)")),
+    ("uav_received", re.compile(r"Received (?P<packets>\d+) packets from sensor (?P<sensor>\d+)\. Current count (?P<total>\d+)")),
+    ("evicted", re.compile(r"Buffer full, evicted (?P<packets>\d+) packets")),
+    ("gave_up", re.compile(r"Gave up collecting packets from sensor (?P<sensor>\d+)")),
+    ("acknowledged", re.compile(r"Sent acknowledgment to UAV (?P<uav>\d+)\. Current count (?P<total>\d+)")),
+    ("final_count", re.compile(r"Final packet count: (?P<packets>\d+)")),
+    ("ping", re.compile(r"Pinging network, current packet count (?P<packets>\d+)")),
+]
+
+def _number(value: str):
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+def read_text_log(path: str) -> Iterator[dict]:
+    with open(path) as file:
+        for line in file:
+            match = LINE.match(line.rstrip("\n"))
+            if match is None:
+                continue
+            days, hours, minutes, seconds, label, node, message = match.groups()
+            time = int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+            for event, pattern in TEXT_EVENTS:
+                found = pattern.match(message)
+                if found is None:
+                    continue
+                fields = {key: _number(value) for key, value in found.groupdict().items()}
+                if event == "proposals":
+                    fields["proposals"] = re.findall(r"(\d+): [\[(]", fields["proposals"])
+                if event == "final_count":
+                    fields["role"] = ROLES.get(label, label)
+                yield {"t": time, "node": int(node), "event": event, **fields}
+                break
+
+## Event logs - JSON lines written by app_events.EventLog
+
+def read_event_log(path: str) -> Iterator[dict]:
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+# Event logs end in .jsonl, anything else is read as a text log
+def read_log(path: str) -> Iterator[dict]:
+    return read_event_log(path) if path.endswith(".jsonl") else read_text_log(path)
+
+## Analysis
+
+def analyze(events: Iterator[dict]) -> dict:
+    decisions = []
+    proposalsSent = defaultdict(int)
+    roundsStarted = 0
+    pausedSince = dict()
+    pauses = defaultdict(list)
+    fromSensors = defaultdict(int)
+    sentBySensors = defaultdict(int)
+    evicted = defaultdict(int)
+    finalCounts = defaultdict(dict)
+    acknowledged = 0
+    pings = 0
+    lastTime = 0
+
+    # Sensor of the last proposals each coordinating host gathered, older logs only name it there
+    roundProposals = dict()
+
+    for event in events:
+        name, node, time = event["event"], event["node"], event["t"]
+        lastTime = max(lastTime, time)
+
+        if name == "round_started":
+            roundsStarted += 1
+        elif name == "proposal_sent":
+            proposalsSent[node] += 1
+        elif name == "proposals":
+            roundProposals[node] = len(event["proposals"])
+        elif name == "decision":
+            decision = event["decision"] if "decision" in event else [event["uav"], event["value"]]
+            decisions.append({"time": time, "sensor": event.get("sensor"), "decided_by": node, "uav": int(decision[0]),
+                              "proposals": roundProposals.pop(node, None)})
+        elif name == "paused":
+            pausedSince.setdefault(node, time)
+        # Text logs of older runs have no resume message, the plugin restarting the mission marks it
+        elif name in ("resumed", "restart", "mission_started"):
+            since = pausedSince.pop(node, None)
+            if since is not None:
+                pauses[node].append(time - since)
+        elif name == "uav_received":
+            fromSensors[node] += event["packets"]
+        elif name == "sensor_sent":
+            sentBySensors[node] += event["packets"]
+        elif name == "evicted":
+            evicted[node] += event["packets"]
+        elif name == "acknowledged":
+            acknowledged += 1
+        elif name == "final_count":
+            finalCounts[event["role"]][node] = event["packets"]
+        elif name == "ping":
+            pings += 1
+
+    # UAVs still paused when the run ended
+    for node, since in pausedSince.items():
+        pauses[node].append(lastTime - since)
+
+    return {
+        "duration": lastTime,
+        "decisions": decisions,
+        "rounds_started": roundsStarted,
+        "proposals_sent": dict(proposalsSent),
+        "pauses": {
+            node: {"count": len(durations), "total": sum(durations), "mean": sum(durations) / len(durations), "max": max(durations)}
+            for node, durations in sorted(pauses.items())
+        },
+        "packets": {
+            "uav_from_sensors": dict(fromSensors),
+            "sent_by_sensors": sum(sentBySensors.values()),
+            "evicted": dict(evicted),
+            "acknowledgements": acknowledged,
+            "final": {role: dict(sorted(counts.items())) for role, counts in finalCounts.items()},
+        },
+        "pings": pings,
+    }
+
+def print_report(report: dict) -> None:
+    print(f"Run length: {report['duration']:.2f} s\tRounds started: {report['rounds_started']}\t"
+          f"Proposals sent: {sum(report['proposals_sent'].values())}\tDecisions: {len(report['decisions'])}")
+
+    print("\nDecision timeline")
+    print(f"{'time':>10}  {'sensor':>6}  {'decided by':>10}  {'uav':>4}  {'proposals':>9}")
+    for decision in report["decisions"]:
+        sensor = "-" if decision["sensor"] is None else decision["sensor"]
+        proposals = "-" if decision["proposals"] is None else decision["proposals"]
+        print(f"{decision['time']:>10.2f}  {sensor:>6}  {decision['decided_by']:>10}  {decision['uav']:>4}  {proposals:>9}")
+
+    print("\nPauses")
+    print(f"{'uav':>4}  {'count':>5}  {'total':>9}  {'mean':>8}  {'max':>8}")
+    for node, pause in report["pauses"].items():
+        print(f"{node:>4}  {pause['count']:>5}  {pause['total']:>9.2f}  {pause['mean']:>8.2f}  {pause['max']:>8.2f}")
+
+    packets = report["packets"]
+    print("\nPackets")
+    print(f"Sent by sensors: {packets['sent_by_sensors']}\tCollected by UAVs: {sum(packets['uav_from_sensors'].values())}\t"
+          f"Evicted: {sum(packets['evicted'].values())}\tAcknowledgements: {packets['acknowledgements']}")
+    for uav, count in sorted(packets["uav_from_sensors"].items()):
+        print(f"  UAV {uav}: {count} packets from sensors")
+    for role, counts in packets["final"].items():
+        print(f"  Final {role}: " + ", ".join(f"{node}: {count}" for node, count in counts.items()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Decision timelines, pauses and packet counts of a run, from its event log or text log")
+    parser.add_argument("log", help="Event log (.jsonl) or text log of a run")
+    parser.add_argument("--json", default=None, help="Also saves the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = analyze(read_log(args.log))
+    print_report(report)
+
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import globals
+
+from app_message import GeneralMessage
+
+## Auxiliary methods
+
+# With 3 UAVs, IDs will be [1, 2, 3]
+def get_uav_ids(totalUAVs: int) -> list:
+    return list(range(1, totalUAVs+1))
+
+# Consensus coordinating host will be UAV with biggest ID
+def get_coordinating_host(totalUAVs: int) -> int:
+    return max(get_uav_ids(totalUAVs))
+
+# { 1 : (2, 121.55), 2 : (2, 120.99), 3 : (1, 130.25) }
+# min would be value (2, 120.99) - smallest distance, or smallest score of the decision policy
+def make_decision(proposals: dict) -> tuple:
+    key = min(proposals, key=lambda x: proposals[x][1])
+    return tuple(proposals.get(key))
+
+# Number of proposals, out of the UAVs that may propose, after which the coordinating host decides without waiting for the timer
+def proposal_quorum(voters: int) -> int:
+    if globals.CONSENSUS_QUORUM == "majority":
+        return voters // 2 + 1
+    return voters
+
+## Fallback timer for proposals, adapted to how long proposals take to arrive (same estimator as TCP's RTO)
+class AdaptiveTimeout:
+    _srtt: float
+    _rttvar: float
+
+    def __init__(self, minimum: float, maximum: float):
+        self.minimum = minimum
+        self.maximum = maximum
+        self._srtt = None
+        self._rttvar = None
+
+    def observe(self, sample: float) -> None:
+        if self._srtt is None:
+            self._srtt = sample
+            self._rttvar = sample / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - sample)
+            self._srtt = 0.875 * self._srtt + 0.125 * sample
+
+    # Until something is observed the maximum is used, which is the original fixed wait
+    def timeout(self) -> float:
+        if self._srtt is None:
+            return self.maximum
+        return min(self.maximum, max(self.minimum, self._srtt + 4 * self._rttvar))
+
+# Seconds a proposer waits for the decision of a round before resuming the mission on its own
+ROUND_TIMEOUT = 6
+
+## Consensus engines - decide which UAV collects a sensor's packets, one round per sensor
+## The engine owns the round state of its UAV, the UAV (host) owns mobility, pausing and packet collection
+class ConsensusEngine:
+    name: str
+    # Whether the UAV arbitrating a round also proposes when it hears the sensor itself
+    leaderProposes: bool = False
+
+    def __init__(self, host):
+        self.host = host
+        self.proposals = dict()
+        self._roundTimes = dict()
+        # Round each sensor's pending timeout belongs to, timeouts of rounds that already finished are ignored
+        self._timeouts = dict()
+        self._timeoutSequence = 0
+        self._proposalTimeout = AdaptiveTimeout(globals.PROPOSAL_TIMEOUT_MIN, globals.PROPOSAL_TIMEOUT_MAX)
+        # Counters used to compare engines: proposals sent or recorded, rounds decided and the time they took to decide
+        self.stats = {"proposals": 0, "decisions": 0, "decision_latency": 0.0}
+
+    # UAV that collects the proposals of a sensor's round and decides it
+    def coordinator(self, sensor: int) -> int:
+        raise NotImplementedError
+
+    # Proposals a round needs to be decided before its fallback timer fires
+    def quorum(self) -> int:
+        raise NotImplementedError
+
+    # Drops every round in flight, called when a new lap starts
+    def reset(self) -> None:
+        self.proposals.clear()
+        self._roundTimes.clear()
+        self._timeouts.clear()
+
+    # Sensor answered a ping with its coordinates: propose the best scored UAV for its round
+    def handle_sensor_contact(self, msg: GeneralMessage) -> None:
+        host = self.host
+        sensor = msg.sender_id
+        leader = self.coordinator(sensor)
+
+        if sensor in host._pausedRounds or host.arbitrated(sensor):
+            return
+        if leader == host._id and not self.leaderProposes:
+            return
+        host._metrics.sensor_contact(sensor, host.provider.current_time())
+
+        # Own position (and predicted peer positions) are only written to the store when needed, not on every telemetry tick
+        host._refresh_positions()
+        host.uavPositions.update_load(host._id, host.packets.packets)
+        host.uavPositions.update_route(host._id, host.route_left())
+        proposal = host.uavPositions.best(msg.sender_pos, host._decisionPolicy, host.provider.current_time())
+
+        # Every UAV this one knows about is full, nothing to propose
+        if proposal[1] == float("inf"):
+            return
+        self.stats["proposals"] += 1
+
+        if leader == host._id:
+            self._add_proposal(sensor, host._id, proposal)
+            return
+
+        # A proposer that expects the coordinating host to be out of range (predicted from its announced route, or not
+        # heard lately on partitioned routes) decides on its own proposal instead of sending it where it would be lost
+        if not host._reaches(leader):
+            host._events.emit("decided_alone", sensor=sensor, leader=leader)
+            self.conclude_round(sensor, {host._id: proposal})
+            return
+
+        host._send_proposal(proposal, sensor, leader)
+        host._events.emit("proposal_sent", sensor=sensor, leader=leader)
+
+        host._pause_for_round(sensor)
+        self._timeoutSequence += 1
+        self._timeouts[sensor] = self._timeoutSequence
+        host.provider.schedule_timer(f"round_timeout:{sensor}:{self._timeoutSequence}", host.provider.current_time() + ROUND_TIMEOUT)
+
+    # Host left the sensor's round, however it finished, so its timeout no longer applies
+    def round_finished(self, sensor: int) -> None:
+        self._timeouts.pop(sensor, None)
+
+    # Proposal from a peer, only the coordinator of its round keeps it
+    def handle_proposal(self, msg: GeneralMessage) -> None:
+        if self.coordinator(msg.round_id) == self.host._id:
+            self._add_proposal(msg.round_id, msg.sender_id, msg.proposal)
+
+    # Decision of a round broadcast by its coordinator, or relayed by the chosen UAV
+    def handle_decision(self, msg: GeneralMessage) -> None:
+        self.host.uavPositions.assigned(msg.decision, self.host.provider.current_time())
+        if msg.round_id in self.host._pausedRounds:
+            self.host._arbitratedSensors.add(msg.round_id)
+
+        # If this UAV was the decision, it stops and relays the decision to the sensor
+        if msg.decision == self.host._id:
+            self.host._start_collecting(msg.round_id)
+        else:
+            # Resume mobility if this UAV was only waiting for this round
+            self.host._finish_round(msg.round_id)
+
+    # Returns True if the timer belonged to the engine
+    def handle_timer(self, timer: str, args: str) -> bool:
+        if (timer == "coord_waiting_for_proposal"):
+            self.decide_round(int(args))
+        elif (timer == "round_timeout"):
+            # Proposer never heard the decision, probably out of range of the coordinating host
+            # The timer may be left from an earlier round for the sensor, only the current round's one counts
+            sensor, timeoutRound = map(int, args.split(":"))
+            if self._timeouts.get(sensor) != timeoutRound:
+                return True
+            if sensor not in self.host._collectingRounds:
+                self.host._metrics.round_abandoned(sensor)
+                self.host._finish_round(sensor)
+        else:
+            return False
+        return True
+
+    def _add_proposal(self, sensor: int, proposer: int, proposal: tuple) -> None:
+        host = self.host
+        now = host.provider.current_time()
+
+        # Open a round for the sensor if there is none in flight
+        if sensor not in self.proposals:
+            host._events.emit("round_started", sensor=sensor)
+
+            # Coordinating host holds position while arbitrating so it stays in range of the proposers
+            host._pause_for_round(sensor)
+            self.proposals[sensor] = dict()
+            host.provider.schedule_timer(f"coord_waiting_for_proposal:{sensor}", now + self._proposalTimeout.timeout())
+
+        # For each round, we have a dict: { sensor : { proposer_uav_id : (proposed_uav, proposed_dist) } }
+        self.proposals[sensor][proposer] = proposal
+        # And when its first and latest proposals arrived: { sensor : [first, latest] }
+        self._roundTimes.setdefault(sensor, [now, now])[1] = now
+
+        # Decide right away once enough peers proposed, the timer is only a fallback
+        if len(self.proposals[sensor]) >= self.quorum():
+            host.provider.cancel_timer(f"coord_waiting_for_proposal:{sensor}")
+            self.decide_round(sensor)
+
+    # Coord host calculates final decision for a sensor's round and broadcasts it
+    def decide_round(self, sensor: int) -> None:
+        host = self.host
+
+        # The round is gone if a new lap started in the meantime
+        proposals = self.proposals.pop(sensor, None)
+        if not proposals:
+            return
+
+        # Time the last proposal took to arrive after the first one feeds the fallback timer of the next rounds
+        firstProposal, lastProposal = self._roundTimes.pop(sensor)
+        self._proposalTimeout.observe(lastProposal - firstProposal)
+        self.stats["decision_latency"] += host.provider.current_time() - firstProposal
+        self.conclude_round(sensor, proposals)
+
+    # Chooses the UAV collecting from the sensor out of the proposals and lets it know
+    def conclude_round(self, sensor: int, proposals: dict) -> None:
+        host = self.host
+        self.stats["decisions"] += 1
+        host._metrics.round_decided(sensor, host.provider.current_time())
+
+        host._events.emit("proposals", sensor=sensor, proposals=proposals)
+
+        # Proposals may be stale, UAVs that got near full since are not chosen
+        host.uavPositions.update_load(host._id, host.packets.packets)
+        proposals = {proposer: proposal for proposer, proposal in proposals.items() if host.uavPositions.has_room(proposal[0])}
+        if not proposals:
+            host._events.emit("no_room", sensor=sensor)
+            host._finish_round(sensor)
+            return
+
+        finalDecision = make_decision(proposals)
+        host._events.emit("decision", sensor=sensor, decision=finalDecision)
+        host.uavPositions.assigned(finalDecision[0], host.provider.current_time())
+        host._servedSensors[sensor] = host.provider.current_time()
+        if host._id in proposals:
+            host._arbitratedSensors.add(sensor)
+
+        # Broadcast decision, if the coordinating host was chosen it collects the packets itself
+        if (finalDecision[0] == host._id):
+            host._start_collecting(sensor)
+        else:
+            host._broadcast_decision(finalDecision[0], sensor)
+            host._finish_round(sensor)
+
+# Original scheme: the UAV with the biggest id arbitrates every round and does not propose
+class CoordinatorEngine(ConsensusEngine):
+    name = "coordinator"
+
+    def coordinator(self, sensor: int) -> int:
+        return get_coordinating_host(self.host.scenario.uavs)
+
+    # Every other UAV proposes
+    def quorum(self) -> int:
+        return proposal_quorum(self.host.scenario.uavs - 1)
+
+# Leadership rotates with the sensor, so rounds for different sensors are arbitrated by different UAVs
+# The leader of a round also proposes, so a round can be decided even if it is the only UAV near the sensor
+class RotatingLeaderEngine(ConsensusEngine):
+    name = "rotating"
+    leaderProposes = True
+
+    def coordinator(self, sensor: int) -> int:
+        uavIDs = get_uav_ids(self.host.scenario.uavs)
+        return uavIDs[sensor % len(uavIDs)]
+
+    def quorum(self) -> int:
+        return proposal_quorum(self.host.scenario.uavs)
+
+ENGINES = {
+    CoordinatorEngine.name: CoordinatorEngine,
+    RotatingLeaderEngine.name: RotatingLeaderEngine,
+}
+
+def get_engine(name: str, host) -> ConsensusEngine:
+    if name not in ENGINES:
+        raise ValueError(f"Unknown consensus engine '{name}', available: {', '.join(ENGINES)}")
+    return ENGINES[name](host)
@@ -0,0 +1,54 @@
+import numpy as np
+
+import globals
+
+## Decision policies - score UAVs for collecting from a sensor, the lowest score is proposed and then chosen
+## Every input is an array with one entry per UAV (or one row per sensor, one column per UAV), so whole swarms are scored at once
+class DecisionPolicy:
+    name: str
+    # Terms added to the distance, weighted by DECISION_WEIGHTS
+    terms: tuple = ()
+
+    # dists: squared distances to the sensor, loads: packets carried, routes: meters of route left,
+    # recent: 1 for a UAV assigned just now, decaying to 0 over RECENT_ASSIGNMENT_WINDOW
+    def scores(self, dists: np.ndarray, loads: np.ndarray, routes: np.ndarray, recent: np.ndarray) -> np.ndarray:
+        weights = globals.DECISION_WEIGHTS
+        values = {"load": loads, "route": routes, "recent": recent}
+
+        score = weights["distance"] * np.sqrt(dists)
+        for term in self.terms:
+            score = score + weights[term] * values[term]
+        return score
+
+# Original behaviour: the closest UAV, scored by squared distance
+class NearestPolicy(DecisionPolicy):
+    name = "nearest"
+
+    def scores(self, dists: np.ndarray, loads: np.ndarray, routes: np.ndarray, recent: np.ndarray) -> np.ndarray:
+        return dists
+
+# Spreads the packets over the swarm
+class LoadPolicy(DecisionPolicy):
+    name = "load"
+    terms = ("load",)
+
+# Prefers UAVs close to the end of their route, their packets reach the ground station sooner
+class RoutePolicy(DecisionPolicy):
+    name = "route"
+    terms = ("route",)
+
+class BalancedPolicy(DecisionPolicy):
+    name = "balanced"
+    terms = ("load", "route", "recent")
+
+DECISION_POLICIES = {
+    NearestPolicy.name: NearestPolicy,
+    LoadPolicy.name: LoadPolicy,
+    RoutePolicy.name: RoutePolicy,
+    BalancedPolicy.name: BalancedPolicy,
+}
+
+def get_decision_policy(name: str) -> DecisionPolicy:
+    if name not in DECISION_POLICIES:
+        raise ValueError(f"Unknown decision policy '{name}', available: {', '.join(DECISION_POLICIES)}")
+    return DECISION_POLICIES[name]()
@@ -0,0 +1,324 @@
+import argparse
+import logging
+import math
+import multiprocessing
+import os
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+
+from gradysim.simulator.simulation import SimulationConfiguration
+from app_execution import create_builder
+from app_headless import (collect_consensus_stats, collect_packet_counts, flatten_metrics, node_counts, run_headless)
+from app_metrics import MetricsCollector, set_collector
+from app_events import EventLog, set_event_log
+from app_random import start_run
+from app_scenario import Scenario, load_scenario, scenario_from_globals
+from app_scheduling import BROADCAST, OrderedEvents
+
+import globals
+
+## Distributed execution - the nodes of a scenario are split between worker processes, each running its share of them
+## in a simulation built by create_builder, with stand-ins for the nodes of the other workers, and a coordinator
+## keeping them in step
+##
+## Events run in the deterministic order of app_scheduling.py in every process, and a single-process run uses the same
+## order, so a seeded run gives the same results as app_headless.py with any number of workers (check_equivalence)
+##
+## Synchronisation is conservative and windowed. Workers run, in parallel, every event before a bound and hand the
+## messages they sent for other workers' nodes to the coordinator, which routes them before the next window.
+## The lookahead is the communication delay: what is sent from time T on arrives at T + delay at the earliest, so a
+## window runs from the earliest pending event of any worker for the length of the delay. Without a delay there is no
+## lookahead (UAV telemetry may send at any tick, when a lap ends), and a window is one generation of one timestamp
+
+## Collector of a worker: keeps what the hosted nodes report with the key of the event that reported it, for the
+## coordinator to replay every worker's reports into one collector in the order a single-process run reports them
+class RecordingCollector:
+    calls: list
+
+    def __init__(self, events: OrderedEvents):
+        self.calls = []
+        # Key of the reports made outside events, while the nodes initialize and finish
+        self.phase = None
+        self._events = events
+
+    def __getattr__(self, name: str):
+        return lambda *args: self.calls.append((self._events.key or self.phase, len(self.calls), name, args))
+
+## Nodes hosted by one worker process
+class Worker:
+    def __init__(self, scenario: Scenario, nodeIDs: list):
+        self._scenario = scenario
+        self._nodeIDs = sorted(nodeIDs)
+        self._events = OrderedEvents(scenario.duration, standalone=True)
+        self._metrics = set_collector(RecordingCollector(self._events))
+        set_event_log(EventLog())
+
+        config = SimulationConfiguration(duration=scenario.duration, real_time=False)
+        self._simulation = create_builder(config, visualization=False, scenario=scenario, events=self._events,
+                                          hosted=set(nodeIDs)).build()
+        handlers = self._node(self._nodeIDs[0]).provider.handlers
+        self._communication = handlers["communication"]
+        self._mobility = handlers["mobility"]
+
+    def _node(self, nodeID: int):
+        return self._simulation.get_node(nodeID).protocol_encapsulator
+
+    ## Steps, called by the coordinator
+
+    # Nodes initialize in id order, like gradysim does
+    def start(self) -> tuple:
+        busy = time.process_time()
+        for node in self._nodeIDs:
+            self._metrics.phase = (-math.inf, 0, node, 0, 0, 0)
+            self._node(node).initialize()
+        return self._reply(busy)
+
+    # Delivers the messages other workers sent and runs the events before the bound
+    def run(self, windowStart: float, bound: tuple, inbox: list) -> tuple:
+        busy = time.process_time()
+        self._communication.receive_remote(inbox)
+        self._mobility.forget_before(windowStart)
+        self._events.run_until(bound)
+        return self._reply(busy)
+
+    def finish(self, finishTime: float) -> dict:
+        self._events.now = finishTime
+        for node in self._nodeIDs:
+            self._metrics.phase = (math.inf, 0, node, 0, 0, 0)
+            self._node(node).finish()
+        return {
+            "counts": {node: node_counts(self._node(node).protocol, node, self._scenario) for node in self._nodeIDs},
+            "calls": self._metrics.calls,
+            "events": self._events.executed,
+        }
+
+    # Messages for other workers' nodes, (timestamp, generation) of the next pending event and CPU time of the step
+    def _reply(self, busy: float) -> tuple:
+        outbox, self._communication.outbox = self._communication.outbox, []
+        return outbox, self._events.next_key(), time.process_time() - busy
+
+# Worker process: applies the coordinator's settings and seed, builds its nodes and runs the steps it is sent
+def _worker_main(connection, scenario: Scenario, nodeIDs: list, settings: dict, seed: int) -> None:
+    for name, value in settings.items():
+        setattr(globals, name, value)
+    start_run(seed)
+
+    worker = Worker(scenario, nodeIDs)
+    connection.send("ready")
+    while True:
+        command, args = connection.recv()
+        connection.send(getattr(worker, command)(*args))
+        if command == "finish":
+            break
+    connection.close()
+
+## Coordinator
+
+# Ground station on the first worker, UAVs dealt in turn so every worker gets a similar share, sensors in blocks
+def partition_nodes(scenario: Scenario, workers: int) -> list:
+    shares = [[] for _ in range(workers)]
+    shares[0].append(0)
+    for index, uav in enumerate(scenario.uav_ids()):
+        shares[index % workers].append(uav)
+    first = scenario.first_sensor_id()
+    for share, block in zip(shares, np.array_split(np.arange(first, first + len(scenario.sensors)), workers)):
+        share.extend(block.tolist())
+    return shares
+
+# Settings of globals.py as this process has them, overrides included, for the workers to apply
+def current_settings() -> dict:
+    return {name: getattr(globals, name) for name in dir(globals) if name.isupper()}
+
+class Coordinator:
+    windows: int
+    criticalPath: float
+
+    def __init__(self, scenario: Scenario, workers: int, seed: int):
+        # Routes are planned once here and shipped with the scenario, instead of by every worker
+        scenario.waypoints()
+        if globals.ROUTE_PLANNER == "partitioned" and scenario.uavs:
+            scenario.uav_route(scenario.uav_ids()[0])
+
+        self.shares = [share for share in partition_nodes(scenario, workers) if share]
+        self._owners = {node: index for index, share in enumerate(self.shares) for node in share}
+        self._delay = scenario.communicationDelay
+        self._connections = []
+        self._processes = []
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+        for share in self.shares:
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker_main, args=(child, scenario, share, current_settings(), seed), daemon=True)
+            process.start()
+            self._connections.append(parent)
+            self._processes.append(process)
+        # Workers build their simulation before the run starts, like a single-process run builds it before timing
+        for connection in self._connections:
+            connection.recv()
+        self.windows = 0
+        # Sum over the windows of the busiest worker's CPU time, what the run takes with a CPU per worker
+        self.criticalPath = 0.0
+
+    # Sends the command to every worker and waits for all of them
+    def _all(self, command: str, args: list) -> list:
+        for connection, workerArgs in zip(self._connections, args):
+            connection.send((command, workerArgs))
+        return [connection.recv() for connection in self._connections]
+
+    # Routes the messages of the replies to the workers hosting their receivers, broadcasts to every other worker
+    # Returns the inbox of every worker and the earliest (timestamp, generation) pending anywhere
+    def _route(self, replies: list) -> tuple:
+        inboxes = [[] for _ in self._connections]
+        keys = [nextKey for _, nextKey, _ in replies if nextKey is not None]
+        for sender, (outbox, _, _) in enumerate(replies):
+            for message in outbox:
+                keys.append(message[:2])
+                destination = message[6]
+                if destination == BROADCAST:
+                    for worker, inbox in enumerate(inboxes):
+                        if worker != sender:
+                            inbox.append(message)
+                else:
+                    inboxes[self._owners[destination]].append(message)
+        self.criticalPath += max(busy for _, _, busy in replies)
+        return inboxes, min(keys, default=None)
+
+    def run(self, duration: float) -> tuple:
+        inboxes, nextKey = self._route(self._all("start", [() for _ in self._connections]))
+
+        # Like gradysim, the run ends at the first event past the duration, nodes finish at its time
+        while nextKey is not None and nextKey[0] <= duration:
+            windowStart = nextKey[0]
+            bound = (windowStart + self._delay, 0) if self._delay > 0 else (windowStart, nextKey[1] + 1)
+            inboxes, nextKey = self._route(self._all("run", [(windowStart, bound, inbox) for inbox in inboxes]))
+            self.windows += 1
+
+        finishTime = duration if nextKey is None else nextKey[0]
+        results = self._all("finish", [(finishTime,) for _ in self._connections])
+        for process in self._processes:
+            process.join()
+        return finishTime, results
+
+# Runs the scenario split between worker processes and returns the run statistics, the columns of run_headless
+# and the windows the run took
+def run_distributed(duration: float = None, nodes: int = None, seed: Optional[int] = None,
+                    scenario: Optional[Scenario] = None, workers: int = None, metrics_file: Optional[str] = None) -> dict:
+    scenario = scenario or scenario_from_globals()
+    if duration is not None:
+        scenario = scenario.with_changes(duration=duration)
+    if nodes is not None:
+        scenario = scenario.with_changes(uavs=nodes)
+    workers = workers or globals.DISTRIBUTED_WORKERS or os.cpu_count() or 1
+    # Without a delay every generation of every timestamp is a window, slower than a single process
+    if scenario.communicationDelay <= 0 and workers > 1:
+        logging.getLogger(__name__).warning(
+            "Communication delay is 0, so workers have no lookahead and synchronise at every timestamp, which is slower "
+            "than app_headless.py. Set one with --delay, communication_delay in the scenario file or "
+            "COMMUNICATION_MEDIUM_DELAY (it changes what is simulated, both runners use it)")
+
+    seed = start_run(seed)
+    coordinator = Coordinator(scenario, workers, seed)
+    start = time.perf_counter()
+    coordinatorStart = time.process_time()
+    simulationTime, results = coordinator.run(scenario.duration)
+    coordinatorTime = time.process_time() - coordinatorStart
+    wallTime = time.perf_counter() - start
+
+    # Reports are replayed in the order of the events that made them, as one collector gets them in a single process
+    counts = dict()
+    calls = []
+    for result in results:
+        counts.update(result["counts"])
+        calls.extend(result["calls"])
+    metrics = MetricsCollector(metrics_file)
+    for _, _, name, args in sorted(calls, key=lambda call: call[:2]):
+        getattr(metrics, name)(*args)
+    iterations = sum(result["events"] for result in results)
+    # Wall time with a CPU per worker: the busiest worker of every window, and the coordinator routing between them
+    parallelTime = coordinator.criticalPath + coordinatorTime
+
+    return {
+        "duration": scenario.duration,
+        "nodes": scenario.uavs,
+        "sensors": len(scenario.sensors),
+        "seed": seed,
+        "capacity": globals.UAV_BUFFER_CAPACITY,
+        "eviction": globals.UAV_EVICTION_POLICY,
+        "policy": globals.DECISION_POLICY,
+        "codec": globals.MESSAGE_CODEC,
+        "ping_mode": globals.PING_MODE,
+        "prediction": globals.TRAJECTORY_PREDICTION,
+        "planner": globals.ROUTE_PLANNER,
+        "dedup": globals.CONTACT_DEDUP,
+        # Every worker runs the mobility ticks, they count once per worker
+        "iterations": iterations,
+        "simulation_time": simulationTime,
+        "wall_time": wallTime,
+        "iterations_per_second": iterations / wallTime if wallTime > 0 else 0,
+        "speedup": simulationTime / wallTime if wallTime > 0 else 0,
+        "workers": len(coordinator.shares),
+        "lookahead": scenario.communicationDelay,
+        "windows": coordinator.windows,
+        "parallel_time": parallelTime,
+        **collect_packet_counts(counts, scenario),
+        **collect_consensus_stats(counts, scenario),
+        **flatten_metrics(metrics.summary),
+    }
+
+# Columns that depend on how the run was executed rather than on what was simulated
+EXECUTION_COLUMNS = ("iterations", "wall_time", "iterations_per_second", "speedup", "workers", "lookahead", "windows",
+                     "parallel_time")
+
+# Columns where a distributed run and a single-process run of the same seed differ, with both values, empty when
+# they simulated the same run
+def check_equivalence(result: dict, reference: dict) -> dict:
+    return {column: (result[column], reference[column]) for column in reference
+            if column in result and column not in EXECUTION_COLUMNS and result[column] != reference[column]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the consensus scenario with its nodes split between worker processes")
+    parser.add_argument("--scenario", default=None, help="Scenario file (.json, .toml, .yaml), the one in globals.py if not given")
+    parser.add_argument("--duration", type=float, default=None, help="Simulation duration in seconds, overrides the scenario")
+    parser.add_argument("--nodes", type=int, default=None, help="Number of UAVs in the swarm, overrides the scenario")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the run, SIMULATION_SEED or a new one if not given")
+    parser.add_argument("--workers", type=int, default=globals.DISTRIBUTED_WORKERS, help="Worker processes, one per CPU if not given")
+    parser.add_argument("--delay", type=float, default=None, help="Communication delay in seconds, the lookahead, overrides the scenario")
+    parser.add_argument("--metrics", default=None, help="Saves the JSON metrics summary of the run to this file")
+    parser.add_argument("--check", action="store_true", help="Also runs app_headless.py with the same seed and compares the results")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario) if args.scenario else scenario_from_globals()
+    if args.delay is not None:
+        scenario = scenario.with_changes(communicationDelay=args.delay)
+    result = run_distributed(args.duration, args.nodes, args.seed, scenario, args.workers, args.metrics)
+
+    print(f"Seed: {result['seed']}\t"
+          f"Workers: {result['workers']}\t"
+          f"Lookahead: {result['lookahead']} s\t"
+          f"Windows: {result['windows']}\t"
+          f"Simulation time: {result['simulation_time']:.2f} s\t"
+          f"Wall time: {result['wall_time']:.2f} s\t"
+          f"With a CPU per worker: {result['parallel_time']:.2f} s")
+    print(f"Collected packets: {result['collected_packets']}\t"
+          f"Laps: {result['laps']}\t"
+          f"Proposals: {result['proposals']}\t"
+          f"Decisions: {result['decisions']}\t"
+          f"Messages sent: {result['messages_sent']}\t"
+          f"Paused time: {result['paused_time']:.2f} s ({result['pauses']} pauses)\t"
+          f"Delivery ratio: {result['delivery_ratio']:.3f}")
+
+    if args.check:
+        reference = run_headless(args.duration, args.nodes, result["seed"], scenario=scenario)
+        differences = check_equivalence(result, reference)
+        for column, (value, expected) in differences.items():
+            print(f"Differs from app_headless.py: {column} {value} != {expected}")
+        print(f"Single process wall time: {reference['wall_time']:.2f} s\t"
+              f"{'Same results' if not differences else f'{len(differences)} columns differ'}")
+        if differences:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
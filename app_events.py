@@ -0,0 +1,128 @@
+import json
+import logging
+from typing import Optional
+
+import globals
+
+## Events protocols report: { event : (category, level, text) }
+## The text is only formatted when the event reaches a text log, fields are written as they are to the event log
+EVENTS = {
+    # Consensus rounds
+    "round_started": ("consensus", logging.INFO, "Coordinating host starting consensus for sensor {sensor}"),
+    "proposal_sent": ("consensus", logging.INFO, "Sent proposal for sensor {sensor} to coordinating host {leader}"),
+    "decided_alone": ("consensus", logging.INFO, "Coordinating host {leader} out of range, deciding sensor {sensor} alone"),
+    "proposals": ("consensus", logging.INFO, "Proposals for consensus of sensor {sensor}: {proposals}"),
+    "no_room": ("consensus", logging.INFO, "No UAV with room for sensor {sensor}"),
+    "decision": ("consensus", logging.INFO, "Decision for consensus of sensor {sensor}: {decision}"),
+    # UAV movement
+    "waypoints": ("mobility", logging.DEBUG, "Waypoints for uav: {waypoints}"),
+    "planned_sensors": ("mobility", logging.DEBUG, "Sensors planned for this route: {sensors}"),
+    "paused": ("mobility", logging.INFO, "Pausing mobility due to consensus for sensor {sensor}"),
+    "resumed": ("mobility", logging.INFO, "Resuming mobility after consensus for sensor {sensor}"),
+    "restart": ("mobility", logging.INFO, "Restarting mission for uav"),
+    # Packets changing hands
+    "sensor_sent": ("packets", logging.INFO, "Sensor sent {packets} packets to UAV {uav}"),
+    "uav_received": ("packets", logging.INFO, "Received {packets} packets from sensor {sensor}. Current count {total}."),
+    "evicted": ("packets", logging.INFO, "Buffer full, evicted {packets} packets"),
+    "gave_up": ("packets", logging.INFO, "Gave up collecting packets from sensor {sensor}"),
+    "acknowledged": ("packets", logging.INFO, "Sent acknowledgment to UAV {uav}. Current count {total}"),
+    "final_count": ("packets", logging.INFO, "Final packet count: {packets}"),
+    "sensor_delivery": ("packets", logging.INFO, "Sensor {sensor}: received {received}, missing {missing}, freshness {freshness:.1f} s"),
+    # Periodic network traffic, one event per ping
+    "ping": ("network", logging.DEBUG, "Pinging network, current packet count {packets}"),
+    "coordinates_sent": ("network", logging.DEBUG, "Sensor sent coordinates to UAV {uav}"),
+}
+
+# Text of an event, formatted by the logging handler only if a record is actually written
+class _EventText:
+    __slots__ = ("template", "fields")
+
+    def __init__(self, template: str, fields: dict):
+        self.template = template
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return self.template.format(**self.fields)
+
+# numpy numbers and arrays, and tuples used as keys, are written as plain JSON values
+def _json_default(value):
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+def _level(level) -> int:
+    return level if isinstance(level, int) else logging.getLevelName(level.upper())
+
+## Structured log of protocol events, gated per category by EVENT_LOG_LEVELS
+## Events that pass the gate go to the text log (the simulation's logger) and, with a path, to a JSON-lines file:
+## { "t": 12.5, "node": 3, "event": "decision", "sensor": 9, ... } per line, buffered and written in bulk
+## Protocols get the log with get_event_log() when they initialize, so it must be set before the simulation is built
+class EventLog:
+    path: Optional[str]
+    _levels: dict
+    _buffer: list
+
+    def __init__(self, path: Optional[str] = None, levels: Optional[dict] = None, bufferSize: int = None):
+        self.path = path
+        levels = {**globals.EVENT_LOG_LEVELS, **(levels or dict())}
+        self._levels = {category: _level(level) for category, level in levels.items()}
+        self._bufferSize = bufferSize or globals.EVENT_LOG_BUFFER
+        self._buffer = []
+        self._logger = logging.getLogger()
+        self._file = open(path, "w") if path is not None else None
+
+    # Whether events of the category at the level are kept, callers can skip preparing fields when they are not
+    def enabled(self, category: str, level: int) -> bool:
+        return level >= self._levels.get(category, logging.INFO)
+
+    def emit(self, time: float, node: int, event: str, **fields) -> None:
+        category, level, template = EVENTS[event]
+        if level < self._levels.get(category, logging.INFO):
+            return
+
+        if self._file is not None:
+            self._buffer.append((time, node, event, fields))
+            if len(self._buffer) >= self._bufferSize:
+                self.flush()
+
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, "%s", _EventText(template, fields))
+
+    def flush(self) -> None:
+        if self._file is None or not self._buffer:
+            return
+        lines = [json.dumps({"t": time, "node": node, "event": event, **fields}, default=_json_default)
+                 for time, node, event, fields in self._buffer]
+        self._file.write("\n".join(lines) + "\n")
+        self._buffer.clear()
+
+    def close(self) -> None:
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+## Events of a single node, stamped with its id and the simulation time when they are emitted
+class NodeEvents:
+    def __init__(self, log: EventLog, provider, nodeID: int):
+        self.log = log
+        self._provider = provider
+        self._nodeID = nodeID
+
+    def enabled(self, event: str) -> bool:
+        category, level, _ = EVENTS[event]
+        return self.log.enabled(category, level)
+
+    def emit(self, event: str, **fields) -> None:
+        self.log.emit(self._provider.current_time(), self._nodeID, event, **fields)
+
+_eventLog = EventLog()
+
+def get_event_log() -> EventLog:
+    return _eventLog
+
+# Replaces the event log used by protocols initialized from now on, returns it for convenience
+def set_event_log(eventLog: EventLog) -> EventLog:
+    global _eventLog
+    _eventLog = eventLog
+    return _eventLog
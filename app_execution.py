@@ -1,49 +1,99 @@
-from gradysim.simulator.handler.communication import CommunicationHandler, CommunicationMedium
-from gradysim.simulator.handler.mobility import MobilityHandler
-from gradysim.simulator.handler.timer import TimerHandler
+import argparse
+from typing import Optional
+
+from gradysim.simulator.handler.communication import CommunicationMedium
 from gradysim.simulator.handler.visualization import VisualizationHandler, VisualizationConfiguration
 from gradysim.simulator.simulation import SimulationBuilder, SimulationConfiguration
 from app_protocol import SensorProtocol, UAVProtocol, GroundStationProtocol
+from app_metrics import MetricsCollector, set_collector
+from app_events import EventLog, set_event_log
+from app_profiling import get_profiler
+from app_random import start_run
+from app_scheduling import (OrderedEvents, OrderedTimerHandler, OrderedCommunicationHandler, OrderedMobilityHandler,
+                             RemoteNode)
+from app_scenario import Scenario, bind_scenario, load_scenario, scenario_from_globals
+
+# Builds the topology of a scenario (the one described in globals by default), with or without the visualization handler
+# Protocols are bound to the scenario, so simulations built from different scenarios can live in the same process
+# Events run in the order of the given OrderedEvents (a new one by default). With hosted, only those nodes run their
+# protocol, the others are stand-ins for the nodes another process runs (see app_distributed.py)
+def create_builder(config: SimulationConfiguration, visualization: bool = True, scenario: Optional[Scenario] = None,
+                   events: Optional[OrderedEvents] = None, hosted: Optional[set] = None) -> SimulationBuilder:
+    scenario = scenario or scenario_from_globals()
+    events = events or OrderedEvents(config.duration)
+    builder = SimulationBuilder(config)
+    # Callbacks are timed only when profiling is enabled, otherwise the protocols are used as they are
+    profiler = get_profiler()
+
+    # Nodes another process hosts get a stand-in, ids are given in the order nodes are added
+    addedNodes = 0
+    def add_node(protocol, position):
+        nonlocal addedNodes
+        builder.add_node(protocol if hosted is None or addedNodes in hosted else RemoteNode, position)
+        addedNodes += 1
+
+    # Instantiating ground station at a fixed position, ID = 0
+    add_node(profiler.wrap(bind_scenario(GroundStationProtocol, scenario)), scenario.groundBase)
+
+    # Instantiating UAVs at ground base, IDs = 1,2,3... --> (1, uavs)
+    uavProtocol = profiler.wrap(bind_scenario(UAVProtocol, scenario))
+    for _ in range(scenario.uavs):
+        add_node(uavProtocol, scenario.groundBase)
+
+    # Instantiating sensors in fixed positions, IDs = uavs + 1, ..., streamed from the layout one chunk at a time
+    sensorProtocol = profiler.wrap(bind_scenario(SensorProtocol, scenario))
+    for _, rows in scenario.sensors.chunks():
+        for coord in rows.tolist():
+            add_node(sensorProtocol, tuple(coord))
+
+    # Adding required handlers
+    builder.add_handler(OrderedTimerHandler(events))
+    communication = OrderedCommunicationHandler(CommunicationMedium(
+        transmission_range=scenario.communicationRange,
+        delay=scenario.communicationDelay,
+    ), events, hosted)
+    # Only the UAVs move, messages from other processes are checked against where they were when they were sent
+    mobility = OrderedMobilityHandler(events, range(1, scenario.uavs + 1), recordHistory=hosted is not None)
+    communication.position_at = mobility.position_at
+    builder.add_handler(communication)
+    builder.add_handler(mobility)
+    if visualization:
+        builder.add_handler(VisualizationHandler(VisualizationConfiguration(
+            x_range=scenario.xRange,
+            y_range=scenario.yRange,
+            z_range=scenario.zRange,
+        )))
 
-import globals
+    return builder
 
 def main():
+    parser = argparse.ArgumentParser(description="Runs the consensus scenario in real time with visualization")
+    parser.add_argument("--scenario", default=None, help="Scenario file (.json, .toml, .yaml), the one in globals.py if not given")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario) if args.scenario else scenario_from_globals()
+
     # Configuring simulation
     config = SimulationConfiguration(
-        duration=globals.SIMULATION_DURATION,
+        duration=scenario.duration,
         real_time=True,
-        log_file=f"logs-nodes{globals.MAX_NODES}-dur{globals.SIMULATION_DURATION}.txt",
+        log_file=f"logs-nodes{scenario.uavs}-dur{scenario.duration}.txt",
         execution_logging=True,
     )
 
-    builder = SimulationBuilder(config)
+    # Metrics summary is saved next to the logs once every node finishes
+    set_collector(MetricsCollector(f"metrics-nodes{scenario.uavs}-dur{scenario.duration}.json"))
+    # Protocol events also go to a JSON-lines file, app_analyzer.py reads either
+    events = set_event_log(EventLog(f"events-nodes{scenario.uavs}-dur{scenario.duration}.jsonl"))
 
-    # Instantiating ground station at a fixed position, ID = 0
-    builder.add_node(GroundStationProtocol, globals.GROUND_BASE_CORD)
-
-    # Instantiating UAVs at ground base, IDs = 1,2,3... --> (1, MAX_NODES)
-    for _ in range(globals.MAX_NODES):
-        builder.add_node(UAVProtocol, globals.GROUND_BASE_CORD)
-
-    # Instantiating sensors in fixed positions, IDs = ... 4,5,6,7,8,9,10,11 -> (MAX_NODES + 1, MAX_NODES + len(SENSORS_COORD_LIST))
-    for coord in globals.SENSORS_COORD_LIST:
-        builder.add_node(SensorProtocol, coord)
-
-    # Adding required handlers
-    builder.add_handler(TimerHandler())
-    builder.add_handler(CommunicationHandler(CommunicationMedium(
-        transmission_range=globals.COMMUNICATION_MEDIUM_RANGE
-    )))
-    builder.add_handler(MobilityHandler())
-    builder.add_handler(VisualizationHandler(VisualizationConfiguration(
-        x_range=globals.SIMULATION_RANGE_X,
-        y_range=globals.SIMULATION_RANGE_Y,
-        z_range=globals.SIMULATION_RANGE_Z,
-    )))
+    # Seed is logged so the run can be replayed by setting SIMULATION_SEED
+    seed = start_run()
+    print(f"Simulation seed: {seed}")
 
     # Building and starting
-    simulation = builder.build()
+    simulation = create_builder(config, scenario=scenario).build()
     simulation.start_simulation()
+    events.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,241 @@
+import argparse
+import logging
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from gradysim.simulator.simulation import SimulationConfiguration
+from app_execution import create_builder
+from app_scheduling import OrderedEvents
+from app_message import CODECS
+from app_consensus import ENGINES
+from app_packets import EVICTION_POLICIES
+from app_decision import DECISION_POLICIES
+from app_metrics import MESSAGE_KINDS, MetricsCollector, set_collector
+from app_events import EventLog, set_event_log
+from app_profiling import HandlerProfiler, set_profiler, print_report
+from app_random import start_run
+from app_scenario import Scenario, load_scenario, scenario_from_globals
+
+import globals
+
+# Final counters of a node's protocol instance, read after the simulation finished
+def node_counts(protocol, node: int, scenario: Scenario) -> dict:
+    if node == 0:
+        return {"collected_packets": protocol.total_collected_packets}
+    if node < scenario.first_sensor_id():
+        return {"carried_packets": protocol.total_received_packets, "laps": protocol.laps, **protocol._consensus.stats}
+    return {"stored_packets": protocol.total_stored_packets}
+
+# Final packet counts of every node type, from the node_counts of every node
+def collect_packet_counts(counts: dict, scenario: Scenario) -> dict:
+    uavs = [counts[uav] for uav in scenario.uav_ids()]
+    sensors = [counts[scenario.first_sensor_id() + index] for index in range(len(scenario.sensors))]
+
+    return {
+        "collected_packets": counts[0]["collected_packets"],
+        "carried_packets": sum(uav["carried_packets"] for uav in uavs),
+        "stored_packets": sum(sensor["stored_packets"] for sensor in sensors),
+        "laps": sum(uav["laps"] for uav in uavs),
+    }
+
+# Consensus counters of every UAV's engine, summed over the swarm
+def collect_consensus_stats(counts: dict, scenario: Scenario) -> dict:
+    engines = [counts[uav] for uav in scenario.uav_ids()]
+    proposals = sum(engine["proposals"] for engine in engines)
+    decisions = sum(engine["decisions"] for engine in engines)
+    latency = sum(engine["decision_latency"] for engine in engines)
+
+    return {
+        "engine": globals.CONSENSUS_ENGINE,
+        "proposals": proposals,
+        "decisions": decisions,
+        "mean_decision_latency": latency / decisions if decisions else 0,
+    }
+
+# Headline numbers of the metrics summary as flat columns, so sweeps can tabulate them
+def flatten_metrics(summary: Optional[dict]) -> dict:
+    if summary is None:
+        return {}
+
+    return {
+        "messages_sent": sum(counts["sent"] for counts in summary["messages"].values()),
+        "messages_received": sum(counts["received"] for counts in summary["messages"].values()),
+        "bytes_sent": sum(counts["bytes_sent"] for counts in summary["messages"].values()),
+        # One column per message kind, 0 for the kinds the run did not send
+        **{f"{kind}_sent": summary["messages"].get(kind, {}).get("sent", 0) for kind in MESSAGE_KINDS},
+        "contact_to_decision": summary["decisions"]["mean_latency"],
+        "abandoned_rounds": summary["decisions"]["abandoned_rounds"],
+        "paused_time": sum(summary["paused_time"].values()),
+        "pauses": sum(summary["pauses"].values()),
+        "generated_packets": summary["packets"]["generated"],
+        "delivery_ratio": summary["packets"]["delivery_ratio"],
+        "delivery_delay": summary["packets"]["mean_delay"],
+        "duplicate_packets": summary["packets"]["duplicates"],
+        "evicted_packets": summary["packets"]["evicted"],
+    }
+
+# Sets the given globals for the duration of the block and restores them after, so in-process runs do not leak their
+# settings into the next one
+@contextmanager
+def overridden_globals(overrides: dict):
+    previous = {name: getattr(globals, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(globals, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(globals, name, value)
+
+# Runs the globals scenario as fast as possible, without visualization, and returns run statistics
+def run_headless(duration: float = None, nodes: int = None, seed: Optional[int] = None,
+                 log_file: Optional[str] = None, execution_logging: bool = False, codec: str = None,
+                 engine: str = None, metrics_file: Optional[str] = None, capacity: Optional[int] = None,
+                 eviction: str = None, policy: str = None, ping_mode: str = None,
+                 prediction: Optional[bool] = None, scenario: Optional[Scenario] = None,
+                 event_log: Optional[str] = None, planner: str = None, dedup: Optional[bool] = None,
+                 profile: Optional[bool] = None, profile_output: Optional[str] = None) -> dict:
+    # Duration and nodes override the scenario, the one described in globals by default
+    scenario = scenario or scenario_from_globals()
+    if duration is not None:
+        scenario = scenario.with_changes(duration=duration)
+    if nodes is not None:
+        scenario = scenario.with_changes(uavs=nodes)
+
+    # Settings given as arguments override globals for this run only
+    overrides = {
+        "MESSAGE_CODEC": codec,
+        "CONSENSUS_ENGINE": engine,
+        "UAV_BUFFER_CAPACITY": capacity,
+        "UAV_EVICTION_POLICY": eviction,
+        "DECISION_POLICY": policy,
+        "PING_MODE": ping_mode,
+        "TRAJECTORY_PREDICTION": prediction,
+        "ROUTE_PLANNER": planner,
+        "CONTACT_DEDUP": dedup,
+    }
+    with overridden_globals({name: value for name, value in overrides.items() if value is not None}):
+        return _run(scenario, seed, log_file, execution_logging, metrics_file, event_log, profile, profile_output)
+
+# The run itself, with the overrides of run_headless applied to globals
+def _run(scenario: Scenario, seed: Optional[int], log_file: Optional[str], execution_logging: bool,
+         metrics_file: Optional[str], event_log: Optional[str], profile: Optional[bool], profile_output: Optional[str]) -> dict:
+    config = SimulationConfiguration(
+        duration=scenario.duration,
+        real_time=False,
+        log_file=log_file,
+        execution_logging=execution_logging,
+    )
+
+    # Every UAV derives its generator from the run seed, the same seed and configuration replay the same run
+    seed = start_run(seed)
+
+    orderedEvents = OrderedEvents(scenario.duration)
+    metrics = set_collector(MetricsCollector(metrics_file))
+    events = set_event_log(EventLog(event_log))
+    profiler = set_profiler(HandlerProfiler(globals.PROFILE_HANDLERS if profile is None else profile,
+                                            profile_output or globals.PROFILE_OUTPUT))
+    builder = create_builder(config, visualization=False, scenario=scenario, events=orderedEvents)
+
+    # Every build attaches new handlers to the root logger, drop them after the run so repeated runs don't pile up
+    rootLogger = logging.getLogger()
+    previousHandlers = list(rootLogger.handlers)
+
+    try:
+        simulation = builder.build()
+        start = time.perf_counter()
+        simulation.start_simulation()
+        wallTime = time.perf_counter() - start
+        counts = {node: node_counts(simulation.get_node(node).protocol_encapsulator.protocol, node, scenario)
+                  for node in range(scenario.first_sensor_id() + len(scenario.sensors))}
+        packets = collect_packet_counts(counts, scenario)
+        consensus = collect_consensus_stats(counts, scenario)
+    finally:
+        for handler in rootLogger.handlers[len(previousHandlers):]:
+            handler.close()
+        rootLogger.handlers = previousHandlers
+        events.close()
+
+    return {
+        "duration": scenario.duration,
+        "nodes": scenario.uavs,
+        "sensors": len(scenario.sensors),
+        "seed": seed,
+        "capacity": globals.UAV_BUFFER_CAPACITY,
+        "eviction": globals.UAV_EVICTION_POLICY,
+        "policy": globals.DECISION_POLICY,
+        "codec": globals.MESSAGE_CODEC,
+        "ping_mode": globals.PING_MODE,
+        "prediction": globals.TRAJECTORY_PREDICTION,
+        "planner": globals.ROUTE_PLANNER,
+        "dedup": globals.CONTACT_DEDUP,
+        # Events run, and the time of the first one past the duration, where the simulation stopped
+        "iterations": orderedEvents.executed,
+        "simulation_time": orderedEvents.now,
+        "wall_time": wallTime,
+        "iterations_per_second": orderedEvents.executed / wallTime if wallTime > 0 else 0,
+        "speedup": orderedEvents.now / wallTime if wallTime > 0 else 0,
+        **packets,
+        **consensus,
+        **flatten_metrics(metrics.summary),
+        # Split of the wall time between protocol callbacks and the simulator, only when profiling
+        **({"profile": profiler.summary(wallTime)} if profiler.enabled else {}),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the consensus scenario headless, faster than real time")
+    parser.add_argument("--scenario", default=None, help="Scenario file (.json, .toml, .yaml), the one in globals.py if not given")
+    parser.add_argument("--duration", type=float, default=None, help="Simulation duration in seconds, overrides the scenario")
+    parser.add_argument("--nodes", type=int, default=None, help="Number of UAVs in the swarm, overrides the scenario")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the run, SIMULATION_SEED or a new one if not given")
+    parser.add_argument("--log-file", default=None, help="Saves the simulation logs to this file")
+    parser.add_argument("--execution-logging", action="store_true", help="Logs protocol messages during the run")
+    parser.add_argument("--codec", choices=list(CODECS), default=globals.MESSAGE_CODEC, help="Message encoding used on the network")
+    parser.add_argument("--engine", choices=list(ENGINES), default=globals.CONSENSUS_ENGINE, help="Consensus algorithm used by the UAVs")
+    parser.add_argument("--capacity", type=int, default=globals.UAV_BUFFER_CAPACITY, help="Packets a UAV can carry, unlimited if not given")
+    parser.add_argument("--eviction", choices=list(EVICTION_POLICIES), default=globals.UAV_EVICTION_POLICY, help="Packets a full UAV gives up")
+    parser.add_argument("--policy", choices=list(DECISION_POLICIES), default=globals.DECISION_POLICY, help="How the UAV collecting from a sensor is chosen")
+    parser.add_argument("--ping-mode", choices=["fixed", "adaptive"], default=globals.PING_MODE, help="How often UAVs ping the network")
+    parser.add_argument("--prediction", action="store_true", default=globals.TRAJECTORY_PREDICTION,
+                        help="UAVs predict peers' positions from announced routes and keep flying during consensus")
+    parser.add_argument("--planner", choices=["shared", "partitioned"], default=globals.ROUTE_PLANNER,
+                        help="Whether UAVs fly one shared route or split the sensors between their own tours")
+    parser.add_argument("--no-dedup", dest="dedup", action="store_false", default=globals.CONTACT_DEDUP,
+                        help="Sensors answer every ping and UAVs arbitrate a sensor on every contact")
+    parser.add_argument("--metrics", default=None, help="Saves the JSON metrics summary of the run to this file")
+    parser.add_argument("--event-log", default=None, help="Saves the protocol events of the run to this JSON-lines file")
+    parser.add_argument("--profile", action="store_true", default=globals.PROFILE_HANDLERS,
+                        help="Times every protocol callback and reports how the wall time splits between them and the simulator")
+    parser.add_argument("--profile-output", default=globals.PROFILE_OUTPUT,
+                        help="Also runs the callbacks under cProfile and saves the stats to this file (implies --profile)")
+    args = parser.parse_args()
+
+    result = run_headless(args.duration, args.nodes, args.seed, args.log_file, args.execution_logging, args.codec, args.engine,
+                          args.metrics, args.capacity, args.eviction, args.policy,
+                          args.ping_mode, args.prediction, load_scenario(args.scenario) if args.scenario else None,
+                          args.event_log, args.planner, args.dedup, args.profile, args.profile_output)
+
+    print(f"Seed: {result['seed']}\t"
+          f"Iterations: {result['iterations']}\t"
+          f"Simulation time: {result['simulation_time']:.2f} s\t"
+          f"Wall time: {result['wall_time']:.2f} s")
+    print(f"Iterations/second: {result['iterations_per_second']:.0f}\t"
+          f"Simulated seconds per wall second: {result['speedup']:.2f}")
+    print(f"Consensus engine: {result['engine']}\t"
+          f"Proposals: {result['proposals']}\t"
+          f"Decisions: {result['decisions']}\t"
+          f"Mean decision latency: {result['mean_decision_latency']:.3f} s")
+    print(f"Messages sent: {result['messages_sent']}\t"
+          f"Contact to decision: {result['contact_to_decision']:.3f} s\t"
+          f"Paused time: {result['paused_time']:.2f} s ({result['pauses']} pauses)\t"
+          f"Delivery ratio: {result['delivery_ratio']:.3f}\t"
+          f"Delivery delay: {result['delivery_delay']:.2f} s\t"
+          f"Duplicates: {result['duplicate_packets']}\t"
+          f"Evicted: {result['evicted_packets']}")
+    if "profile" in result:
+        print_report(result["profile"])
+
+
+if __name__ == "__main__":
+    main()
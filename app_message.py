@@ -0,0 +1,215 @@
+import enum
+import json
+import struct
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from gradysim.protocol.position import Position
+from app_packets import BATCH_DTYPE, EMPTY_BATCHES, batches_from_list
+from app_trajectory import EMPTY_ROUTE
+
+## Maps to GeneralMessage sender type
+class GeneralSender(enum.Enum):
+    GROUND_STATION = 0
+    SENSOR = 1
+    UAV = 2
+
+## Generalized message format that has fields necessary for all commuications
+## Slotted so every message is a compact object, the sender type is resolved to GeneralSender once when decoded
+@dataclass(slots=True)
+class GeneralMessage:
+    total_packets: int
+    sender_type: GeneralSender
+    sender_id: int
+    sender_pos: Position
+    proposal: tuple
+    decision: int
+    round_id: int
+    # Packet batches carried by the message (see app_packets), total_packets is only the advertised count
+    batches: np.ndarray = field(default_factory=lambda: EMPTY_BATCHES)
+    # Waypoints the sender will fly through from sender_pos, announced by UAV pings when their trajectory changes
+    route: np.ndarray = field(default_factory=lambda: EMPTY_ROUTE)
+
+# Indexed by GeneralSender value, avoids the enum lookup when decoding
+_SENDERS = tuple(GeneralSender)
+
+## Auxiliary methods
+
+def report_message(message: GeneralMessage) -> str:
+    return (f"Received message with {message.total_packets} packets from "
+            f"{message.sender_type.name} {message.sender_id}")
+
+# roundID tags proposals and decisions with the consensus round they belong to, which is the id of the sensor being arbitrated
+def new_message(packets: int, senderType: GeneralSender, senderID: int, senderPos: Position, proposal: tuple = (-1, 0), decision: int = -1, roundID: int = -1, batches: np.ndarray = EMPTY_BATCHES, route: np.ndarray = EMPTY_ROUTE) -> GeneralMessage:
+    return GeneralMessage(packets, senderType, senderID, senderPos, proposal, decision, roundID, batches, route)
+
+# Wire representation used by the JSON codec: { 'total_packets': 3, 'sender_type': 2, ... }
+def message_to_dict(message: GeneralMessage) -> dict:
+    return {
+        'total_packets': message.total_packets,
+        'sender_type': message.sender_type.value,
+        'sender_id': message.sender_id,
+        'sender_pos': message.sender_pos,
+        'proposal': message.proposal,
+        'decision': message.decision,
+        'round_id': message.round_id,
+        'batches': message.batches.tolist(),
+        'route': message.route.tolist(),
+    }
+
+def message_from_dict(data: dict) -> GeneralMessage:
+    return GeneralMessage(
+        data['total_packets'],
+        _SENDERS[data['sender_type']],
+        data['sender_id'],
+        tuple(data['sender_pos']),
+        tuple(data['proposal']),
+        data['decision'],
+        data['round_id'],
+        batches_from_list(data.get('batches')),
+        np.asarray(data['route'], dtype=float).reshape(-1, 3) if data.get('route') else EMPTY_ROUTE,
+    )
+
+## Codecs - translate a GeneralMessage to the string carried by the simulator and back
+
+class MessageCodec:
+    name: str
+
+    def encode(self, message: GeneralMessage) -> str:
+        raise NotImplementedError
+
+    def decode(self, data: str) -> GeneralMessage:
+        raise NotImplementedError
+
+# Raw batch records followed by the route waypoints (float64), appended to the fixed layout of the binary codecs
+def _pack_tail(message: GeneralMessage) -> str:
+    return (message.batches.tobytes() + np.ascontiguousarray(message.route, dtype="<f8").tobytes()).decode("latin-1")
+
+def _unpack_tail(raw: bytes, offset: int, totalBatches: int, totalRoute: int) -> tuple:
+    batches = np.frombuffer(raw, dtype=BATCH_DTYPE, count=totalBatches, offset=offset) if totalBatches else EMPTY_BATCHES
+    offset += totalBatches * BATCH_DTYPE.itemsize
+    route = np.frombuffer(raw, dtype="<f8", count=3 * totalRoute, offset=offset).reshape(-1, 3) if totalRoute else EMPTY_ROUTE
+    return batches, route
+
+# Human readable encoding, useful when debugging what goes through the network
+class JsonCodec(MessageCodec):
+    name = "json"
+
+    def encode(self, message: GeneralMessage) -> str:
+        return json.dumps(message_to_dict(message))
+
+    def decode(self, data: str) -> GeneralMessage:
+        return message_from_dict(json.loads(data))
+
+# Fixed layout encoding: sender type, sender id, packets, position (x, y, z), proposal (uav, dist), decision, round
+# followed by the number of packet batches and route waypoints, then the raw batch records and waypoints
+# The packed bytes are mapped one to one to characters (latin-1) because the simulator carries messages as strings
+class BinaryCodec(MessageCodec):
+    name = "binary"
+    _layout = struct.Struct("<Bii3didiiHH")
+
+    def encode(self, message: GeneralMessage) -> str:
+        pos = message.sender_pos
+        proposal = message.proposal
+
+        return self._layout.pack(
+            message.sender_type.value,
+            message.sender_id,
+            message.total_packets,
+            pos[0], pos[1], pos[2],
+            proposal[0], proposal[1],
+            message.decision,
+            message.round_id,
+            len(message.batches),
+            len(message.route),
+        ).decode("latin-1") + _pack_tail(message)
+
+    def decode(self, data: str) -> GeneralMessage:
+        raw = data.encode("latin-1")
+        senderType, senderID, packets, x, y, z, proposedUAV, proposedDist, decision, roundID, totalBatches, totalRoute = self._layout.unpack_from(raw)
+        batches, route = _unpack_tail(raw, self._layout.size, totalBatches, totalRoute)
+
+        return GeneralMessage(packets, _SENDERS[senderType], senderID, (x, y, z), (proposedUAV, proposedDist), decision, roundID, batches, route)
+
+# Binary encoding where UAV pings carry their position as a delta from the sender's last keyframe, in decimetres (int16)
+# Every keyframeInterval pings, or when the delta does not fit, the ping is a keyframe with the full position and a new id
+# The codec keeps state: its own keyframe when encoding and the latest keyframe of every sender when decoding,
+# a delta whose keyframe was not heard (out of range at the time) decodes with sender_pos None
+class DeltaBinaryCodec(BinaryCodec):
+    name = "delta"
+    _KEYFRAME = 0x40
+    _DELTA = 0x80
+    _keyLayout = struct.Struct("<BiiB3didiiHH")
+    _deltaLayout = struct.Struct("<BiiB3hidiiHH")
+
+    def __init__(self, keyframeInterval: int = 5):
+        self.keyframeInterval = keyframeInterval
+        self._keyframe = None
+        self._keyframeID = 0
+        self._sinceKeyframe = 0
+        self._references = dict()
+
+    def encode(self, message: GeneralMessage) -> str:
+        # Only pings are delta encoded, the positions in every other message are used for decisions
+        # Route announcements keep the full position, their trajectory starts there
+        if message.sender_type is not GeneralSender.UAV or message.decision >= 0 or message.proposal[0] >= 0 or len(message.route):
+            return super().encode(message)
+
+        pos = message.sender_pos
+        delta = None
+        if self._keyframe is not None and self._sinceKeyframe < self.keyframeInterval:
+            delta = [round((pos[axis] - self._keyframe[axis]) * 10) for axis in range(3)]
+            if any(abs(value) > 32767 for value in delta):
+                delta = None
+
+        if delta is None:
+            self._keyframe = pos
+            self._keyframeID = (self._keyframeID + 1) % 256
+            self._sinceKeyframe = 0
+            layout, flag, coords = self._keyLayout, self._KEYFRAME, pos
+        else:
+            self._sinceKeyframe += 1
+            layout, flag, coords = self._deltaLayout, self._DELTA, delta
+
+        return layout.pack(
+            message.sender_type.value | flag,
+            message.sender_id,
+            message.total_packets,
+            self._keyframeID,
+            coords[0], coords[1], coords[2],
+            message.proposal[0], message.proposal[1],
+            message.decision,
+            message.round_id,
+            len(message.batches),
+            len(message.route),
+        ).decode("latin-1") + _pack_tail(message)
+
+    def decode(self, data: str) -> GeneralMessage:
+        raw = data.encode("latin-1")
+        if not raw[0] & (self._KEYFRAME | self._DELTA):
+            return super().decode(data)
+
+        layout = self._keyLayout if raw[0] & self._KEYFRAME else self._deltaLayout
+        senderType, senderID, packets, keyframeID, x, y, z, proposedUAV, proposedDist, decision, roundID, totalBatches, totalRoute = layout.unpack_from(raw)
+        batches, route = _unpack_tail(raw, layout.size, totalBatches, totalRoute)
+
+        if raw[0] & self._KEYFRAME:
+            pos = (x, y, z)
+            self._references[senderID] = (keyframeID, pos)
+        else:
+            referenceID, reference = self._references.get(senderID, (None, None))
+            pos = None if referenceID != keyframeID else (reference[0] + x / 10, reference[1] + y / 10, reference[2] + z / 10)
+
+        return GeneralMessage(packets, _SENDERS[senderType & 0x3F], senderID, pos, (proposedUAV, proposedDist), decision, roundID, batches, route)
+
+CODECS = {
+    JsonCodec.name: JsonCodec,
+    BinaryCodec.name: BinaryCodec,
+    DeltaBinaryCodec.name: DeltaBinaryCodec,
+}
+
+def get_codec(name: str) -> MessageCodec:
+    if name not in CODECS:
+        raise ValueError(f"Unknown message codec '{name}', available: {', '.join(CODECS)}")
+    return CODECS[name]()
@@ -0,0 +1,155 @@
+import json
+from collections import defaultdict
+from typing import Optional
+
+from app_message import GeneralMessage, GeneralSender
+from app_random import run_seed
+
+# Every kind message_kind can return, so tables get the same columns whatever a run sent
+MESSAGE_KINDS = ("ping", "route", "coordinates", "proposal", "decision", "packets", "ack")
+
+# Kind of a message as seen on the network, derived from the fields it carries
+def message_kind(message: GeneralMessage) -> str:
+    if message.sender_type is GeneralSender.GROUND_STATION:
+        return "ack"
+    if message.sender_type is GeneralSender.SENSOR:
+        return "packets" if message.decision >= 0 else "coordinates"
+    if message.decision >= 0:
+        return "decision"
+    if message.proposal[0] >= 0:
+        return "proposal"
+    return "route" if len(message.route) else "ping"
+
+## Collects run metrics reported by every protocol instance and writes a JSON summary once all nodes finished
+## Protocols get the collector with get_collector() when they initialize, so it must be set before the simulation is built
+class MetricsCollector:
+    path: Optional[str]
+    summary: Optional[dict]
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.summary = None
+        self._nodes = 0
+        self._finishedNodes = 0
+        self._sent = defaultdict(int)
+        self._bytesSent = defaultdict(int)
+        self._received = defaultdict(int)
+        self._contacts = dict()
+        self._decisionLatencies = []
+        self._abandonedRounds = 0
+        self._pausedSince = dict()
+        self._pausedTime = defaultdict(float)
+        self._pauses = defaultdict(int)
+        self._generatedPackets = 0
+        self._collectedPackets = 0
+        self._deliveryDelay = 0.0
+        self._duplicatePackets = 0
+        self._sensorDelivery = dict()
+        self._evictedPackets = defaultdict(int)
+
+    def register_node(self) -> None:
+        self._nodes += 1
+
+    # size is the length of the encoded message, in characters (one per byte with the binary codecs)
+    def message_sent(self, message: GeneralMessage, size: int = 0) -> None:
+        kind = message_kind(message)
+        self._sent[kind] += 1
+        self._bytesSent[kind] += size
+
+    def message_received(self, message: GeneralMessage) -> None:
+        self._received[message_kind(message)] += 1
+
+    # First UAV to hear a sensor starts the clock of its round, later contacts for the same round are ignored
+    def sensor_contact(self, sensor: int, time: float) -> None:
+        self._contacts.setdefault(sensor, time)
+
+    def round_decided(self, sensor: int, time: float) -> None:
+        contact = self._contacts.pop(sensor, None)
+        if contact is not None:
+            self._decisionLatencies.append(time - contact)
+
+    # A proposer gave up waiting for the decision, the next contact with the sensor starts a new round
+    def round_abandoned(self, sensor: int) -> None:
+        if self._contacts.pop(sensor, None) is not None:
+            self._abandonedRounds += 1
+
+    def uav_paused(self, uav: int, time: float) -> None:
+        if uav not in self._pausedSince:
+            self._pausedSince[uav] = time
+            self._pauses[uav] += 1
+
+    def uav_resumed(self, uav: int, time: float) -> None:
+        since = self._pausedSince.pop(uav, None)
+        if since is not None:
+            self._pausedTime[uav] += time - since
+
+    def packets_generated(self, count: int = 1) -> None:
+        self._generatedPackets += count
+
+    # New packets that reached the ground station and the sum of the times they took since being generated
+    def packets_collected(self, count: int, delaySum: float = 0) -> None:
+        self._collectedPackets += count
+        self._deliveryDelay += delaySum
+
+    def packets_evicted(self, uav: int, count: int) -> None:
+        self._evictedPackets[uav] += count
+
+    # Per sensor freshness and gaps, as reported by the ground station when it finishes
+    def delivery_report(self, report: dict, duplicates: int) -> None:
+        self._sensorDelivery = report
+        self._duplicatePackets = duplicates
+
+    # Called from every protocol's finish, the summary is built and saved when the last node finishes
+    def node_finished(self, time: float) -> None:
+        self._finishedNodes += 1
+        if self._finishedNodes < self._nodes:
+            return
+
+        # UAVs still paused when the simulation ended
+        for uav in list(self._pausedSince):
+            self.uav_resumed(uav, time)
+
+        self.summary = self.build_summary(time)
+        if self.path is not None:
+            with open(self.path, "w") as file:
+                json.dump(self.summary, file, indent=2)
+
+    def build_summary(self, time: float) -> dict:
+        latencies = self._decisionLatencies
+        kinds = sorted(set(self._sent) | set(self._received))
+
+        return {
+            "seed": run_seed(),
+            "simulation_time": time,
+            "messages": {kind: {"sent": self._sent[kind], "received": self._received[kind], "bytes_sent": self._bytesSent[kind]}
+                         for kind in kinds},
+            "decisions": {
+                "count": len(latencies),
+                "mean_latency": sum(latencies) / len(latencies) if latencies else 0,
+                "max_latency": max(latencies, default=0),
+                "abandoned_rounds": self._abandonedRounds,
+            },
+            "paused_time": {str(uav): self._pausedTime[uav] for uav in sorted(self._pausedTime)},
+            "pauses": {str(uav): self._pauses[uav] for uav in sorted(self._pauses)},
+            "packets": {
+                "generated": self._generatedPackets,
+                "collected": self._collectedPackets,
+                "delivery_ratio": self._collectedPackets / self._generatedPackets if self._generatedPackets else 0,
+                "mean_delay": self._deliveryDelay / self._collectedPackets if self._collectedPackets else 0,
+                "duplicates": self._duplicatePackets,
+                "evicted": sum(self._evictedPackets.values()),
+                "evicted_per_uav": {str(uav): self._evictedPackets[uav] for uav in sorted(self._evictedPackets)},
+            },
+            "sensors": {str(sensor): delivery for sensor, delivery in self._sensorDelivery.items()},
+        }
+
+_collector = MetricsCollector()
+
+def get_collector() -> MetricsCollector:
+    return _collector
+
+# Replaces the collector used by protocols initialized from now on, returns it for convenience
+def set_collector(collector: MetricsCollector) -> MetricsCollector:
+    global _collector
+    _collector = collector
+    return _collector
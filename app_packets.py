@@ -0,0 +1,359 @@
+import math
+from typing import Optional
+
+import numpy as np
+
+import globals
+
+# One row per batch of consecutive packets of a sensor: sequence numbers first..last, created from created_first to created_last
+# Creation times inside a batch are spread evenly between its first and last packet, which is exact for a constant generation rate
+BATCH_DTYPE = np.dtype([
+    ("sensor", "<i4"),
+    ("first", "<i4"),
+    ("last", "<i4"),
+    ("created_first", "<f8"),
+    ("created_last", "<f8"),
+])
+
+EMPTY_BATCHES = np.zeros(0, dtype=BATCH_DTYPE)
+EMPTY_BATCHES.flags.writeable = False
+
+# [ (sensor, first, last, created_first, created_last), ... ] to a batch array
+def batches_from_list(rows) -> np.ndarray:
+    if not rows:
+        return EMPTY_BATCHES
+    return np.array([tuple(row) for row in rows], dtype=BATCH_DTYPE)
+
+def batch_sizes(batches: np.ndarray) -> np.ndarray:
+    return batches["last"] - batches["first"] + 1
+
+def count_packets(batches: np.ndarray) -> int:
+    return int(batch_sizes(batches).sum())
+
+# Drops the count oldest packets of the given rows, oldest batch first, emptied batches are left with last < first
+def _drop_oldest(batches: np.ndarray, rows: np.ndarray, count: int) -> None:
+    for row in rows[np.argsort(batches["created_first"][rows], kind="stable")].tolist():
+        if count <= 0:
+            return
+        sensor, first, last, createdFirst, createdLast = batches[row].tolist()
+        dropped = min(last - first + 1, count)
+        if dropped < last - first + 1:
+            batches["created_first"][row] = createdFirst + dropped * (createdLast - createdFirst) / (last - first)
+        batches["first"][row] = first + dropped
+        count -= dropped
+
+# Drops the count newest packets of the given rows, newest batch first
+def _drop_newest(batches: np.ndarray, rows: np.ndarray, count: int) -> None:
+    for row in rows[np.argsort(-batches["created_last"][rows], kind="stable")].tolist():
+        if count <= 0:
+            return
+        sensor, first, last, createdFirst, createdLast = batches[row].tolist()
+        dropped = min(last - first + 1, count)
+        if dropped < last - first + 1:
+            batches["created_last"][row] = createdLast - dropped * (createdLast - createdFirst) / (last - first)
+        batches["last"][row] = last - dropped
+        count -= dropped
+
+## Eviction policies - choose which packets a full buffer gives up, trimming whole or partial batches
+
+class EvictionPolicy:
+    name: str
+
+    # Returns the batches without excess packets
+    def evict(self, batches: np.ndarray, excess: int) -> np.ndarray:
+        batches = batches.copy()
+        self._drop(batches, excess)
+        return batches[batch_sizes(batches) > 0]
+
+    def _drop(self, batches: np.ndarray, excess: int) -> None:
+        raise NotImplementedError
+
+# Keeps the freshest data
+class DropOldestPolicy(EvictionPolicy):
+    name = "drop-oldest"
+
+    def _drop(self, batches: np.ndarray, excess: int) -> None:
+        _drop_oldest(batches, np.arange(len(batches)), excess)
+
+# Keeps what was collected first, packets arriving at a full buffer are lost
+class DropNewestPolicy(EvictionPolicy):
+    name = "drop-newest"
+
+    def _drop(self, batches: np.ndarray, excess: int) -> None:
+        _drop_newest(batches, np.arange(len(batches)), excess)
+
+# Splits the capacity evenly between the sensors in the buffer, sensors over their share lose their oldest packets
+class FairSharePolicy(EvictionPolicy):
+    name = "fair-share"
+
+    def _drop(self, batches: np.ndarray, excess: int) -> None:
+        sensors, inverse = np.unique(batches["sensor"], return_inverse=True)
+        totals = np.bincount(inverse, weights=batch_sizes(batches)).astype(np.int64)
+        room = int(totals.sum()) - excess
+
+        # Water filling: sensors under the even share keep everything, the rest split what is left
+        quotas = totals.copy()
+        order = np.argsort(totals, kind="stable")
+        for position, sensor in enumerate(order.tolist()):
+            share = room // (len(order) - position)
+            if totals[sensor] <= share:
+                room -= int(totals[sensor])
+                continue
+            remaining = order[position:]
+            quotas[remaining] = room // len(remaining)
+            quotas[remaining[:room % len(remaining)]] += 1
+            break
+
+        for sensor in np.flatnonzero(totals > quotas).tolist():
+            _drop_oldest(batches, np.flatnonzero(inverse == sensor), int(totals[sensor] - quotas[sensor]))
+
+EVICTION_POLICIES = {
+    DropOldestPolicy.name: DropOldestPolicy,
+    DropNewestPolicy.name: DropNewestPolicy,
+    FairSharePolicy.name: FairSharePolicy,
+}
+
+def get_eviction_policy(name: str) -> EvictionPolicy:
+    if name not in EVICTION_POLICIES:
+        raise ValueError(f"Unknown eviction policy '{name}', available: {', '.join(EVICTION_POLICIES)}")
+    return EVICTION_POLICIES[name]()
+
+## Generation models - packets a sensor created up to a given time, computed when the sensor is asked for them
+## instead of being generated by a timer every second. Each call returns what was created since the previous one:
+## [ (count, created_first, created_last), ... ], one batch per run of packets spread evenly in time
+class GenerationModel:
+    name: str
+    # Whether the batches of successive calls can be merged without losing their creation times
+    mergeable: bool = False
+    rate: float
+
+    def __init__(self, rate: float, rng: np.random.Generator):
+        self.rate = rate
+        self._rng = rng
+        self._until = 0.0
+
+    def generate(self, until: float) -> list:
+        since, self._until = self._until, max(self._until, until)
+        if until <= since:
+            return []
+        return self._generate(since, until)
+
+    def _generate(self, since: float, until: float) -> list:
+        raise NotImplementedError
+
+# Packets created every 1/rate seconds from 0, handed over on whole seconds like the per second timer did
+# With a whole rate that is rate packets every second, fractional rates carry their remainder to the next seconds
+class ConstantGeneration(GenerationModel):
+    name = "constant"
+    mergeable = True
+
+    def __init__(self, rate: float, rng: np.random.Generator):
+        super().__init__(rate, rng)
+        self._nextTick = 0
+
+    def generate(self, until: float) -> list:
+        lastTick = math.floor(until)
+        if lastTick < self._nextTick or self.rate <= 0:
+            return []
+        firstTick, self._nextTick = self._nextTick, lastTick + 1
+        first, last = self._created(firstTick - 1), self._created(lastTick)
+        if last == first:
+            return []
+        return [(last - first, first / self.rate, (last - 1) / self.rate)]
+
+    # Packets created up to the time, included, the small margin keeps products like 0.29 * 100 from rounding down
+    def _created(self, time: float) -> int:
+        return math.floor(time * self.rate + 1e-9) + 1 if time >= 0 else 0
+
+# Packets created independently at rate per second on average
+class PoissonGeneration(GenerationModel):
+    name = "poisson"
+
+    def _generate(self, since: float, until: float) -> list:
+        count = int(self._rng.poisson(self.rate * (until - since)))
+        if not count:
+            return []
+        created = self._rng.uniform(since, until, count)
+        return [(count, float(created.min()), float(created.max()))]
+
+# Bursts of SENSOR_BURST_SIZE packets created at once, at random times, with the same average rate
+class BurstyGeneration(GenerationModel):
+    name = "bursty"
+
+    def __init__(self, rate: float, rng: np.random.Generator, burst: int = None):
+        super().__init__(rate, rng)
+        self.burst = burst or globals.SENSOR_BURST_SIZE
+
+    def _generate(self, since: float, until: float) -> list:
+        bursts = int(self._rng.poisson(self.rate * (until - since) / self.burst))
+        return [(self.burst, time, time) for time in np.sort(self._rng.uniform(since, until, bursts)).tolist()]
+
+GENERATION_MODELS = {
+    ConstantGeneration.name: ConstantGeneration,
+    PoissonGeneration.name: PoissonGeneration,
+    BurstyGeneration.name: BurstyGeneration,
+}
+
+def get_generation_model(name: str, rate: float, rng: np.random.Generator) -> GenerationModel:
+    if name not in GENERATION_MODELS:
+        raise ValueError(f"Unknown generation model '{name}', available: {', '.join(GENERATION_MODELS)}")
+    return GENERATION_MODELS[name](rate, rng)
+
+## Packets held by a node, kept as batches in a growable structured array so transfers move whole ranges at once
+## A buffer with a capacity evicts packets with its policy when it gets more packets than it can hold
+class PacketBuffer:
+    packets: int
+    capacity: Optional[int]
+    policy: EvictionPolicy
+    evicted: int
+    _batches: np.ndarray
+    _size: int
+
+    def __init__(self, capacity: Optional[int] = None, policy: Optional[EvictionPolicy] = None):
+        self._batches = np.zeros(16, dtype=BATCH_DTYPE)
+        self._size = 0
+        self.packets = 0
+        self.capacity = capacity
+        self.policy = policy or DropOldestPolicy()
+        self.evicted = 0
+
+    # Packets that still fit before the buffer starts evicting
+    def room(self) -> float:
+        if self.capacity is None:
+            return float("inf")
+        return max(0, self.capacity - self.packets)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reserve(self, extra: int) -> None:
+        if self._size + extra > len(self._batches):
+            grown = np.zeros(max(2 * len(self._batches), self._size + extra), dtype=BATCH_DTYPE)
+            grown[:self._size] = self._batches[:self._size]
+            self._batches = grown
+
+    # Adds a range of packets, the sensor generating them merges it into its last batch when it continues that batch
+    def append(self, sensor: int, first: int, last: int, createdFirst: float, createdLast: float, merge: bool = False) -> None:
+        self.packets += last - first + 1
+
+        if merge and self._size:
+            tail = self._size - 1
+            if self._batches["sensor"][tail] == sensor and self._batches["last"][tail] + 1 == first:
+                self._batches["last"][tail] = last
+                self._batches["created_last"][tail] = createdLast
+                return
+
+        self._reserve(1)
+        self._batches[self._size] = (sensor, first, last, createdFirst, createdLast)
+        self._size += 1
+
+    # Adds received batches, returns how many packets were evicted to make room for them
+    def extend(self, batches: np.ndarray) -> int:
+        if not len(batches):
+            return 0
+
+        self._reserve(len(batches))
+        self._batches[self._size:self._size + len(batches)] = batches
+        self._size += len(batches)
+        self.packets += count_packets(batches)
+
+        if self.capacity is None or self.packets <= self.capacity:
+            return 0
+
+        excess = self.packets - self.capacity
+        kept = self.policy.evict(self._batches[:self._size], excess)
+        self._batches[:len(kept)] = kept
+        self._size = len(kept)
+        self.packets = count_packets(kept)
+        self.evicted += excess
+        return excess
+
+    # Copy of the batches currently held
+    def batches(self) -> np.ndarray:
+        return self._batches[:self._size].copy()
+
+    # Hands over every batch and empties the buffer
+    def take_all(self) -> np.ndarray:
+        batches = self.batches()
+        self.clear()
+        return batches
+
+    # Drops the batches acknowledged by the receiver, batches that arrived after they were sent are kept
+    # A held batch is dropped when an acknowledged one covers it, it may have been trimmed by evictions since it was sent
+    def discard(self, batches: np.ndarray) -> None:
+        if not len(batches) or not self._size:
+            return
+
+        held = self._batches[:self._size]
+        covered = ((held["sensor"][:, np.newaxis] == batches["sensor"][np.newaxis, :])
+                   & (held["first"][:, np.newaxis] >= batches["first"][np.newaxis, :])
+                   & (held["last"][:, np.newaxis] <= batches["last"][np.newaxis, :]))
+        kept = held[~covered.any(axis=1)]
+
+        self._batches[:len(kept)] = kept
+        self._size = len(kept)
+        self.packets = count_packets(kept)
+
+    def clear(self) -> None:
+        self._size = 0
+        self.packets = 0
+
+## Per sensor record of the sequence ranges that reached the ground station, used to report freshness, gaps and duplicates
+class DeliveryLedger:
+    _intervals: dict
+    _newest: dict
+    duplicates: int
+
+    def __init__(self):
+        # { sensor : [ (first, last), ... ] } - sorted, disjoint and non adjacent
+        self._intervals = dict()
+        # { sensor : creation time of the newest packet delivered }
+        self._newest = dict()
+        self.duplicates = 0
+
+    # Records the batches delivered at time now: returns how many packets were new and the sum of their delivery delays
+    def record(self, batches: np.ndarray, now: float) -> tuple:
+        newPackets = 0
+        delaySum = 0.0
+
+        for sensor, first, last, createdFirst, createdLast in batches.tolist():
+            fresh = self._add_interval(sensor, first, last)
+            self.duplicates += (last - first + 1) - fresh
+            newPackets += fresh
+            delaySum += fresh * (now - (createdFirst + createdLast) / 2)
+            self._newest[sensor] = max(self._newest.get(sensor, createdLast), createdLast)
+
+        return newPackets, delaySum
+
+    # Merges first..last into the sensor's intervals and returns how many sequence numbers were not there yet
+    def _add_interval(self, sensor: int, first: int, last: int) -> int:
+        low, high = first, last
+        overlap = 0
+        kept = []
+
+        for start, end in self._intervals.get(sensor, []):
+            if end < first - 1 or start > last + 1:
+                kept.append((start, end))
+            else:
+                overlap += max(0, min(end, last) - max(start, first) + 1)
+                low, high = min(low, start), max(high, end)
+
+        kept.append((low, high))
+        kept.sort()
+        self._intervals[sensor] = kept
+        return (last - first + 1) - overlap
+
+    # { sensor : { 'received': 120, 'newest': 131, 'missing': 12, 'freshness': 4.0 } }
+    # missing counts the sequence numbers below the newest one that never arrived, freshness is the age of the newest packet
+    def report(self, now: float) -> dict:
+        report = dict()
+        for sensor, intervals in sorted(self._intervals.items()):
+            received = sum(end - start + 1 for start, end in intervals)
+            newest = intervals[-1][1]
+            report[sensor] = {
+                "received": received,
+                "newest": newest,
+                "missing": newest + 1 - received,
+                "freshness": now - self._newest[sensor],
+            }
+        return report
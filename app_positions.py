@@ -0,0 +1,114 @@
+from typing import Optional
+
+import numpy as np
+
+from gradysim.protocol.position import Position
+from app_decision import DecisionPolicy
+
+## Last known position of every UAV in the swarm, kept in a contiguous (N, 3) array where row i belongs to UAV i + 1
+## Also keeps the packet load and route left each UAV advertised and when it was last assigned to a sensor,
+## UAVs loaded up to loadLimit are left out of the closest UAV queries
+class UAVPositionStore:
+    loadLimit: Optional[float]
+    recentWindow: float
+    _positions: np.ndarray
+    _known: np.ndarray
+    _loads: np.ndarray
+    _routes: np.ndarray
+    _lastAssigned: np.ndarray
+
+    def __init__(self, totalUAVs: int, loadLimit: Optional[float] = None, recentWindow: float = 30):
+        self.loadLimit = loadLimit
+        self.recentWindow = recentWindow
+        self._positions = np.zeros((totalUAVs, 3))
+        self._known = np.zeros(totalUAVs, dtype=bool)
+        self._loads = np.zeros(totalUAVs)
+        self._routes = np.zeros(totalUAVs)
+        self._lastAssigned = np.full(totalUAVs, -np.inf)
+
+    def __len__(self) -> int:
+        return int(self._known.sum())
+
+    def __contains__(self, uav: int) -> bool:
+        return bool(self._known[uav - 1])
+
+    def update(self, uav: int, pos: Position) -> None:
+        self._positions[uav - 1] = pos
+        self._known[uav - 1] = True
+
+    def get(self, uav: int) -> Position:
+        return tuple(self._positions[uav - 1].tolist())
+
+    def update_load(self, uav: int, packets: int) -> None:
+        self._loads[uav - 1] = packets
+
+    def get_load(self, uav: int) -> int:
+        return int(self._loads[uav - 1])
+
+    def update_route(self, uav: int, routeLeft: float) -> None:
+        self._routes[uav - 1] = routeLeft
+
+    def assigned(self, uav: int, time: float) -> None:
+        self._lastAssigned[uav - 1] = time
+
+    # 1 for UAVs assigned to a sensor just now, fading to 0 over recentWindow seconds
+    def recent_assignments(self, now: float) -> np.ndarray:
+        return np.exp(-(now - self._lastAssigned) / self.recentWindow)
+
+    # Whether the UAV can still take packets, as far as this store knows
+    def has_room(self, uav: int) -> bool:
+        return self.loadLimit is None or self._loads[uav - 1] < self.loadLimit
+
+    def clear(self) -> None:
+        self._known[:] = False
+        self._loads[:] = 0
+        self._routes[:] = 0
+        self._lastAssigned[:] = -np.inf
+
+    # { 1 : (x, y, z), 3 : (x, y, z) } - only UAVs with a known position
+    def as_dict(self) -> dict:
+        return {int(index) + 1: tuple(self._positions[index].tolist()) for index in np.flatnonzero(self._known)}
+
+    # UAVs with a known position and room for packets
+    def available(self) -> np.ndarray:
+        if self.loadLimit is None:
+            return self._known
+        return self._known & (self._loads < self.loadLimit)
+
+    # Squared distance from every UAV to the sensor, unknown or full UAVs are at infinity
+    def squared_distances(self, sensorPos: Position) -> np.ndarray:
+        diff = self._positions - sensorPos
+        dists = np.einsum("ij,ij->i", diff, diff)
+        dists[~self.available()] = np.inf
+        return dists
+
+    # Closest UAV to the sensor and its squared distance: (uav_id, dist), the distance is inf if no UAV is available
+    def closest(self, sensorPos: Position) -> tuple:
+        dists = self.squared_distances(sensorPos)
+        index = int(dists.argmin())
+        return index + 1, round(float(dists[index]), 5)
+
+    # Scores many sensors at once: returns an array of closest UAV ids and an array of their squared distances
+    def closest_batch(self, sensorPositions) -> tuple:
+        sensors = np.asarray(sensorPositions, dtype=float).reshape(-1, 3)
+        diff = sensors[:, np.newaxis, :] - self._positions[np.newaxis, :, :]
+        dists = np.einsum("sij,sij->si", diff, diff)
+        dists[:, ~self.available()] = np.inf
+        indexes = dists.argmin(axis=1)
+        return indexes + 1, np.round(dists[np.arange(len(sensors)), indexes], 5)
+
+    # UAV with the lowest policy score for the sensor and its score: (uav_id, score), the score is inf if no UAV is available
+    def best(self, sensorPos: Position, policy: DecisionPolicy, now: float) -> tuple:
+        scores = policy.scores(self.squared_distances(sensorPos), self._loads, self._routes, self.recent_assignments(now))
+        index = int(scores.argmin())
+        return index + 1, round(float(scores[index]), 5)
+
+    # Scores many sensors at once: returns an array of chosen UAV ids and an array of their scores
+    def best_batch(self, sensorPositions, policy: DecisionPolicy, now: float) -> tuple:
+        sensors = np.asarray(sensorPositions, dtype=float).reshape(-1, 3)
+        diff = sensors[:, np.newaxis, :] - self._positions[np.newaxis, :, :]
+        dists = np.einsum("sij,sij->si", diff, diff)
+        dists[:, ~self.available()] = np.inf
+        scores = policy.scores(dists, self._loads, self._routes, self.recent_assignments(now))
+        indexes = scores.argmin(axis=1)
+        return indexes + 1, np.round(scores[np.arange(len(sensors)), indexes], 5)
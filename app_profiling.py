@@ -0,0 +1,167 @@
+import cProfile
+import functools
+import time
+from typing import Optional
+
+import globals
+
+# Protocol callbacks the simulator calls, the ones timed when profiling
+CALLBACKS = ("initialize", "handle_timer", "handle_packet", "handle_telemetry", "finish")
+
+# Call durations are counted in power of two buckets of microseconds: under 1, 1 to 2, 2 to 4... the last one is open
+HISTOGRAM_BUCKETS = 24
+
+## Calls, time and duration histogram of one callback of one protocol class, times in nanoseconds
+class CallbackStats:
+    __slots__ = ("calls", "total", "max", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0
+        self.max = 0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, elapsed: int) -> None:
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        bucket = (elapsed // 1000).bit_length()
+        self.histogram[bucket if bucket < HISTOGRAM_BUCKETS else HISTOGRAM_BUCKETS - 1] += 1
+
+    # Upper bound, in microseconds, of the bucket holding the given fraction of the calls
+    def percentile(self, fraction: float) -> float:
+        target = fraction * self.calls
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= target:
+                return float(2 ** bucket)
+        return 0.0
+
+## Times every callback of the protocol classes it wraps, aggregated per class and callback
+## Profiling is opt-in: protocols are only wrapped when it is enabled, so runs without it call them directly and pay
+## nothing. With an output path, the callbacks also run under cProfile, saved there when the last node finishes
+## (pstats format, for snakeviz, flameprof or gprof2dot)
+## Protocols are wrapped by the simulation builder with get_profiler(), so it must be set before the simulation is built
+class HandlerProfiler:
+    enabled: bool
+    output: Optional[str]
+    stats: dict
+
+    def __init__(self, enabled: bool = False, output: Optional[str] = None):
+        self.enabled = enabled or output is not None
+        self.output = output
+        self.stats = dict()
+        self._profile = cProfile.Profile() if output is not None else None
+        self._depth = 0
+        self._nodes = 0
+        self._finishedNodes = 0
+
+    # Subclass of the protocol with its callbacks timed, named like it so logs read the same
+    # The protocol itself when profiling is disabled
+    def wrap(self, protocol: type) -> type:
+        if not self.enabled:
+            return protocol
+        callbacks = {callback: self._timed(protocol, callback) for callback in CALLBACKS}
+        return type(protocol.__name__, (protocol,), callbacks)
+
+    # Timed version of a callback. initialize and finish also count nodes, so the cProfile stats are saved when the
+    # last node finishes
+    def _timed(self, protocol: type, callback: str):
+        method = getattr(protocol, callback)
+        record = self.stats.setdefault((protocol.__name__, callback), CallbackStats()).add
+        clock = time.perf_counter_ns
+
+        if self._profile is None:
+            def timed(instance, *args):
+                start = clock()
+                try:
+                    return method(instance, *args)
+                finally:
+                    record(clock() - start)
+        else:
+            # cProfile only runs inside callbacks, it does not see the timing around them, and a callback calling
+            # another one does not restart it
+            profile = self._profile
+
+            def timed(instance, *args):
+                start = clock()
+                self._depth += 1
+                if self._depth == 1:
+                    profile.enable()
+                try:
+                    return method(instance, *args)
+                finally:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        profile.disable()
+                    record(clock() - start)
+
+        if callback == "initialize":
+            def counted(instance, *args):
+                timed(instance, *args)
+                self._nodes += 1
+        elif callback == "finish":
+            def counted(instance, *args):
+                timed(instance, *args)
+                self._node_finished()
+        else:
+            counted = timed
+        return functools.wraps(method)(counted)
+
+    def _node_finished(self) -> None:
+        self._finishedNodes += 1
+        if self._finishedNodes == self._nodes and self._profile is not None:
+            self._profile.dump_stats(self.output)
+
+    # Time spent in protocol code, in seconds
+    def protocol_time(self) -> float:
+        return sum(stats.total for stats in self.stats.values()) / 1e9
+
+    # Rows per protocol class and callback that was called, times in microseconds, percentiles as histogram bucket bounds
+    # With the wall time of the run, what the protocols did not use is reported as the simulator's (gradysim handlers,
+    # event loop and mobility)
+    def summary(self, wallTime: Optional[float] = None) -> dict:
+        callbacks = [
+            {
+                "protocol": protocol,
+                "callback": callback,
+                "calls": stats.calls,
+                "total_time": stats.total / 1e9,
+                "mean_us": stats.total / stats.calls / 1000,
+                "p50_us": stats.percentile(0.5),
+                "p99_us": stats.percentile(0.99),
+                "max_us": stats.max / 1000,
+                "histogram": stats.histogram,
+            }
+            for (protocol, callback), stats in sorted(self.stats.items()) if stats.calls
+        ]
+        summary = {"callbacks": callbacks, "protocol_time": self.protocol_time()}
+        if wallTime is not None:
+            summary["wall_time"] = wallTime
+            summary["simulator_time"] = max(wallTime - summary["protocol_time"], 0)
+        return summary
+
+def print_report(summary: dict) -> None:
+    print(f"{'protocol':<22} {'callback':<17} {'calls':>9} {'total (s)':>10} {'mean (us)':>10} {'p50 (us)':>9} {'p99 (us)':>9} {'max (us)':>10}")
+    for row in summary["callbacks"]:
+        print(f"{row['protocol']:<22} {row['callback']:<17} {row['calls']:>9} {row['total_time']:>10.3f} {row['mean_us']:>10.1f} "
+              f"{row['p50_us']:>9.0f} {row['p99_us']:>9.0f} {row['max_us']:>10.0f}")
+
+    line = f"Protocol code: {summary['protocol_time']:.3f} s"
+    if "wall_time" in summary:
+        share = summary["protocol_time"] / summary["wall_time"] if summary["wall_time"] else 0
+        line += f" ({share * 100:.1f}% of the run)\tSimulator: {summary['simulator_time']:.3f} s"
+    print(line)
+
+_profiler = HandlerProfiler(globals.PROFILE_HANDLERS, globals.PROFILE_OUTPUT)
+
+def get_profiler() -> HandlerProfiler:
+    return _profiler
+
+# Replaces the profiler used by simulations built from now on, returns it for convenience
+def set_profiler(profiler: HandlerProfiler) -> HandlerProfiler:
+    global _profiler
+    _profiler = profiler
+    return _profiler
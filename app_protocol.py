@@ -1,141 +1,140 @@
-import enum
-import json
-import logging
-from typing import TypedDict
 import globals
 import random
+from typing import Optional
+
+import numpy as np
 
 from gradysim.protocol.interface import IProtocol
 from gradysim.protocol.messages.communication import SendMessageCommand, BroadcastMessageCommand
 from gradysim.protocol.messages.telemetry import Telemetry
 from gradysim.protocol.position import *
 from gradysim.protocol.plugin.mission_mobility import MissionMobilityPlugin, MissionMobilityConfiguration, GotoCoordsMobilityCommand
-
-## Generalized message format to faciliate serialization that has fields necessary for all commuications
-class GeneralMessage(TypedDict):
-    total_packets: int
-    sender_type: int
-    sender_id: int
-    sender_pos: Position
-    proposal: tuple
-    decision: int
-    pause_network: bool
-
-## Maps to GeneralMessage sender type
-class GeneralSender(enum.Enum):
-    GROUND_STATION = 0
-    SENSOR = 1
-    UAV = 2
-
-## Auxiliary methods
-
-def report_message(message: GeneralMessage) -> str:
-    return (f"Received message with {message['total_packets']} packets from "
-            f"{GeneralSender(message['sender_type']).name} {message['sender_id']}")
-
-def new_message(packets: int, senderType: int, senderID: int, senderPos: Position, proposal: tuple = (-1, 0), decision: int = -1, pause: bool = False) -> GeneralMessage:
-    message: GeneralMessage = {
-        'total_packets': packets,
-        'sender_type': senderType,
-        'sender_id': senderID,
-        'sender_pos': senderPos,
-        'proposal': proposal,
-        'decision': decision,
-        'pause_network': pause,
-    }
-
-    return message
-
-def get_uav_distances_from_sensor(uavPos: dict, sensorPos: Position) -> dict:
-    uavDists = dict()
-
-    for uav, pos in uavPos.items():
-        distFromSensor = squared_distance(tuple(pos), sensorPos)
-        uavDists.update({int(uav) : round(distFromSensor, 5)})
-
-    return uavDists
-
-# If MAX_NODES = 3, IDs will be [1, 2, 3]
-def get_uav_ids() -> list:
-    return list(range(1, globals.MAX_NODES+1))
-
-# Consensus coordinating host will be UAV with biggest ID
-def get_coordinating_host() -> int:
-    return max(get_uav_ids())
-
-def total_uavs() -> int:
-    return len(get_uav_ids())
-
-# { 1 : (2, 121.55), 2 : (2, 120.99), 3 : (1, 130.25) }
-# min would be value (2, 120.99) - smallest distance
-def make_decision(proposals: dict) -> tuple:
-    key = min(proposals, key=lambda x: proposals[x][1])
-    return tuple(proposals.get(key))
+from app_positions import UAVPositionStore
+from app_message import GeneralMessage, GeneralSender, report_message, new_message, MessageCodec, get_codec
+from app_consensus import ConsensusEngine, get_engine
+from app_metrics import MetricsCollector, get_collector
+from app_events import NodeEvents, get_event_log
+from app_packets import PacketBuffer, DeliveryLedger, GenerationModel, get_eviction_policy, get_generation_model
+from app_decision import DecisionPolicy, get_decision_policy
+from app_trajectory import TrajectoryCache
+from app_random import node_random, node_generator
+from app_scenario import Scenario, scenario_from_globals
+
+# Speed of the UAVs along their missions, in m/s
+UAV_SPEED = 100
+
+# Times the UAV chosen for a sensor asks for its packets, one second apart, before giving up and resuming the mission
+COLLECTION_ATTEMPTS = 3
 
 ## Protocols
+## Every protocol reads the topology (node ids, positions, route, range) from its scenario, bound to the class with
+## bind_scenario by the simulation builder. Protocols used unbound run on the scenario of globals.py
 
 ## Implementation for the sensor
 class SensorProtocol(IProtocol):
-    _log: logging.Logger
+    _events: NodeEvents
+    _codec: MessageCodec
+    _metrics: MetricsCollector
     total_stored_packets: int
+    packets: PacketBuffer
+    _nextSequence: int
+    _generation: GenerationModel
+    _quietUntil: float
+    _answeredUAVs: dict
     position: Position
     _id: int
+    scenario: Scenario = None
 
     def initialize(self) -> None:
-        self._log = logging.getLogger()
+        self.scenario = self.scenario or scenario_from_globals()
+        self._codec = get_codec(globals.MESSAGE_CODEC)
+        self._metrics = get_collector()
+        self._metrics.register_node()
         self._id = self.provider.get_id()
+        self._events = NodeEvents(get_event_log(), self.provider, self._id)
         self.total_stored_packets = 0
-        self.position = globals.SENSORS_COORD_LIST[self._id - globals.MAX_NODES - 1]
-
-        self._generate_packet()
-
-    # Generate a packet every three seconds using a timer
-    def _generate_packet(self) -> None:
-        self.total_stored_packets += 1
-        self.provider.schedule_timer("sensor_generate_packet", self.provider.current_time() + 1)
-        # self._log.info(f"Generated packet, current count {self.total_stored_packets}")
+        self.packets = PacketBuffer()
+        self._nextSequence = 0
+        self._quietUntil = -np.inf
+        self._answeredUAVs = dict()
+        self.position = self.scenario.sensor_position(self._id)
+        self._generation = get_generation_model(globals.SENSOR_GENERATION_MODEL, globals.SENSOR_PACKET_RATE, node_generator(self._id))
+
+        self._generate_packets()
+
+    # Stores the packets created since the last call, computed from the elapsed time by the generation model
+    # Nothing observes a sensor's data between UAV contacts, so it is only brought up to date when asked for or at the end
+    def _generate_packets(self) -> None:
+        for count, createdFirst, createdLast in self._generation.generate(self.provider.current_time()):
+            first = self._nextSequence
+            self._nextSequence += count
+            self.packets.append(self._id, first, self._nextSequence - 1, createdFirst, createdLast, merge=self._generation.mergeable)
+            self._metrics.packets_generated(count)
+        self.total_stored_packets = self.packets.packets
 
     # Sensor implements handle_timer
     def handle_timer(self, timer: str) -> None:
-        if (timer == "sensor_generate_packet"):
-            self._generate_packet()
+        pass
     
     # Sensor implements handle_packets
     def handle_packet(self, message: str) -> None:
-        general_message: GeneralMessage = json.loads(message)
+        general_message: GeneralMessage = self._codec.decode(message)
+        self._metrics.message_received(general_message)
         # self._log.info(report_message(general_message))
 
         # Sensor receives a message from UAV
-        if general_message["sender_type"] == GeneralSender.UAV.value:
+        if general_message.sender_type is GeneralSender.UAV:
 
             #If UAVs made a decision as to who will receive packets
-            if(general_message["decision"]) >= 0:
+            if(general_message.decision) >= 0:
+                # Decisions are tagged with the sensor they were made for, other sensors' rounds are not our business
+                if general_message.round_id != self._id:
+                    return
+
+                self._generate_packets()
                 responseToUAV = new_message(
                     packets=self.total_stored_packets,
-                    senderType= GeneralSender.SENSOR.value,
+                    senderType=GeneralSender.SENSOR,
                     senderID=self._id,
                     senderPos=self.position,
-                    decision=general_message["decision"],
+                    decision=general_message.decision,
+                    roundID=self._id,
+                    batches=self.packets.take_all(),
                 )
 
-                responseCmd = SendMessageCommand(json.dumps(responseToUAV), general_message["decision"])
+                responseCmd = SendMessageCommand(self._codec.encode(responseToUAV), general_message.decision)
                 self.provider.send_communication_command(responseCmd)
+                self._metrics.message_sent(responseToUAV, len(responseCmd.message))
 
                 self.total_stored_packets = 0
-                
-                self._log.info(f"Sensor sent {responseToUAV['total_packets']} packets to UAV {general_message['decision']}")
-            else:
+                # The round is over and the sensor empty, the UAVs still passing by have nothing to start a round for
+                self._quietUntil = self.provider.current_time() + globals.SENSOR_CONTACT_HOLD
+                self._answeredUAVs.clear()
+
+                self._events.emit("sensor_sent", packets=responseToUAV.total_packets, uav=general_message.decision)
+            # Route announcements are meant for peers, sensors only answer pings
+            elif not len(general_message.route):
+                # With contact deduplication every UAV gets one reply per contact, its next pings are ignored while
+                # the round it joined is pending, for up to SENSOR_CONTACT_HOLD
+                if globals.CONTACT_DEDUP:
+                    now = self.provider.current_time()
+                    uav = general_message.sender_id
+                    if now < self._quietUntil or now - self._answeredUAVs.get(uav, -np.inf) < globals.SENSOR_CONTACT_HOLD:
+                        return
+                    self._answeredUAVs[uav] = now
+
                 responseToUAV = new_message(
                     packets=0,
-                    senderType= GeneralSender.SENSOR.value,
+                    senderType=GeneralSender.SENSOR,
                     senderID=self._id,
                     senderPos=self.position,
                 )
 
-                responseCmd = SendMessageCommand(json.dumps(responseToUAV), general_message["sender_id"])
+                responseCmd = SendMessageCommand(self._codec.encode(responseToUAV), general_message.sender_id)
                 self.provider.send_communication_command(responseCmd)
+                self._metrics.message_sent(responseToUAV, len(responseCmd.message))
 
-                self._log.info(f"Sensor sent coordinates to UAV {general_message['sender_id']}")
+                self._events.emit("coordinates_sent", uav=general_message.sender_id)
 
 
     # Sensor implements handle_telemetry
@@ -144,22 +143,33 @@ class SensorProtocol(IProtocol):
 
     # Sensor implements finish
     def finish(self) -> None:
-        self._log.info(f"Final packet count: {self.total_stored_packets}")
+        self._generate_packets()
+        self._events.emit("final_count", role="sensor", packets=self.total_stored_packets)
+        self._metrics.node_finished(self.provider.current_time())
 
 
 
 ## Implementation for the ground station
 class GroundStationProtocol(IProtocol):
-    _log: logging.Logger
+    _events: NodeEvents
+    _codec: MessageCodec
+    _metrics: MetricsCollector
     total_collected_packets: int
+    ledger: DeliveryLedger
     position: Position
     _id: int
+    scenario: Scenario = None
 
     def initialize(self) -> None:
-        self._log = logging.getLogger()
+        self.scenario = self.scenario or scenario_from_globals()
+        self._codec = get_codec(globals.MESSAGE_CODEC)
+        self._metrics = get_collector()
+        self._metrics.register_node()
         self._id = self.provider.get_id()
+        self._events = NodeEvents(get_event_log(), self.provider, self._id)
         self.total_collected_packets = 0
-        self.position = globals.GROUND_BASE_CORD
+        self.ledger = DeliveryLedger()
+        self.position = self.scenario.groundBase
 
     # GroundStation implements handle_timer
     def handle_timer(self, timer: str) -> None:
@@ -167,24 +177,30 @@ class GroundStationProtocol(IProtocol):
 
     # GroundStation implements handle_packet
     def handle_packet(self, message: str) -> None:
-        general_message: GeneralMessage = json.loads(message)
+        general_message: GeneralMessage = self._codec.decode(message)
+        self._metrics.message_received(general_message)
         # self._log.info(report_message(general_message))
 
-         # GroundStation receives a message from UAV and collects all packets from it
-        if general_message["sender_type"] == GeneralSender.UAV.value:
+         # GroundStation receives a message from UAV, collects the packets it carries and acknowledges the batches it got
+        if general_message.sender_type is GeneralSender.UAV:
             responseToUAV = new_message(
                 packets=self.total_collected_packets,
-                senderType= GeneralSender.GROUND_STATION.value,
+                senderType=GeneralSender.GROUND_STATION,
                 senderID=self._id,
                 senderPos=self.position,
+                batches=general_message.batches,
             )
 
-            responseCmd = SendMessageCommand(json.dumps(responseToUAV), general_message["sender_id"])
+            responseCmd = SendMessageCommand(self._codec.encode(responseToUAV), general_message.sender_id)
             self.provider.send_communication_command(responseCmd)
+            self._metrics.message_sent(responseToUAV, len(responseCmd.message))
 
-            self.total_collected_packets += general_message["total_packets"]
+            # Packets delivered before, by this UAV or another one, are only counted as duplicates
+            newPackets, delaySum = self.ledger.record(general_message.batches, self.provider.current_time())
+            self.total_collected_packets += newPackets
+            self._metrics.packets_collected(newPackets, delaySum)
 
-            self._log.info(f"Sent acknowledgment to UAV {general_message['sender_id']}. Current count {self.total_collected_packets}")
+            self._events.emit("acknowledged", uav=general_message.sender_id, total=self.total_collected_packets)
 
     # GroundStation implements handle_telemetry
     def handle_telemetry(self, telemetry: Telemetry) -> None:
@@ -192,277 +208,547 @@ class GroundStationProtocol(IProtocol):
 
     # GroundStation implements finish
     def finish(self) -> None:
-        self._log.info(f"Final packet count: {self.total_collected_packets}")
+        self._events.emit("final_count", role="ground_station", packets=self.total_collected_packets)
+
+        report = self.ledger.report(self.provider.current_time())
+        for sensor, delivery in report.items():
+            self._events.emit("sensor_delivery", sensor=sensor, received=delivery["received"], missing=delivery["missing"],
+                              freshness=delivery["freshness"])
+        self._metrics.delivery_report(report, self.ledger.duplicates)
+        self._metrics.node_finished(self.provider.current_time())
 
 
 
 ## Implementation for the UAV
 class UAVProtocol(IProtocol):
-    _log: logging.Logger
+    _events: NodeEvents
+    _codec: MessageCodec
+    _metrics: MetricsCollector
     total_received_packets: int
+    packets: PacketBuffer
     waypoints: list
     _mission: MissionMobilityPlugin
+    _missionRunning: bool
     position: Position
-    uavPositions: dict
+    uavPositions: UAVPositionStore
     _id: int
-    _coordHost: int
-    paused: bool
+    _consensus: ConsensusEngine
+    _decisionPolicy: DecisionPolicy
+    _paused: bool
+    _pausedRounds: set
+    _holdingRounds: set
+    _collectingRounds: set
+    _trajectories: TrajectoryCache
+    _random: random.Random
+    _missionOffset: int
     currentWaypointIndex: int
-    proposals = dict
+    plannedSensors: list
+    _routeTail: np.ndarray
+    laps: int
+    _pingInterval: float
+    _heardUAVs: dict
+    _servedSensors: dict
+    _arbitratedSensors: set
+    _lastNeighbours: frozenset
+    _lastPing: tuple
+    scenario: Scenario = None
 
     def initialize(self) -> None:
-        self._log = logging.getLogger()
+        self.scenario = self.scenario or scenario_from_globals()
+        self._codec = get_codec(globals.MESSAGE_CODEC)
+        self._metrics = get_collector()
+        self._metrics.register_node()
         self.currentWaypointIndex = 0
-        self.uavPositions = dict()
-        self.proposals = dict()
+        self._missionOffset = 0
+        self.packets = PacketBuffer(globals.UAV_BUFFER_CAPACITY, get_eviction_policy(globals.UAV_EVICTION_POLICY))
+        # UAVs carrying UAV_NEAR_FULL of their capacity are not chosen to collect from sensors
+        loadLimit = None if globals.UAV_BUFFER_CAPACITY is None else globals.UAV_NEAR_FULL * globals.UAV_BUFFER_CAPACITY
+        self.uavPositions = UAVPositionStore(self.scenario.uavs, loadLimit, globals.RECENT_ASSIGNMENT_WINDOW)
+        self._decisionPolicy = get_decision_policy(globals.DECISION_POLICY)
+        self.laps = 0
+        self._pingInterval = globals.PING_INTERVAL_MIN
+        self._heardUAVs = dict()
+        self._servedSensors = dict()
+        self._arbitratedSensors = set()
+        self._lastNeighbours = None
+        self._lastPing = None
+        self._pausedRounds = set()
+        self._holdingRounds = set()
+        self._collectingRounds = set()
+        # Peers' announced routes, only kept when positions are predicted instead of taken from pings
+        self._trajectories = TrajectoryCache(UAV_SPEED) if globals.TRAJECTORY_PREDICTION else None
         self._id = self.provider.get_id()
-        self._coordHost = get_coordinating_host()
+        self._events = NodeEvents(get_event_log(), self.provider, self._id)
+        # Waypoint offsets are drawn from the UAV's own generator, seeded by the run, so runs can be replayed
+        self._random = node_random(self._id)
+        self._consensus = get_engine(globals.CONSENSUS_ENGINE, self)
         self._mission = MissionMobilityPlugin(self, MissionMobilityConfiguration(
-            speed=100,
+            speed=UAV_SPEED,
         ))
+        self._missionRunning = False
 
         self._start_routine()
 
     # Start new routine
     def _start_routine(self) -> None:
         self._paused = False
+        self._metrics.uav_resumed(self._id, self.provider.current_time())
+        self._pausedRounds.clear()
+        self._holdingRounds.clear()
+        self._collectingRounds.clear()
+        # Sensors are arbitrated again on every lap
+        self._arbitratedSensors.clear()
+        self.packets.clear()
         self.total_received_packets = 0
-        self.position = globals.GROUND_BASE_CORD
-        self.proposals.clear()
+        self.position = self.scenario.groundBase
+        self._consensus.reset()
         self.uavPositions.clear()
-        self.uavPositions.update({self._id : self.position})
+        self.uavPositions.update(self._id, self.position)
 
         # Start new mission if there was none before
         if(self._mission.is_idle):
             self._init_waypoints()
+            self._missionOffset = 0
+            self.laps += 1
             self._mission.start_mission(self.waypoints)
-            self._ping_network()
+            self._missionRunning = True
+            self._restart_ping()
+            self._announce_route(self.waypoints)
 
     # Calculate waypoints for each UAV - with random offesets so they do not overlap
+    # With partitioned routes every UAV flies its own tour over its share of the sensors instead
     def _init_waypoints(self) -> None:
-        baseWaypoints = globals.BASE_WAYPOINTS_COORD_LIST
+        if globals.ROUTE_PLANNER == "partitioned":
+            self._set_waypoints(list(self.scenario.uav_route(self._id)))
+            return
+
+        baseWaypoints = self.scenario.waypoints()
         uavWaypoints = []
         midPoint = len(baseWaypoints)//2
 
         # Iterate over all base waypoint coords (except last, which is return to base)
         for coord in baseWaypoints[:midPoint]:
-            offsetFactor = (self._id * random.randint(3, 7))
+            offsetFactor = (self._id * self._random.randint(3, 7))
             x = coord[0] - offsetFactor
             y = coord[1] - offsetFactor
             z = coord[2]
             uavWaypoints.append((x,y,z))
 
         for coord in baseWaypoints[midPoint:-1]:
-            offsetFactor = (self._id * random.randint(3, 7))
+            offsetFactor = (self._id * self._random.randint(3, 7))
             x = coord[0] + offsetFactor
             y = coord[1] + offsetFactor
             z = coord[2]
             uavWaypoints.append((x,y,z))
 
         uavWaypoints.append(baseWaypoints[-1])
-        self.waypoints = uavWaypoints.copy()
-        self._log.info(f"Waypoints for uav: {self.waypoints}")
-
-    # UAV will ping network (send broadcast) every 1 second using a timer
+        self._set_waypoints(uavWaypoints.copy())
+
+    # Route flown this lap, with the distances and sensors along it precomputed
+    def _set_waypoints(self, waypoints: list) -> None:
+        self.waypoints = waypoints
+        self._events.emit("waypoints", waypoints=self.waypoints)
+
+        # Meters from each waypoint to the end of the route
+        segments = np.linalg.norm(np.diff(np.asarray(self.waypoints, dtype=float), axis=0), axis=1)
+        self._routeTail = np.append(np.cumsum(segments[::-1])[::-1], 0)
+
+        # For each waypoint, the sensors the UAV will be able to reach from it: [ [8, 9], [9], [], ... ]
+        self.plannedSensors = [self.sensors_near(waypoint) for waypoint in self.waypoints]
+        if self._events.enabled("planned_sensors"):
+            self._events.emit("planned_sensors", sensors=sorted(set().union(*self.plannedSensors)))
+
+    # Meters left on the route: to the waypoint being flown to, then along the remaining waypoints
+    # A UAV without a mission (flying back to the ground base) has no route left
+    def route_left(self) -> float:
+        if self._paused:
+            index = self.currentWaypointIndex
+        else:
+            index = None if self._mission.is_idle else self._missionOffset + self._mission.current_waypoint
+
+        if index is None:
+            return 0
+        return float(np.linalg.norm(np.subtract(self.waypoints[index], self.position)) + self._routeTail[index])
+
+    # Sensors within communication range of a position (closest first), looked up in the scenario's spatial index
+    def sensors_near(self, pos: Position) -> list:
+        return self.scenario.sensor_index().query_radius(pos, self.scenario.communicationRange)
+
+    # Sensors the UAV expects to meet from the given waypoint until the end of its route, in route order
+    def sensors_on_route(self, fromWaypoint: int = 0) -> list:
+        upcoming = dict()
+        for sensors in self.plannedSensors[fromWaypoint:]:
+            upcoming.update(dict.fromkeys(sensors))
+        return list(upcoming)
+
+    # Pings right away and restarts the ping timer, so a single ping timer is ever alive for this UAV
+    # Must not be called from the ping timer itself, the timer handler does not allow cancelling the timer being fired
+    def _restart_ping(self) -> None:
+        self.provider.cancel_timer("uav_ping_network")
+        self._ping_network()
+
+    # Seconds until the next ping. In "fixed" mode it is always PING_INTERVAL_MIN. In "adaptive" mode the interval doubles,
+    # up to PING_INTERVAL_MAX, while the neighbours stay about the same, the UAV is in no consensus round and flies as
+    # predicted from its last pings. It is kept short enough for the UAV not to fly past, unheard, a sensor that was not
+    # served recently or the ground station
+    def _next_ping_interval(self) -> float:
+        minimum = globals.PING_INTERVAL_MIN
+        if globals.PING_MODE != "adaptive":
+            return minimum
+
+        now = self.provider.current_time()
+        position = np.asarray(self.position, dtype=float)
+
+        # Neighbours are the UAVs heard within the longest ping interval, so peers backing off are not seen as leaving
+        self._heardUAVs = {uav: heard for uav, heard in self._heardUAVs.items() if now - heard <= globals.PING_INTERVAL_MAX}
+        neighbours = frozenset(self._heardUAVs)
+        churn = len(neighbours ^ self._lastNeighbours) / max(1, len(neighbours | self._lastNeighbours)) if self._lastNeighbours is not None else 1
+
+        changed = bool(self._pausedRounds) or churn > globals.PING_NEIGHBOUR_CHURN
+        velocity = np.zeros(3)
+        if self._lastPing is not None:
+            lastTime, lastPosition, lastVelocity = self._lastPing
+            predicted = lastPosition + lastVelocity * (now - lastTime)
+            changed = changed or np.linalg.norm(position - predicted) > globals.PING_DEVIATION
+            if now > lastTime:
+                velocity = (position - lastPosition) / (now - lastTime)
+
+        self._lastPing = (now, position, velocity)
+        self._lastNeighbours = neighbours
+
+        interval = minimum if changed else min(2 * self._pingInterval, globals.PING_INTERVAL_MAX)
+        while interval > minimum and self._target_ahead(interval):
+            interval = max(minimum, interval / 2)
+
+        self._pingInterval = interval
+        return interval
+
+    # Positions the UAV passes in the next seconds if it keeps flying its route, sampled every half communication range
+    def _route_ahead(self, seconds: float) -> np.ndarray:
+        position = np.asarray(self.position, dtype=float)
+        if self._paused or self._mission.is_idle:
+            return position[np.newaxis, :]
+
+        path = np.vstack((position, np.asarray(self.waypoints[self._missionOffset + self._mission.current_waypoint:], dtype=float)))
+        along = np.concatenate(([0], np.cumsum(np.linalg.norm(np.diff(path, axis=0), axis=1))))
+        distances = np.arange(0, min(UAV_SPEED * seconds, along[-1]), self.scenario.communicationRange / 2)
+        return np.column_stack([np.interp(distances, along, path[:, axis]) for axis in range(3)])
+
+    # Whether, within the next seconds of its route, the UAV gets in range of a sensor not served in the last
+    # SENSOR_SERVED_WINDOW seconds, or of the ground station when carrying packets
+    def _target_ahead(self, seconds: float) -> bool:
+        now = self.provider.current_time()
+        sensorIndex = self.scenario.sensor_index()
+        communicationRange = self.scenario.communicationRange
+
+        for point in self._route_ahead(seconds):
+            for sensor in sensorIndex.query_radius(point, communicationRange):
+                if now - self._servedSensors.get(sensor, -np.inf) > globals.SENSOR_SERVED_WINDOW:
+                    return True
+            if self.packets.packets > 0 and np.linalg.norm(point - self.scenario.groundBase) <= communicationRange:
+                return True
+        return False
+
+    # UAV will ping network (send broadcast) every PING_INTERVAL_MIN seconds or adaptively, using a timer
     def _ping_network(self) -> None:
-        self._log.info(f"Paused: {self._paused}")
-        # If paused for consensus, do nothing else
+        self.provider.schedule_timer("uav_ping_network", self.provider.current_time() + self._next_ping_interval())
+
+        # If paused for consensus, do not advertise the frozen position
         if (self._paused):
             return
 
+        # Carried packets go along with the ping, the ground station keeps them once it is in range
+        # Pings carry the route left in place of the proposed distance, decision policies may weigh it
         messageToAll = new_message(
             packets=self.total_received_packets,
-            senderType= GeneralSender.UAV.value,
+            senderType=GeneralSender.UAV,
             senderID=self._id,
             senderPos=self.position,
+            proposal=(-1, round(self.route_left(), 1)),
+            batches=self.packets.batches(),
         )
 
-        broadcastCmd = BroadcastMessageCommand(json.dumps(messageToAll))
+        broadcastCmd = BroadcastMessageCommand(self._codec.encode(messageToAll))
         self.provider.send_communication_command(broadcastCmd)
+        self._metrics.message_sent(messageToAll, len(broadcastCmd.message))
 
-        self._log.info(f"Pinging network, current packet count {self.total_received_packets}")
-
-        self.provider.schedule_timer("uav_ping_network", self.provider.current_time() + 1)
+        self._events.emit("ping", packets=self.total_received_packets)
 
-    # If UAV is not already paused, coord will send a broadcast so they stop moving until consensus is finished
-    def _pause_network(self) -> None:
+    # Broadcast decision of a sensor's round for all nodes
+    def _broadcast_decision(self, decision: int, sensor: int) -> None:
         messageToAll = new_message(
             packets=self.total_received_packets,
-            senderType= GeneralSender.UAV.value,
+            senderType=GeneralSender.UAV,
             senderID=self._id,
             senderPos=self.position,
-            pause=True,
+            decision=decision,
+            roundID=sensor,
         )
 
-        broadcastCmd = BroadcastMessageCommand(json.dumps(messageToAll))
+        broadcastCmd = BroadcastMessageCommand(self._codec.encode(messageToAll))
         self.provider.send_communication_command(broadcastCmd)
+        self._metrics.message_sent(messageToAll, len(broadcastCmd.message))
 
-    # Broadcast decision for all nodes
-    def _broadcast_decision(self, decision: int) -> None:
-        messageToAll = new_message(
+    # UAV will send its proposed consensus value for a sensor's round to the host coordinating that round
+    def _send_proposal(self, uavProposal: tuple, sensor: int, coordHost: int) -> None:
+        proposalMsg = new_message(
             packets=self.total_received_packets,
-            senderType= GeneralSender.UAV.value,
+            senderType=GeneralSender.UAV,
             senderID=self._id,
             senderPos=self.position,
-            decision=decision,
+            proposal=uavProposal,
+            roundID=sensor,
         )
 
-        broadcastCmd = BroadcastMessageCommand(json.dumps(messageToAll))
-        self.provider.send_communication_command(broadcastCmd)
+        proposalCmd = SendMessageCommand(self._codec.encode(proposalMsg), coordHost)
+        self.provider.send_communication_command(proposalCmd)
+        self._metrics.message_sent(proposalMsg, len(proposalCmd.message))
+    
+    # Broadcasts the waypoints the UAV flies through from its position, a ping that lets peers predict where it is
+    # Sent when the trajectory changes: a mission starts or resumes, the UAV leaves towards a sensor or the ground base
+    def _announce_route(self, route: list) -> None:
+        if self._trajectories is None:
+            return
 
-    # UAV will send broadcast with proposed consensus value to coordinating host
-    def _send_proposal_to_coord_host(self, uavProposal: tuple) -> None:
-        proposalMsg = new_message(
+        messageToAll = new_message(
             packets=self.total_received_packets,
-            senderType= GeneralSender.UAV.value,
+            senderType=GeneralSender.UAV,
             senderID=self._id,
             senderPos=self.position,
-            proposal=uavProposal,
+            proposal=(-1, round(self.route_left(), 1)),
+            route=np.asarray(route, dtype=float),
         )
 
-        proposalCmd = SendMessageCommand(json.dumps(proposalMsg), self._coordHost)
-        self.provider.send_communication_command(proposalCmd)
-    
-    # Organize consensus to see who will reach the sensor
+        broadcastCmd = BroadcastMessageCommand(self._codec.encode(messageToAll))
+        self.provider.send_communication_command(broadcastCmd)
+        self._metrics.message_sent(messageToAll, len(broadcastCmd.message))
+
+    # Writes the positions a decision is scored on to the store: its own one, unless frozen for consensus,
+    # and the predicted one of every peer with a known trajectory, the others keep the position of their last ping
+    def _refresh_positions(self) -> None:
+        if not self._paused or self._trajectories is not None:
+            self.uavPositions.update(self._id, self.position)
+        if self._trajectories is None:
+            return
+
+        uavs, positions = self._trajectories.positions_at(self.provider.current_time())
+        for uav, pos in zip(uavs.tolist(), positions.tolist()):
+            if uav != self._id:
+                self.uavPositions.update(uav, tuple(pos))
+
+    # Whether a message to the UAV is expected to arrive: false only when its predicted position is out of range
+    # Without predictions, UAVs flying one shared route are assumed to be in range of each other. UAVs on partitioned
+    # routes are mostly apart, so a peer is only reached if it was heard within the longest ping interval
+    def _reaches(self, uav: int) -> bool:
+        if self._trajectories is None:
+            if globals.ROUTE_PLANNER != "partitioned":
+                return True
+            heard = self._heardUAVs.get(uav)
+            return heard is not None and self.provider.current_time() - heard <= globals.PING_INTERVAL_MAX
+        predicted = self._trajectories.predict(uav, self.provider.current_time())
+        return predicted is None or np.linalg.norm(predicted - self.position) <= self.scenario.communicationRange
+
+    # Joins a sensor's consensus round. Rounds that hold the UAV stop it, mobility stays paused while any of them is pending
+    # Without trajectory prediction every round holds the UAV so the positions proposals are based on stay valid,
+    # with it only the UAV collecting from the sensor stops
+    def _pause_for_round(self, sensor: int, hold: Optional[bool] = None) -> None:
+        if hold is None:
+            hold = self._trajectories is None
+
+        if hold and not self._holdingRounds:
+            self._paused = True
+            self._metrics.uav_paused(self._id, self.provider.current_time())
+            # Waypoint index is kept relative to the full route, the running mission may be a slice of it
+            if self._mission.is_idle:
+                self.currentWaypointIndex = None
+            else:
+                self.currentWaypointIndex = self._missionOffset + self._mission.current_waypoint
+            self._mission.stop_mission()
+            self._missionRunning = False
+
+            # Stopping the mission does not stop the movement towards the current waypoint, hold the last known position
+            self.provider.send_mobility_command(GotoCoordsMobilityCommand(*self.position))
+
+            self._events.emit("paused", sensor=sensor)
+
+        if hold:
+            self._holdingRounds.add(sensor)
+        self._pausedRounds.add(sensor)
+
+    # Leaves a sensor's consensus round, mobility resumes when no other round holds this UAV
+    def _finish_round(self, sensor: int) -> None:
+        if sensor not in self._pausedRounds:
+            return
+
+        self._pausedRounds.discard(sensor)
+        self._holdingRounds.discard(sensor)
+        self._collectingRounds.discard(sensor)
+        self._consensus.round_finished(sensor)
+
+        if self._paused and not self._holdingRounds:
+            self._paused = False
+            self._metrics.uav_resumed(self._id, self.provider.current_time())
+            self._events.emit("resumed", sensor=sensor)
+            # Only resume if a mission was interrupted, not when paused on the way back to the ground base
+            if self.currentWaypointIndex is not None:
+                self._missionOffset = self.currentWaypointIndex
+                self._mission.start_mission(self.waypoints[self.currentWaypointIndex:])
+                self._missionRunning = True
+                self._announce_route(self.waypoints[self.currentWaypointIndex:])
+
+    # Whether this UAV already took part in a round for the sensor this lap, further contacts with it start no other
+    # Decisions overheard from elsewhere on the route do not count, the sensor is collected again when this UAV passes it
+    def arbitrated(self, sensor: int) -> bool:
+        return globals.CONTACT_DEDUP and sensor in self._arbitratedSensors
+
+    # Organize consensus to see who will reach the sensor, one round per sensor can be in flight at the same time
     def _organize_consensus(self, msg: GeneralMessage) -> None:
+        senderType = msg.sender_type
+        decision = msg.decision
+
         # Received message from sensor
-        if msg["sender_type"] == GeneralSender.SENSOR.value:
+        if senderType is GeneralSender.SENSOR:
+            sensor = msg.sender_id
+
             # A decision was made on what UAV will collect packets from sensor
-            if msg["decision"] >= 0:
+            if decision >= 0:
                 # This UAV was chosen to go to sensor and collect data
-                if msg["decision"] == self._id:
-                    if self._paused:
-                        # Receive packets
-                        self.total_received_packets += msg["total_packets"]
-                        self._log.info(f"Received {msg['total_packets']} packets from sensor {msg['sender_id']}. Current count {self.total_received_packets}.")
-                        self.provider.schedule_timer("wait_until_packets_received", self.provider.current_time() + 3)
-
-            else: # This UAV received coordinates from sensor and will calculate distances from it
-                if (self._coordHost != self._id):
-                    if not self._paused:
-                        uavDistsFromSensor = get_uav_distances_from_sensor(self.uavPositions, msg["sender_pos"])
-                        minUAV = min(uavDistsFromSensor, key=uavDistsFromSensor.get)
-                        minDist = uavDistsFromSensor.get(minUAV)
-                        self._send_proposal_to_coord_host((minUAV, minDist))
-
-                        self._log.info(f"Sent proposal to coordinating host")
-
-                        self._paused = True
-                        self.currentWaypointIndex = self._mission.current_waypoint
-                        self._mission.stop_mission()
-
-                        self._log.info(f"Pausing mobility due to consensus")
-                
+                if decision == self._id:
+                    # Receive packets, the sensor may answer the coordinating host's broadcast before this UAV heard it
+                    self._servedSensors[sensor] = self.provider.current_time()
+                    self._arbitratedSensors.add(sensor)
+                    evicted = self.packets.extend(msg.batches)
+                    self.total_received_packets = self.packets.packets
+                    if evicted:
+                        self._metrics.packets_evicted(self._id, evicted)
+                        self._events.emit("evicted", packets=evicted)
+                    self._events.emit("uav_received", packets=msg.total_packets, sensor=sensor, total=self.total_received_packets)
+
+                    # Go back to the mission
+                    if sensor in self._collectingRounds:
+                        self._finish_round(sensor)
+
+            else: # This UAV received coordinates from sensor and will take part in its round
+                self._consensus.handle_sensor_contact(msg)
 
         # Received message from other UAVs
-        elif msg["sender_type"] == GeneralSender.UAV.value:
-            # Received ping_network
-            if (msg["decision"] < 0) and (msg["proposal"][0] < 0):
-                if not self._paused:
-                    self.uavPositions.update({msg["sender_id"] : msg["sender_pos"]})
-            
-            # Need to make a decision about what UAV will go to sensor based on received proposals
-            elif (msg["decision"] < 0) and (msg["proposal"][0] >= 0):
-                # If uav is coordinating host, enter consensus mode and pause movimentation of network
-                if (self._coordHost == self._id):
-                    if not self._paused:
-                        self._log.info(f"Coordinating host pausing network and starting consensus")
-
-                        self._paused = True
-                        self.currentWaypointIndex = self._mission.current_waypoint
-                        self._mission.stop_mission()
-                        self._pause_network()
-                        self.provider.schedule_timer("coord_waiting_for_proposal", self.provider.current_time() + 3)
-                    # For each received proposal, we have a dict: { proposer_uav_id : (proposed_uav, proposed_dist) }
-                    self.proposals.update({msg["sender_id"] : msg["proposal"]})
-            
-            # UAV stop moving until consensus finishes
-            elif msg["pause_network"]:
-                if msg["sender_id"] == self._coordHost:
-                    if not self._paused:
-                        self._paused = True
-                        self.currentWaypointIndex = self._mission.current_waypoint
-                        self._mission.stop_mission()
-
-                        self._log.info(f"Pausing mobility due to consensus")
-            
-            # After consensus finishes
-            elif (msg["decision"] >= 0):
-                # If UAV was waiting for consensus
-                if self._paused:
-                    # If this UAV was the decision
-                    if (msg["decision"] == self._id):
-                        self._broadcast_decision(msg["decision"])
-                    else:
-                        # If the decision was not the coordinating host
-                        if (msg["decision"] != self._coordHost):
-                            # Resume mobility
-                            self._paused = False
-                            lastWaypoint = self.currentWaypointIndex
-                            self._mission.start_mission(self.waypoints[lastWaypoint:])
-                        else:
-                            self.provider.schedule_timer("wait_until_packets_received", self.provider.current_time() + 3)
-
-                            
+        elif senderType is GeneralSender.UAV:
+            proposedUAV = msg.proposal[0]
+
+            # Received ping_network, the advertised load is kept even while paused
+            if (decision < 0) and (proposedUAV < 0):
+                self._heardUAVs[msg.sender_id] = self.provider.current_time()
+                self.uavPositions.update_load(msg.sender_id, msg.total_packets)
+                self.uavPositions.update_route(msg.sender_id, msg.proposal[1])
+                # Delta encoded pings have no position until the sender's keyframe is heard
+                if not self._paused and msg.sender_pos is not None:
+                    self.uavPositions.update(msg.sender_id, msg.sender_pos)
+                if self._trajectories is not None and msg.sender_pos is not None:
+                    self._track_trajectory(msg)
+
+            # Proposal for a sensor's round, kept by the UAV coordinating it
+            elif (decision < 0) and (proposedUAV >= 0):
+                self._consensus.handle_proposal(msg)
+
+            # After consensus for a sensor finishes
+            elif (decision >= 0):
+                self._servedSensors[msg.round_id] = self.provider.current_time()
+                self._consensus.handle_decision(msg)
+
+    # Keeps the trajectory a peer announced, or drops it when the peer pings from too far from where it was predicted,
+    # it may have stopped or changed course while this UAV was out of range
+    def _track_trajectory(self, msg: GeneralMessage) -> None:
+        now = self.provider.current_time()
+        if len(msg.route):
+            self._trajectories.update(msg.sender_id, now, msg.sender_pos, msg.route)
+            return
+
+        predicted = self._trajectories.predict(msg.sender_id, now)
+        if predicted is not None and np.linalg.norm(predicted - msg.sender_pos) > globals.PING_DEVIATION:
+            self._trajectories.forget(msg.sender_id)
+
+    # Chosen UAV leaves the swarm towards the sensor and asks for its packets until they arrive
+    def _start_collecting(self, sensor: int) -> None:
+        if sensor in self._collectingRounds:
+            return
+
+        self._pause_for_round(sensor, hold=True)
+        self._collectingRounds.add(sensor)
+
+        sensorPos = self.scenario.sensor_position(sensor)
+        target = (sensorPos[0], sensorPos[1], self.position[2])
+        self.provider.send_mobility_command(GotoCoordsMobilityCommand(*target))
+        self._announce_route([target])
+
+        self._request_packets(sensor, 0)
+
+    # Broadcasts the decision so the sensor answers with its packets, retried every second while the UAV gets closer
+    def _request_packets(self, sensor: int, attempt: int) -> None:
+        if sensor not in self._collectingRounds:
+            return
+
+        if attempt >= COLLECTION_ATTEMPTS:
+            self._events.emit("gave_up", sensor=sensor)
+            # Its packets are still there, the next UAV to hear the sensor may start a round for it
+            self._arbitratedSensors.discard(sensor)
+            self._finish_round(sensor)
+            return
+
+        self._broadcast_decision(self._id, sensor)
+        self.provider.schedule_timer(f"collect_from_sensor:{sensor}:{attempt + 1}", self.provider.current_time() + 1)
 
     # UAV implements handle_timer
     def handle_timer(self, timer: str) -> None:
+        timer, _, args = timer.partition(":")
+
         if (timer == "uav_ping_network"):
             self._ping_network()
         elif (timer == "restart_mission"):
-            self._log.info(f"Restarting mission for uav")
+            self._events.emit("restart")
             self._start_routine()
-        elif (timer == "wait_until_packets_received"):
-            # Resume mobility
-            self._paused = False
-            lastWaypoint = self.currentWaypointIndex
-            self._mission.start_mission(self.waypoints[lastWaypoint:])
-        elif (timer == "coord_waiting_for_proposal"):
-            # Coord host calculates final decision
-            self._log.info(f"Proposals for consensus: {self.proposals}")
-            finalDecision = make_decision(self.proposals)
-            self._log.info(f"Decision for consensus: {finalDecision}")
-
-            # Broadcast decision
-            self._broadcast_decision(finalDecision[0])
-            self.proposals.clear()
-
-            # Resume mobility
-            if (finalDecision[0] != self._id):
-                self._paused = False
-                lastWaypoint = self.currentWaypointIndex
-                self._mission.start_mission(self.waypoints[lastWaypoint:])
+        elif (timer == "collect_from_sensor"):
+            sensor, attempt = args.split(":")
+            self._request_packets(int(sensor), int(attempt))
+        else:
+            self._consensus.handle_timer(timer, args)
 
 
     # UAV implements handle_packet
     def handle_packet(self, message: str) -> None:
-        general_message: GeneralMessage = json.loads(message)
+        general_message: GeneralMessage = self._codec.decode(message)
+        self._metrics.message_received(general_message)
         # self._log.info(report_message(general_message))
 
-        if general_message["sender_type"] == GeneralSender.GROUND_STATION.value:
-            self.total_received_packets = 0
+        # Ground station acknowledged part of the carried packets
+        if general_message.sender_type is GeneralSender.GROUND_STATION:
+            self.packets.discard(general_message.batches)
+            self.total_received_packets = self.packets.packets
         else:
             self._organize_consensus(general_message)
             
+    # Reached the end of the mission at the restart coordinate: move back to the ground base and start a timer for the new one
+    def _end_lap(self) -> None:
+        self._restart_ping()
+
+        self.provider.send_mobility_command(GotoCoordsMobilityCommand(*self.scenario.groundBase))
+        self._announce_route([tuple(self.scenario.groundBase)])
+        self.provider.schedule_timer("restart_mission", self.provider.current_time() + 5)
+
     # UAV implements handle_telemetry
+    # Only UAVs get telemetry (see create_builder), and its only per tick work here is keeping the position
     def handle_telemetry(self, telemetry: Telemetry) -> None:
-        if not self._paused:
+        # Position is frozen while paused for consensus, unless peers predict it, then they expect the real one
+        if not self._paused or self._trajectories is not None:
             self.position = telemetry.current_position
-            self.uavPositions.update({self._id : self.position})
-            # self._log.info(f"Dict for uav: {self.uavPositions}")
 
-        # If reached end of mission at RESTART_COORD, move back to GROUND_BASE_COORD and start a timer for new mission
-        if(telemetry.current_position == globals.RESTART_COORD):
-            self._ping_network()
-            
-            mobilityCmd = GotoCoordsMobilityCommand(
-                x=globals.GROUND_BASE_CORD[0],
-                y=globals.GROUND_BASE_CORD[0],
-                z=globals.GROUND_BASE_CORD[0],
-            )
-            self.provider.send_mobility_command(mobilityCmd)
-            self.provider.schedule_timer("restart_mission", self.provider.current_time() + 5)
+        # The mission plugin handles telemetry first and stops the mission after its last waypoint, a mission this UAV
+        # did not stop itself ended the lap. This happens once per lap, within the plugin's tolerance of the restart
+        # coordinate, where comparing positions for equality could miss it or match it on several ticks
+        if self._missionRunning and self._mission.is_idle:
+            self._missionRunning = False
+            self._end_lap()
 
     # UAV implements finish
     def finish(self) -> None:
-        self._log.info(f"Final packet count: {self.total_received_packets}")
\ No newline at end of file
+        self._events.emit("final_count", role="uav", packets=self.total_received_packets)
+        self._metrics.node_finished(self.provider.current_time())
\ No newline at end of file
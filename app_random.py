@@ -0,0 +1,34 @@
+import random
+from typing import Optional
+
+import numpy as np
+
+import globals
+
+_runSeed = None
+
+# Starts a run with the given seed, SIMULATION_SEED when none is given, or a freshly drawn one when neither is set
+# Returns the seed so it can be recorded with the results and the run replayed
+def start_run(seed: Optional[int] = None) -> int:
+    global _runSeed
+    if seed is None:
+        seed = globals.SIMULATION_SEED
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    _runSeed = seed
+    return _runSeed
+
+# Seed of the current run, a run that was not started explicitly gets one on first use
+def run_seed() -> int:
+    if _runSeed is None:
+        start_run()
+    return _runSeed
+
+# Generator owned by a single node, derived from the run seed and the node id
+# A node's draws do not depend on the order nodes initialize in or on how many draws the other nodes make
+def node_random(nodeID: int) -> random.Random:
+    return random.Random(f"{run_seed()}:{nodeID}")
+
+# numpy generator of a single node, for draws the standard library does not have (Poisson counts)
+def node_generator(nodeID: int) -> np.random.Generator:
+    return np.random.default_rng([run_seed(), nodeID])
@@ -0,0 +1,294 @@
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+import numpy as np
+
+from gradysim.protocol.position import Position
+from app_spatial import SpatialGrid
+
+# Tours up to this many points get a full distance matrix (float32, 16 MiB at the limit), bigger ones compute distances by rows
+MATRIX_LIMIT = 2048
+# Distance matrices kept for point sets planned again (same scenario, another UAV or lap)
+MATRIX_CACHE_SIZE = 8
+# Closest points considered for every 2-opt and Or-opt move, a tour is only improved locally
+NEIGHBOURS = 10
+# Longest run of consecutive points Or-opt moves elsewhere in the tour
+OR_OPT_SEGMENT = 3
+# Times every point of a tour may be looked at by the local search, on average, when not given
+IMPROVEMENT_PASSES = 10
+
+_matrices = OrderedDict()
+
+## Distances - on the x/y plane, UAVs fly their whole route at the same altitude
+
+# Full matrix of a point set, cached by the points so planning the same sensors again does not recompute it
+def distance_matrix(points: np.ndarray) -> np.ndarray:
+    key = points.tobytes()
+    if key in _matrices:
+        _matrices.move_to_end(key)
+        return _matrices[key]
+
+    xy = points[:, :2].astype(np.float32)
+    matrix = np.sqrt(((xy[:, None, :] - xy[None, :, :]) ** 2).sum(axis=2))
+    _matrices[key] = matrix
+    if len(_matrices) > MATRIX_CACHE_SIZE:
+        _matrices.popitem(last=False)
+    return matrix
+
+# Distances from the given rows to every point, from the cached matrix or computed when the set is too big for one
+def _distance_rows(points: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    if len(points) <= MATRIX_LIMIT:
+        return distance_matrix(points)[rows]
+    xy = points[:, :2]
+    squared = (xy[rows] ** 2).sum(axis=1)[:, None] + (xy ** 2).sum(axis=1)[None, :] - 2 * xy[rows] @ xy.T
+    return np.sqrt(np.maximum(squared, 0))
+
+# Closest k points of every point, closest first
+# Small sets read them off the distance matrix, large ones off a grid sized to hold about k points per cell
+def neighbour_lists(points: np.ndarray, k: int = NEIGHBOURS) -> list:
+    count = len(points)
+    k = min(k, count - 1)
+    if k <= 0:
+        return [[] for _ in range(count)]
+
+    if count > MATRIX_LIMIT:
+        span = np.ptp(points[:, :2], axis=0).clip(min=1)
+        grid = SpatialGrid(points, cellSize=float(np.sqrt(span[0] * span[1] * k / count)))
+        neighbours = grid.nearest_neighbours(k)
+        return [neighbours[point] for point in range(count)]
+
+    distances = distance_matrix(points).copy()
+    np.fill_diagonal(distances, np.inf)
+    closest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, closest, axis=1).argsort(axis=1, kind="stable")
+    return np.take_along_axis(closest, order, axis=1).tolist()
+
+## Tour construction and improvement
+## A tour is a list of point indexes starting at the depot (index 0), closed back to it
+
+# Greedy tour from the depot, always to the closest point not visited yet
+# The neighbour lists answer most steps, a full row of distances is only computed when every listed neighbour was visited
+def nearest_neighbour_tour(points: np.ndarray, neighbours: Optional[list] = None) -> list:
+    count = len(points)
+    neighbours = neighbours if neighbours is not None else neighbour_lists(points)
+    remaining = np.ones(count, dtype=bool)
+    remaining[0] = False
+    tour = [0]
+
+    for _ in range(count - 1):
+        current = tour[-1]
+        closest = next((point for point in neighbours[current] if remaining[point]), None)
+        if closest is None:
+            distances = _distance_rows(points, np.array([current]))[0]
+            distances[~remaining] = np.inf
+            closest = int(np.argmin(distances))
+        remaining[closest] = False
+        tour.append(closest)
+    return tour
+
+def tour_length(points: np.ndarray, tour: list) -> float:
+    ordered = points[tour + tour[:1], :2]
+    return float(np.linalg.norm(np.diff(ordered, axis=0), axis=1).sum())
+
+## Local search over a tour with neighbour lists: 2-opt reverses a stretch of the tour, Or-opt moves a short run of
+## points elsewhere. Both only try reconnecting a point to its closest neighbours, so a pass costs O(n * NEIGHBOURS)
+## plus the moves that are actually made
+class TourImprover:
+    def __init__(self, points: np.ndarray, tour: list, neighbours: Optional[list] = None):
+        self._x = points[:, 0].tolist()
+        self._y = points[:, 1].tolist()
+        self.tour = list(tour)
+        self._neighbours = neighbours if neighbours is not None else neighbour_lists(points)
+        self._reindex()
+
+    # Positions of the points in the tour, only the stretch between low and high when given
+    def _reindex(self, low: int = 0, high: Optional[int] = None) -> None:
+        if high is None:
+            self._position = [0] * len(self.tour)
+            high = len(self.tour) - 1
+        for index in range(low, high + 1):
+            self._position[self.tour[index]] = index
+
+    def _distance(self, a: int, b: int) -> float:
+        return math.hypot(self._x[a] - self._x[b], self._y[a] - self._y[b])
+
+    def _next(self, index: int) -> int:
+        return self.tour[(index + 1) % len(self.tour)]
+
+    def _previous(self, index: int) -> int:
+        return self.tour[index - 1]
+
+    # Removes the edges leaving positions i and j and reconnects the tour by reversing the stretch between them
+    # The depot stays first, only positions after the first removed edge move
+    def _reverse(self, i: int, j: int) -> None:
+        tour = self.tour
+        low, high = (i, j) if i < j else (j, i)
+        tour[low + 1:high + 1] = tour[low + 1:high + 1][::-1]
+        self._reindex(low + 1, high)
+
+    # 2-opt from a: an edge of a is swapped for an edge to a close point c, on either side of a
+    # Returns the points whose edges changed, empty when no move was made
+    def _two_opt(self, a: int) -> list:
+        count = len(self.tour)
+        i = self._position[a]
+
+        for forward in (True, False):
+            b = self._next(i) if forward else self._previous(i)
+            ab = self._distance(a, b)
+
+            for c in self._neighbours[a]:
+                ac = self._distance(a, c)
+                if ac >= ab:
+                    break
+                j = self._position[c]
+                d = self._next(j) if forward else self._previous(j)
+                if c == b or d == a:
+                    continue
+
+                # Forward removes (a, b) and (c, d) for (a, c) and (b, d), backward (b, a) and (d, c) for (c, a) and (d, b)
+                if ab + self._distance(c, d) - ac - self._distance(b, d) > 1e-9:
+                    if forward:
+                        self._reverse(i, j)
+                    else:
+                        self._reverse((i - 1) % count, (j - 1) % count)
+                    return [a, b, c, d]
+        return []
+
+    # Moves the run of up to OR_OPT_SEGMENT points starting at a between a close point and its successor,
+    # reversed if that is shorter. Returns the points whose edges changed, empty when no move was made
+    def _or_opt(self, a: int) -> list:
+        tour = self.tour
+        count = len(tour)
+        start = self._position[a]
+        if start == 0:
+            return []
+
+        for length in range(1, OR_OPT_SEGMENT + 1):
+            end = start + length - 1
+            if end >= count:
+                break
+            first, last = tour[start], tour[end]
+            previous, following = tour[start - 1], self._next(end)
+            removed = self._distance(previous, first) + self._distance(last, following) - self._distance(previous, following)
+            segment = tour[start:end + 1]
+
+            # Like in 2-opt, only points closer to an end of the run than what removing it saves can take it
+            for end_, c in [(first, c) for c in self._neighbours[first]] + [(last, c) for c in self._neighbours[last]]:
+                if self._distance(end_, c) >= removed:
+                    continue
+                if c in segment:
+                    continue
+                j = self._position[c]
+                d = self._next(j)
+                if d in segment or c == previous:
+                    continue
+
+                cd = self._distance(c, d)
+                forward = self._distance(c, first) + self._distance(last, d) - cd
+                backward = self._distance(c, last) + self._distance(first, d) - cd
+                if removed - min(forward, backward) > 1e-9:
+                    moved = segment[::-1] if backward < forward else segment
+                    rest = tour[:start] + tour[end + 1:]
+                    insert = (j if j < start else j - length) + 1
+                    self.tour = rest[:insert] + moved + rest[insert:]
+                    self._reindex(min(start, insert), max(end, insert + length - 1))
+                    return [first, last, previous, following, c, d]
+        return []
+
+    # Passes over the points until no move is found, or the points were looked at passes times over on average
+    # Only points next to a change are looked at again (don't look bits), the others were already improved
+    # The budget counts points, not time, so a tour only depends on its points. Tours usually converge in under two
+    # passes. The time limit is only a safety net: a tour cut short by it depends on the machine, so it is logged
+    def improve(self, passes: int, timeLimit: Optional[float] = None) -> list:
+        deadline = time.perf_counter() + timeLimit if timeLimit is not None else math.inf
+        active = deque(range(len(self.tour)))
+        queued = [True] * len(self.tour)
+        budget = passes * len(self.tour)
+
+        while active and budget > 0:
+            if time.perf_counter() >= deadline:
+                logging.getLogger(__name__).warning(f"Route planning stopped by its {timeLimit:.2f} s time limit with "
+                                                    f"{len(active)} of {len(self.tour)} points left to improve")
+                break
+            budget -= 1
+            point = active.popleft()
+            queued[point] = False
+
+            for changed in self._two_opt(point) or self._or_opt(point):
+                if not queued[changed]:
+                    queued[changed] = True
+                    active.append(changed)
+        return self.tour
+
+# Short closed tour over the points, starting and ending at the depot: nearest neighbour, then 2-opt and Or-opt
+# Returns the points in tour order, without the depot
+def plan_tour(points: np.ndarray, depot: Position, timeLimit: float = 2, passes: int = IMPROVEMENT_PASSES) -> np.ndarray:
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if len(points) <= 1:
+        return points
+
+    nodes = np.vstack((np.asarray(depot, dtype=float), points))
+    neighbours = neighbour_lists(nodes)
+    tour = nearest_neighbour_tour(nodes, neighbours)
+    tour = TourImprover(nodes, tour, neighbours).improve(passes, timeLimit)
+    return points[np.asarray(tour[1:]) - 1]
+
+## Waypoints - what the UAVs actually fly
+
+# Sensors closer than radius to a kept one share its waypoint, so dense layouts do not give every sensor its own
+def cover_points(points: np.ndarray, radius: float) -> np.ndarray:
+    if len(points) == 0 or radius <= 0:
+        return points
+
+    grid = SpatialGrid(points, cellSize=max(radius, 1))
+    covered = np.zeros(len(points), dtype=bool)
+    kept = []
+    for index in range(len(points)):
+        if covered[index]:
+            continue
+        kept.append(index)
+        covered[grid.query_radius(points[index], radius)] = True
+    return points[kept]
+
+# Waypoints at the altitude of the restart coordinate, closed like BASE_WAYPOINTS_COORD_LIST:
+# the tour, back to its first waypoint, then the restart coordinate
+def tour_waypoints(ordered: np.ndarray, restart: Position) -> list:
+    if not len(ordered):
+        return [tuple(restart)]
+    altitude = float(restart[2])
+    waypoints = [(float(x), float(y), altitude) for x, y in ordered[:, :2].tolist()]
+    return waypoints + [waypoints[0], tuple(restart)]
+
+# Single route over every sensor, flown by the whole swarm
+def plan_route(sensors: np.ndarray, groundBase: Position, restart: Position, communicationRange: float,
+               timeLimit: float = 2, passes: int = IMPROVEMENT_PASSES) -> list:
+    points = cover_points(np.asarray(sensors, dtype=float).reshape(-1, 3), communicationRange / 2)
+    return tour_waypoints(plan_tour(points, groundBase, timeLimit, passes), restart)
+
+## Multi-vehicle partitioning - sensors are split in angular sectors around the ground base, one per UAV
+## Sectors hold the same number of waypoints and start at the widest angular gap, so a cluster is not cut in two
+def partition(points: np.ndarray, depot: Position, groups: int) -> list:
+    if not len(points):
+        return [points[:0] for _ in range(groups)]
+
+    angles = np.arctan2(points[:, 1] - depot[1], points[:, 0] - depot[0])
+    order = np.argsort(angles, kind="stable")
+    sortedAngles = angles[order]
+    gaps = np.diff(np.concatenate((sortedAngles, sortedAngles[:1] + 2 * np.pi)))
+    order = np.roll(order, -(int(np.argmax(gaps)) + 1))
+    return [points[chunk] for chunk in np.array_split(order, groups)]
+
+# One route per UAV over its own sector, planned with the time limit shared between them
+def plan_partitioned_routes(sensors: np.ndarray, uavs: int, groundBase: Position, restart: Position,
+                            communicationRange: float, timeLimit: float = 2, passes: int = IMPROVEMENT_PASSES) -> list:
+    points = cover_points(np.asarray(sensors, dtype=float).reshape(-1, 3), communicationRange / 2)
+    return [tour_waypoints(plan_tour(sector, groundBase, timeLimit / max(uavs, 1), passes), restart)
+            for sector in partition(points, groundBase, uavs)]
+
+# Length of a route flown from the ground base, for comparing plans
+def route_length(waypoints: list, groundBase: Optional[Position] = None) -> float:
+    points = np.asarray(([groundBase] if groundBase is not None else []) + list(waypoints), dtype=float)
+    return float(np.linalg.norm(np.diff(points, axis=0), axis=1).sum())
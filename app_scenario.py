@@ -0,0 +1,267 @@
+import json
+import math
+import os
+from dataclasses import dataclass, field, replace
+from typing import Iterator, Optional
+
+import numpy as np
+
+from gradysim.protocol.position import Position
+from app_spatial import SpatialGrid
+from app_routing import plan_route, plan_partitioned_routes
+
+import globals
+
+# Rows generated at a time by the sensor layouts, positions are only computed for the chunks that are used
+CHUNK_SIZE = 4096
+
+## Sensor layouts - where the sensors of a scenario are, generated on demand as numpy chunks
+## A layout knows how many sensors it has without generating them, positions are produced by chunk when first needed
+class SensorLayout:
+    name: str
+    count: int
+    _chunks: dict
+
+    def __init__(self, count: int):
+        self.count = count
+        self._chunks = dict()
+
+    def __len__(self) -> int:
+        return self.count
+
+    # Rows start..stop of the layout, one (x, y, z) row per sensor
+    def _generate(self, start: int, stop: int) -> np.ndarray:
+        raise NotImplementedError
+
+    # Chunk of CHUNK_SIZE rows, cached so positions asked again are not generated twice
+    def _chunk(self, index: int) -> np.ndarray:
+        if index not in self._chunks:
+            self._chunks[index] = self._generate(index * CHUNK_SIZE, min(self.count, (index + 1) * CHUNK_SIZE))
+        return self._chunks[index]
+
+    # Position of the sensor at index (0 based), only its chunk is generated
+    def position(self, index: int) -> Position:
+        if not 0 <= index < self.count:
+            raise IndexError(f"Sensor {index} out of range, layout has {self.count} sensors")
+        return tuple(self._chunk(index // CHUNK_SIZE)[index % CHUNK_SIZE].tolist())
+
+    # Streams the layout chunk by chunk: (first index, rows)
+    def chunks(self) -> Iterator[tuple]:
+        for index in range(math.ceil(self.count / CHUNK_SIZE)):
+            yield index * CHUNK_SIZE, self._chunk(index)
+
+    # Every position as one array, for the spatial index or a tour
+    def coords(self) -> np.ndarray:
+        if not self.count:
+            return np.zeros((0, 3))
+        return np.vstack([rows for _, rows in self.chunks()])
+
+# Sensors listed one by one, the layout of globals.py and of scenario files with explicit coordinates
+class ListLayout(SensorLayout):
+    name = "list"
+
+    def __init__(self, positions):
+        self._positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        super().__init__(len(self._positions))
+
+    def _generate(self, start: int, stop: int) -> np.ndarray:
+        return self._positions[start:stop]
+
+# Sensors evenly spaced on a circle around center
+class RingLayout(SensorLayout):
+    name = "ring"
+
+    def __init__(self, count: int, radius: float = 250, center: Position = (0, 0, 0)):
+        super().__init__(count)
+        self.radius = radius
+        self.center = center
+
+    def _generate(self, start: int, stop: int) -> np.ndarray:
+        angles = 2 * np.pi * np.arange(start, stop) / self.count
+        return np.column_stack((self.center[0] + self.radius * np.cos(angles),
+                                self.center[1] + self.radius * np.sin(angles),
+                                np.full(len(angles), float(self.center[2]))))
+
+# Sensors on a square grid (or columns wide) spacing apart, centered on center
+class GridLayout(SensorLayout):
+    name = "grid"
+
+    def __init__(self, count: int, spacing: float = 100, columns: Optional[int] = None, center: Position = (0, 0, 0)):
+        super().__init__(count)
+        self.spacing = spacing
+        self.columns = columns or max(1, math.ceil(math.sqrt(count)))
+        self.center = center
+
+    def _generate(self, start: int, stop: int) -> np.ndarray:
+        indexes = np.arange(start, stop)
+        rows = math.ceil(self.count / self.columns)
+        x = (indexes % self.columns - (self.columns - 1) / 2) * self.spacing + self.center[0]
+        y = (indexes // self.columns - (rows - 1) / 2) * self.spacing + self.center[1]
+        return np.column_stack((x, y, np.full(len(indexes), float(self.center[2]))))
+
+# Sensors drawn uniformly over an area, every chunk has its own generator so any chunk can be produced alone
+class RandomLayout(SensorLayout):
+    name = "random"
+
+    def __init__(self, count: int, x_range: tuple = (-300, 300), y_range: tuple = (-300, 300), z: float = 0, seed: int = 0):
+        super().__init__(count)
+        self.xRange = tuple(x_range)
+        self.yRange = tuple(y_range)
+        self.z = z
+        self.seed = seed
+
+    def _generate(self, start: int, stop: int) -> np.ndarray:
+        rng = np.random.default_rng([self.seed, start // CHUNK_SIZE])
+        size = stop - start
+        return np.column_stack((rng.uniform(*self.xRange, size), rng.uniform(*self.yRange, size), np.full(size, float(self.z))))
+
+SENSOR_LAYOUTS = {
+    ListLayout.name: ListLayout,
+    RingLayout.name: RingLayout,
+    GridLayout.name: GridLayout,
+    RandomLayout.name: RandomLayout,
+}
+
+def get_sensor_layout(name: str, **params) -> SensorLayout:
+    if name not in SENSOR_LAYOUTS:
+        raise ValueError(f"Unknown sensor layout '{name}', available: {', '.join(SENSOR_LAYOUTS)}")
+    return SENSOR_LAYOUTS[name](**params)
+
+## Scenario - the topology a simulation runs on, handed to protocols instead of being read from globals
+@dataclass
+class Scenario:
+    uavs: int
+    sensors: SensorLayout
+    communicationRange: float = 70
+    communicationDelay: float = 0
+    groundBase: Position = (0, 0, 0)
+    restart: Position = (0, 0, 10)
+    duration: float = 60
+    xRange: tuple = (-300, 300)
+    yRange: tuple = (-300, 300)
+    zRange: tuple = (0, 50)
+    # Base waypoints of the UAV route, planned over the sensors when not given
+    baseWaypoints: Optional[list] = None
+    _sensorIndex: Optional[SpatialGrid] = field(default=None, init=False, repr=False, compare=False)
+    _routes: Optional[list] = field(default=None, init=False, repr=False, compare=False)
+    _plannedWaypoints: Optional[list] = field(default=None, init=False, repr=False, compare=False)
+
+    # Node ids: ground station 0, UAVs 1..uavs, then the sensors
+    def uav_ids(self) -> list:
+        return list(range(1, self.uavs + 1))
+
+    def first_sensor_id(self) -> int:
+        return self.uavs + 1
+
+    def sensor_position(self, sensorID: int) -> Position:
+        return self.sensors.position(sensorID - self.first_sensor_id())
+
+    # Route shared by every UAV
+    def waypoints(self) -> list:
+        if self.baseWaypoints is not None:
+            return self.baseWaypoints
+        if self._plannedWaypoints is None:
+            self._plannedWaypoints = plan_route(self.sensors.coords(), self.groundBase, self.restart, self.communicationRange,
+                                                globals.ROUTE_PLANNING_TIME, globals.ROUTE_PLANNING_PASSES)
+        return self._plannedWaypoints
+
+    # Route of a single UAV when the sensors are split between them, planned for every UAV the first time one asks
+    def uav_route(self, uav: int) -> list:
+        if self._routes is None:
+            self._routes = plan_partitioned_routes(self.sensors.coords(), self.uavs, self.groundBase, self.restart,
+                                                   self.communicationRange, globals.ROUTE_PLANNING_TIME,
+                                                   globals.ROUTE_PLANNING_PASSES)
+        return self._routes[uav - 1]
+
+    # Grid over the sensors indexed by node id, built the first time a UAV looks for sensors
+    def sensor_index(self) -> SpatialGrid:
+        if self._sensorIndex is None:
+            firstSensorID = self.first_sensor_id()
+            self._sensorIndex = SpatialGrid(self.sensors.coords(), ids=range(firstSensorID, firstSensorID + len(self.sensors)),
+                                            cellSize=self.communicationRange)
+        return self._sensorIndex
+
+    # Copy with some fields changed, the cached index and planned routes are rebuilt for the copy, given waypoints are kept
+    def with_changes(self, **changes) -> "Scenario":
+        return replace(self, **changes)
+
+# Scenario described by globals.py, read when called so values changed at runtime (sweeps, headless options) are used
+def scenario_from_globals() -> Scenario:
+    return Scenario(
+        uavs=globals.MAX_NODES,
+        sensors=ListLayout(globals.SENSORS_COORD_LIST),
+        communicationRange=globals.COMMUNICATION_MEDIUM_RANGE,
+        communicationDelay=globals.COMMUNICATION_MEDIUM_DELAY,
+        groundBase=globals.GROUND_BASE_CORD,
+        restart=globals.RESTART_COORD,
+        duration=globals.SIMULATION_DURATION,
+        xRange=globals.SIMULATION_RANGE_X,
+        yRange=globals.SIMULATION_RANGE_Y,
+        zRange=globals.SIMULATION_RANGE_Z,
+        baseWaypoints=list(globals.BASE_WAYPOINTS_COORD_LIST),
+    )
+
+## Scenario files
+## { "uavs": 6, "communication_range": 70, "sensors": { "layout": "ring", "count": 100, "radius": 250 }, ... }
+## sensors may also be a list of [x, y, z], waypoints is optional, missing fields take the values of globals.py
+
+def scenario_from_dict(data: dict) -> Scenario:
+    defaults = scenario_from_globals()
+
+    sensors = data.get("sensors")
+    if sensors is None:
+        layout = defaults.sensors
+    elif isinstance(sensors, dict):
+        params = dict(sensors)
+        layout = get_sensor_layout(params.pop("layout"), **params)
+    else:
+        layout = ListLayout(sensors)
+
+    waypoints = data.get("waypoints")
+    if waypoints is None:
+        # The default route only fits the default sensors
+        waypoints = defaults.baseWaypoints if sensors is None else None
+    else:
+        waypoints = [tuple(waypoint) for waypoint in waypoints]
+
+    return Scenario(
+        uavs=data.get("uavs", defaults.uavs),
+        sensors=layout,
+        communicationRange=data.get("communication_range", defaults.communicationRange),
+        communicationDelay=data.get("communication_delay", defaults.communicationDelay),
+        groundBase=tuple(data.get("ground_base", defaults.groundBase)),
+        restart=tuple(data.get("restart", defaults.restart)),
+        duration=data.get("duration", defaults.duration),
+        xRange=tuple(data.get("x_range", defaults.xRange)),
+        yRange=tuple(data.get("y_range", defaults.yRange)),
+        zRange=tuple(data.get("z_range", defaults.zRange)),
+        baseWaypoints=waypoints,
+    )
+
+# Loads a .json, .toml or .yaml/.yml scenario file (YAML requires PyYAML, TOML tomli before Python 3.11)
+def load_scenario(path: str) -> Scenario:
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".json":
+        with open(path) as file:
+            data = json.load(file)
+    elif extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        with open(path, "rb") as file:
+            data = tomllib.load(file)
+    elif extension in (".yaml", ".yml"):
+        import yaml
+        with open(path) as file:
+            data = yaml.safe_load(file)
+    else:
+        raise ValueError(f"Unknown scenario format '{extension}', use .json, .toml, .yaml or .yml")
+
+    return scenario_from_dict(data)
+
+## Protocols get their scenario as a class attribute: gradysim instantiates them without arguments,
+## so every simulation builds its nodes from subclasses bound to its own scenario
+def bind_scenario(protocol: type, scenario: Scenario) -> type:
+    return type(protocol.__name__, (protocol,), {"scenario": scenario})
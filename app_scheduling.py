@@ -0,0 +1,288 @@
+import heapq
+import math
+from collections import defaultdict, deque
+from importlib.metadata import version
+from typing import Optional
+
+from gradysim.protocol.interface import IProtocol
+from gradysim.protocol.messages.communication import CommunicationCommand, CommunicationCommandType
+from gradysim.protocol.messages.telemetry import Telemetry
+from gradysim.protocol.position import Position
+from gradysim.simulator.event import EventLoop
+from gradysim.simulator.handler.communication import (CommunicationHandler, CommunicationMedium, CommunicationException,
+                                                      can_transmit)
+from gradysim.simulator.handler.mobility import MobilityHandler
+from gradysim.simulator.handler.timer import TimerHandler, TimerException
+from gradysim.simulator.node import Node
+
+# The ordered handlers extend gradysim's handlers through internals that are not part of its interface (pending timers,
+# registered endpoints, the mobility update), as they are in this release, the one requirements.txt pins
+GRADYSIM_VERSION = "0.8.2"
+if version("gradysim") != GRADYSIM_VERSION:
+    raise ImportError(f"app_scheduling.py extends the handlers of gradysim {GRADYSIM_VERSION}, {version('gradysim')} is "
+                      f"installed. Install the version in requirements.txt: pip install -r requirements.txt")
+
+# Kinds of events, in the order they run when they share a timestamp, generation and node
+MOBILITY, TELEMETRY, TIMER, PACKET = range(4)
+# Node of the mobility update, which moves every node at once
+NO_NODE = -1
+# Destination of broadcast messages handed to another process
+BROADCAST = -1
+
+## Deterministic order of the simulation events
+## gradysim's event loop compares events by timestamp only, so events at the same time run in an order that depends on
+## the layout of its heap, and the protocols are sensitive to it. Events are kept here instead, in the order of their
+## key (timestamp, generation, node, kind, source, sequence):
+## - generation: 0 for events scheduled at an earlier time, one more than the running event's for the ones it schedules
+##   at its own time, so what zero-delay messages and timers cause runs in rounds
+## - node: the node the event runs on, events of a generation at a timestamp cannot affect each other across nodes
+## - source and sequence: sender and its count of sent messages for packets, the node's count of timers for timers
+## The node scheduling an event knows every part of its key, so a node's events run in the same order whether every
+## node shares the process or not (see app_distributed.py)
+class OrderedEvents:
+    now: float
+    key: Optional[tuple]
+    executed: int
+
+    # Standalone events are run by their owner with run_until, otherwise by the simulator's event loop once attached
+    def __init__(self, duration: Optional[float] = None, standalone: bool = False):
+        self.now = 0.0
+        self.key = None
+        self.executed = 0
+        self._duration = math.inf if duration is None else duration
+        self._standalone = standalone
+        self._heap = []
+        self._loop = None
+        self._dispatched = set()
+
+    # Handlers read the time from their event loop, this stands in for it
+    @property
+    def current_time(self) -> float:
+        return self.now
+
+    # Every handler attaches the loop it is injected with, they all get the same one
+    def attach(self, loop: EventLoop) -> None:
+        if not self._standalone:
+            self._loop = loop
+
+    # Generation of an event scheduled now for the given time
+    def generation(self, timestamp: float) -> int:
+        return self.key[1] + 1 if self.key is not None and timestamp == self.now else 0
+
+    def schedule(self, timestamp: float, generation: int, node: int, kind: int, source: int, sequence: int, callback) -> None:
+        heapq.heappush(self._heap, (timestamp, generation, node, kind, source, sequence, callback))
+        # The simulator's loop gets one event per distinct timestamp, running all of this one's due then
+        if self._loop is not None and timestamp not in self._dispatched:
+            self._dispatched.add(timestamp)
+            self._loop.schedule_event(timestamp, lambda: self._dispatch(timestamp), "Ordered events")
+
+    def _dispatch(self, timestamp: float) -> None:
+        self.now = timestamp
+        self.run_until((timestamp, math.inf))
+        self._dispatched.discard(timestamp)
+
+    # Runs, in key order, the events whose (timestamp, generation) is before the bound and not past the duration.
+    # Like gradysim, events past the duration never run
+    def run_until(self, bound: tuple) -> None:
+        heap = self._heap
+        while heap and heap[0][:2] < bound and heap[0][0] <= self._duration:
+            event = heapq.heappop(heap)
+            self.now = event[0]
+            self.key = event[:6]
+            self.executed += 1
+            event[6]()
+        self.key = None
+
+    # (timestamp, generation) of the next event, None when there is none
+    def next_key(self) -> Optional[tuple]:
+        return self._heap[0][:2] if self._heap else None
+
+## Timer handler scheduling its timers in the deterministic order
+class OrderedTimerHandler(TimerHandler):
+    def __init__(self, events: OrderedEvents):
+        super().__init__()
+        self._events = events
+        self._sequences = defaultdict(int)
+
+    def inject(self, event_loop: EventLoop) -> None:
+        self._events.attach(event_loop)
+        super().inject(self._events)
+
+    def set_timer(self, message: str, timestamp: float, node: Node):
+        if node not in self._registed_nodes:
+            raise TimerException(f"Could not set timer: Node {node.id} not registered")
+        if timestamp < self._events.now:
+            raise TimerException("Could not set timer: Timer cannot be set in the past")
+
+        identifier = self._timer_id
+        self._timer_id += 1
+        sequence = self._sequences[node.id]
+        self._sequences[node.id] += 1
+        self._pending_timers[node.id][message].add(identifier)
+        self._events.schedule(timestamp, self._events.generation(timestamp), node.id, TIMER, 0, sequence,
+                              lambda: self.fire_timer(message, node, identifier))
+
+## Communication handler delivering messages in the deterministic order
+## When the process hosts only some of the nodes, the others are registered too (so ids and broadcasts stay the same),
+## and what is sent to them goes to the outbox for their process to deliver with receive_remote
+class OrderedCommunicationHandler(CommunicationHandler):
+    outbox: list
+
+    def __init__(self, medium: CommunicationMedium, events: OrderedEvents, hosted: Optional[set] = None):
+        super().__init__(medium)
+        self._events = events
+        self._hosted = hosted
+        self._sequences = defaultdict(int)
+        self._local = []
+        self._remote = False
+        self.outbox = []
+        # Position of a hosted node at a past time, to check the range of messages sent from other processes
+        self.position_at = lambda node, time: node.position
+
+    def inject(self, event_loop: EventLoop) -> None:
+        self._events.attach(event_loop)
+        super().inject(self._events)
+
+    def register_node(self, node: Node):
+        super().register_node(node)
+        if self._hosted is None or node.id in self._hosted:
+            self._local.append(self._destinations[node.id])
+        else:
+            self._remote = True
+
+    def handle_command(self, command: CommunicationCommand, sender: Node, medium: CommunicationMedium = None):
+        if sender.id == command.destination:
+            raise CommunicationException("Error transmitting message: message destination is equal to sender. Try "
+                                         "using schedule_timer.")
+        medium = medium or self.default_medium
+        sequence = self._sequences[sender.id]
+        self._sequences[sender.id] += 1
+        timestamp = self._events.now + max(medium.delay, 0)
+        generation = self._events.generation(timestamp)
+        source = self._sources[sender.id]
+
+        if command.command_type == CommunicationCommandType.BROADCAST:
+            for endpoint in self._local:
+                if endpoint.node is not sender:
+                    self._transmit(command.message, source, sender.position, endpoint, endpoint.node.position, medium,
+                                   timestamp, generation, sequence)
+            if self._remote:
+                self.outbox.append((timestamp, generation, sender.id, sequence, sender.position, self._events.now,
+                                    BROADCAST, command.message))
+            return
+
+        destination = command.destination
+        if destination is None:
+            raise CommunicationException("Error transmitting message: a destination is "
+                                         "required when command type SEND is used.")
+        if destination not in self._destinations:
+            raise CommunicationException(f"Error transmitting message: destination {destination} does not exist.")
+        if self._hosted is None or destination in self._hosted:
+            endpoint = self._destinations[destination]
+            self._transmit(command.message, source, sender.position, endpoint, endpoint.node.position, medium,
+                           timestamp, generation, sequence)
+        else:
+            self.outbox.append((timestamp, generation, sender.id, sequence, sender.position, self._events.now,
+                                destination, command.message))
+
+    # Messages other processes sent to the hosted nodes, as they put them in their outbox. The range is checked against
+    # where the receiver was when the message was sent
+    def receive_remote(self, messages: list) -> None:
+        for timestamp, generation, sender, sequence, position, sendTime, destination, message in messages:
+            source = self._sources[sender]
+            endpoints = self._local if destination == BROADCAST else [self._destinations[destination]]
+            for endpoint in endpoints:
+                self._transmit(message, source, position, endpoint, self.position_at(endpoint.node, sendTime),
+                               self.default_medium, timestamp, generation, sequence)
+
+    def _transmit(self, message: str, source, senderPosition: Position, destination, receiverPosition: Position,
+                  medium: CommunicationMedium, timestamp: float, generation: int, sequence: int) -> None:
+        source.hand_over_message(message, destination)
+        if can_transmit(senderPosition, receiverPosition, medium):
+            self._events.schedule(timestamp, generation, destination.node.id, PACKET, source.node.id, sequence,
+                                  lambda: destination.receive_message(message, source))
+
+## Mobility handler that only moves, and sends telemetry to, the nodes that can move, in the deterministic order
+## gradysim's handler sends every node its telemetry on every tick (100 per simulated second). The ground station and
+## the sensors never move and do nothing with it, and with hundreds of sensors those events are most of the run
+class OrderedMobilityHandler(MobilityHandler):
+    def __init__(self, events: OrderedEvents, movingNodes: range, recordHistory: bool = False):
+        super().__init__()
+        self._events = events
+        self._movingNodes = movingNodes
+        # Positions of the moving nodes after every tick, when asked for, oldest first
+        self._history = deque([(-math.inf, dict())]) if recordHistory else None
+
+    def inject(self, event_loop: EventLoop) -> None:
+        self._events.attach(event_loop)
+        self._injected = True
+        self._event_loop = self._events
+        self._schedule_tick(self._events.now + self._configuration.update_rate)
+
+    def register_node(self, node: Node):
+        if node.id in self._movingNodes:
+            super().register_node(node)
+            if self._history is not None:
+                self._history[0][1][node.id] = node.position
+
+    # Same model and arithmetic as gradysim's massless mobility
+    def _update_movement(self):
+        updateRate = self._configuration.update_rate
+        now = self._events.now
+        for nodeID, node in self.nodes.items():
+            target = self.targets.get(nodeID)
+            if target is not None:
+                current = node.position
+                vector = (target[0] - current[0], target[1] - current[1], target[2] - current[2])
+                movement = self.speeds[nodeID] * updateRate
+                distance = math.sqrt(vector[0] ** 2 + vector[1] ** 2 + vector[2] ** 2)
+                if movement >= distance:
+                    node.position = (target[0], target[1], target[2])
+                else:
+                    multiplier = movement / distance
+                    node.position = (current[0] + vector[0] * multiplier,
+                                     current[1] + vector[1] * multiplier,
+                                     current[2] + vector[2] * multiplier)
+
+            telemetry = Telemetry(current_position=node.position)
+            self._events.schedule(now, self._events.generation(now), nodeID, TELEMETRY, 0, 0,
+                                  lambda node=node, telemetry=telemetry: node.protocol_encapsulator.handle_telemetry(telemetry))
+
+        if self._history is not None:
+            self._history.append((now, {nodeID: node.position for nodeID, node in self.nodes.items()}))
+        self._schedule_tick(now + updateRate)
+
+    def _schedule_tick(self, timestamp: float) -> None:
+        self._events.schedule(timestamp, self._events.generation(timestamp), NO_NODE, MOBILITY, 0, 0, self._update_movement)
+
+    # Where the node was at the given time, nodes that never move are where they have always been
+    def position_at(self, node: Node, time: float) -> Position:
+        if self._history is None or node.id not in self.nodes:
+            return node.position
+        for tick, positions in reversed(self._history):
+            if tick <= time:
+                return positions[node.id]
+        return node.position
+
+    # Drops the positions no longer needed for times from the given one on
+    def forget_before(self, time: float) -> None:
+        if self._history is not None:
+            while len(self._history) > 1 and self._history[1][0] <= time:
+                self._history.popleft()
+
+## Protocol of a node hosted by another process, it only stands in for the node so ids and broadcasts stay the same
+class RemoteNode(IProtocol):
+    def initialize(self) -> None:
+        pass
+
+    def handle_timer(self, timer: str) -> None:
+        pass
+
+    def handle_packet(self, message: str) -> None:
+        pass
+
+    def handle_telemetry(self, telemetry: Telemetry) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
@@ -0,0 +1,103 @@
+import math
+
+import numpy as np
+
+from gradysim.protocol.position import Position
+
+## Uniform grid over the x/y plane used to find points (sensors, waypoints) close to a position without scanning all of them
+## Points are sorted by cell so every cell is a contiguous slice of the coordinate and id arrays
+class SpatialGrid:
+    cellSize: float
+    _coords: np.ndarray
+    _ids: np.ndarray
+    _cells: dict
+
+    def __init__(self, points, ids=None, cellSize: float = 100):
+        coords = np.asarray(points, dtype=float).reshape(-1, 3)
+        ids = np.arange(len(coords)) if ids is None else np.asarray(ids)
+
+        self.cellSize = cellSize
+        cellX = np.floor(coords[:, 0] / cellSize).astype(np.int64)
+        cellY = np.floor(coords[:, 1] / cellSize).astype(np.int64)
+        order = np.lexsort((cellY, cellX))
+
+        self._coords = coords[order]
+        self._ids = ids[order]
+        self._cells = dict()
+
+        sortedX = cellX[order]
+        sortedY = cellY[order]
+        boundaries = np.flatnonzero((np.diff(sortedX) != 0) | (np.diff(sortedY) != 0)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(coords)]))
+
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if end > start:
+                self._cells[(int(sortedX[start]), int(sortedY[start]))] = (start, end)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # Ids of every point within radius of pos, ordered by distance
+    def query_radius(self, pos: Position, radius: float) -> list:
+        minX = math.floor((pos[0] - radius) / self.cellSize)
+        maxX = math.floor((pos[0] + radius) / self.cellSize)
+        minY = math.floor((pos[1] - radius) / self.cellSize)
+        maxY = math.floor((pos[1] + radius) / self.cellSize)
+
+        slices = []
+        for x in range(minX, maxX + 1):
+            for y in range(minY, maxY + 1):
+                cell = self._cells.get((x, y))
+                if cell is not None:
+                    slices.append(np.arange(*cell))
+
+        if not slices:
+            return []
+
+        candidates = np.concatenate(slices)
+        diff = self._coords[candidates] - pos
+        dists = np.einsum("ij,ij->i", diff, diff)
+        inRange = dists <= radius ** 2
+        found = candidates[inRange]
+        return self._ids[found[np.argsort(dists[inRange], kind="stable")]].tolist()
+
+    # Same as query_radius, scanning every point. Used as reference and for tiny point sets
+    def scan_radius(self, pos: Position, radius: float) -> list:
+        diff = self._coords - pos
+        dists = np.einsum("ij,ij->i", diff, diff)
+        inRange = np.flatnonzero(dists <= radius ** 2)
+        return self._ids[inRange[np.argsort(dists[inRange], kind="stable")]].tolist()
+
+    # Ids of the k closest points on the x/y plane, closest first, for every point: { id : [ids] }
+    # Every cell widens its ring of neighbouring cells until no point further out can beat its k-th closest
+    def nearest_neighbours(self, k: int) -> dict:
+        count = len(self._ids)
+        k = min(k, count - 1)
+        neighbours = dict()
+        if k <= 0:
+            return {point: [] for point in self._ids.tolist()}
+
+        for (cellX, cellY), (start, end) in self._cells.items():
+            own = np.arange(start, end)
+            ring = 1
+            while True:
+                slices = [np.arange(*self._cells[(x, y)])
+                          for x in range(cellX - ring, cellX + ring + 1)
+                          for y in range(cellY - ring, cellY + ring + 1) if (x, y) in self._cells]
+                candidates = np.concatenate(slices)
+                if len(candidates) > k:
+                    diff = self._coords[own, None, :2] - self._coords[None, candidates, :2]
+                    dists = np.einsum("ijk,ijk->ij", diff, diff)
+                    dists[candidates[None, :] == own[:, None]] = np.inf
+                    closest = np.argpartition(dists, k - 1, axis=1)[:, :k]
+                    closestDists = np.take_along_axis(dists, closest, axis=1)
+                    # Points outside the ring are at least ring cells away from every point of this cell
+                    if closestDists.max() <= (ring * self.cellSize) ** 2 or len(candidates) == count:
+                        break
+                ring += 1
+
+            ranked = np.take_along_axis(closest, closestDists.argsort(axis=1, kind="stable"), axis=1)
+            for point, row in zip(self._ids[own].tolist(), self._ids[candidates[ranked]].tolist()):
+                neighbours[point] = row
+        return neighbours
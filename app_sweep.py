@@ -0,0 +1,125 @@
+import argparse
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+from app_headless import run_headless
+from app_consensus import ENGINES
+from app_packets import EVICTION_POLICIES
+from app_decision import DECISION_POLICIES
+from app_scenario import ListLayout, scenario_from_globals
+
+import globals
+
+# Scenario knobs in their original form, every run starts from them so a worker process can host many runs
+DEFAULTS = {
+    "MAX_NODES": globals.MAX_NODES,
+    "SIMULATION_DURATION": globals.SIMULATION_DURATION,
+    "COMMUNICATION_MEDIUM_RANGE": globals.COMMUNICATION_MEDIUM_RANGE,
+    "SENSORS_COORD_LIST": list(globals.SENSORS_COORD_LIST),
+    "CONSENSUS_ENGINE": globals.CONSENSUS_ENGINE,
+    "UAV_BUFFER_CAPACITY": globals.UAV_BUFFER_CAPACITY,
+    "UAV_EVICTION_POLICY": globals.UAV_EVICTION_POLICY,
+    "DECISION_POLICY": globals.DECISION_POLICY,
+}
+
+# Builds every combination of the grid, one run per seed: [ { 'nodes': 3, 'range': 70, ..., 'seed': 1 }, ... ]
+def build_grid(nodes: List[int], ranges: List[float], durations: List[float], sensors: List[int], seeds: List[int],
+               engines: List[str] = None, capacities: List[int] = None, evictions: List[str] = None,
+               policies: List[str] = None) -> List[dict]:
+    engines = engines or [DEFAULTS["CONSENSUS_ENGINE"]]
+    capacities = capacities or [DEFAULTS["UAV_BUFFER_CAPACITY"]]
+    evictions = evictions or [DEFAULTS["UAV_EVICTION_POLICY"]]
+    policies = policies or [DEFAULTS["DECISION_POLICY"]]
+    return [
+        {"nodes": n, "range": r, "duration": d, "sensors": s, "engine": e, "capacity": c, "eviction": ev, "policy": p, "seed": seed}
+        for n, r, d, s, e, c, ev, p, seed in itertools.product(nodes, ranges, durations, sensors, engines, capacities, evictions, policies, seeds)
+    ]
+
+# Configures globals for a single run and executes it, called inside the worker processes
+def run_scenario(params: dict) -> dict:
+    for name, value in DEFAULTS.items():
+        setattr(globals, name, value)
+
+    if params["sensors"] > len(DEFAULTS["SENSORS_COORD_LIST"]):
+        raise ValueError(f"Scenario has only {len(DEFAULTS['SENSORS_COORD_LIST'])} sensors, {params['sensors']} requested")
+
+    scenario = scenario_from_globals().with_changes(
+        communicationRange=params["range"],
+        sensors=ListLayout(DEFAULTS["SENSORS_COORD_LIST"][:params["sensors"]]),
+    )
+
+    result = run_headless(duration=params["duration"], nodes=params["nodes"], seed=params["seed"],
+                          engine=params["engine"], capacity=params["capacity"], eviction=params["eviction"],
+                          policy=params["policy"], scenario=scenario)
+    return {**params, **result}
+
+# Runs the whole grid in a process pool and returns the rows in the same order as the grid
+# A run that fails keeps its parameters and gets an error column instead of results, so the other rows are still saved
+def run_sweep(grid: List[dict], workers: int = None) -> List[dict]:
+    rows: Dict[int, dict] = {}
+    failed = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_scenario, params): index for index, params in enumerate(grid)}
+
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                rows[index] = future.result()
+                print(f"[{len(rows)}/{len(grid)}] finished {grid[index]}")
+            except Exception as error:
+                failed += 1
+                rows[index] = {**grid[index], "error": f"{type(error).__name__}: {error}"}
+                print(f"[{len(rows)}/{len(grid)}] failed {grid[index]}: {rows[index]['error']}")
+
+    # Runs that succeeded get an empty error rather than the 0 written for missing values
+    if failed:
+        for row in rows.values():
+            row.setdefault("error", "")
+    return [rows[index] for index in range(len(grid))]
+
+# Saves the rows as CSV, or as Parquet if the path ends with .parquet (requires pandas)
+def write_results(rows: List[dict], path: str) -> None:
+    if path.endswith(".parquet"):
+        import pandas
+        pandas.DataFrame(rows).to_parquet(path, index=False)
+        return
+
+    # Header from the columns of every row, in the order they first appear, missing values written as 0
+    # Failed runs have no results, their missing values are left empty
+    fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames, restval=0)
+        writer.writeheader()
+        writer.writerows({**dict.fromkeys(fieldnames, ""), **row} if row.get("error") else row for row in rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a grid of consensus scenarios in parallel")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[globals.MAX_NODES], help="Values of MAX_NODES")
+    parser.add_argument("--range", type=float, nargs="+", default=[globals.COMMUNICATION_MEDIUM_RANGE], help="Values of COMMUNICATION_MEDIUM_RANGE")
+    parser.add_argument("--duration", type=float, nargs="+", default=[globals.SIMULATION_DURATION], help="Values of SIMULATION_DURATION")
+    parser.add_argument("--sensors", type=int, nargs="+", default=[len(globals.SENSORS_COORD_LIST)], help="Number of sensors used from SENSORS_COORD_LIST")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=[globals.CONSENSUS_ENGINE], help="Consensus engines to compare")
+    parser.add_argument("--capacity", type=int, nargs="+", default=[globals.UAV_BUFFER_CAPACITY], help="Values of UAV_BUFFER_CAPACITY, unlimited if not given")
+    parser.add_argument("--eviction", nargs="+", choices=list(EVICTION_POLICIES), default=[globals.UAV_EVICTION_POLICY], help="Eviction policies to compare")
+    parser.add_argument("--policies", nargs="+", choices=list(DECISION_POLICIES), default=[globals.DECISION_POLICY], help="Decision policies to compare")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="Random seeds, every configuration runs once per seed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--output", default="sweep.csv", help="Output table, .csv or .parquet")
+    args = parser.parse_args()
+
+    grid = build_grid(args.nodes, args.range, args.duration, args.sensors, args.seeds, args.engines, args.capacity, args.eviction, args.policies)
+    print(f"Running {len(grid)} scenarios on {args.workers} workers")
+
+    rows = run_sweep(grid, args.workers)
+    write_results(rows, args.output)
+
+    failed = sum(1 for row in rows if row.get("error"))
+    print(f"Results saved to {args.output}" + (f", {failed} of {len(rows)} runs failed" if failed else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from typing import Optional
+
+import numpy as np
+
+from gradysim.protocol.position import Position
+
+# Waypoints a UAV announces it will fly through, one (x, y, z) row each
+EMPTY_ROUTE = np.zeros((0, 3), dtype=float)
+EMPTY_ROUTE.flags.writeable = False
+
+## Per UAV trajectories announced by peers, each a polyline flown at constant speed from the time it was heard
+## Arrival times at every vertex are precomputed once, so predicting a position at time t is an interpolation
+class TrajectoryCache:
+    speed: float
+    _trajectories: dict
+
+    def __init__(self, speed: float):
+        self.speed = speed
+        # { uav : (start time, vertices (K, 3), arrival times (K,)) }
+        self._trajectories = dict()
+
+    # UAV left start at time now towards the route waypoints
+    def update(self, uav: int, now: float, start: Position, route: np.ndarray) -> None:
+        vertices = np.vstack((np.asarray(start, dtype=float), np.asarray(route, dtype=float).reshape(-1, 3)))
+        segments = np.linalg.norm(np.diff(vertices, axis=0), axis=1)
+        times = np.concatenate(([0], np.cumsum(segments) / self.speed))
+        self._trajectories[uav] = (now, vertices, times)
+
+    # Stale trajectories (the UAV was heard somewhere else) are dropped, pings are used until the next announcement
+    def forget(self, uav: int) -> None:
+        self._trajectories.pop(uav, None)
+
+    def clear(self) -> None:
+        self._trajectories.clear()
+
+    def __contains__(self, uav: int) -> bool:
+        return uav in self._trajectories
+
+    # Position of the UAV at time t, it stays at the last vertex once the route is flown
+    def predict(self, uav: int, t: float) -> Optional[np.ndarray]:
+        trajectory = self._trajectories.get(uav)
+        if trajectory is None:
+            return None
+
+        start, vertices, times = trajectory
+        elapsed = min(max(t - start, 0), times[-1])
+        return np.array([np.interp(elapsed, times, vertices[:, axis]) for axis in range(3)])
+
+    # Ids and predicted positions, one row each, of every UAV with a trajectory
+    def positions_at(self, t: float) -> tuple:
+        uavs = list(self._trajectories)
+        if not uavs:
+            return np.zeros(0, dtype=int), EMPTY_ROUTE
+        return np.asarray(uavs), np.vstack([self.predict(uav, t) for uav in uavs])
@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_headless import run_headless
+
+# Beaconing setups compared against the original fixed 1 Hz ping with full positions
+SETUPS = [
+    ("fixed", "binary"),
+    ("adaptive", "binary"),
+    ("fixed", "delta"),
+    ("adaptive", "delta"),
+]
+
+def change(value: float, reference: float) -> str:
+    return f"{(value - reference) / reference * 100:+.1f}%" if reference else "-"
+
+# Messages, bytes and handler invocations of adaptive beaconing and delta encoded positions, for growing swarms
+def main():
+    parser = argparse.ArgumentParser(description="Compares adaptive beaconing and delta positions with the fixed 1 Hz ping")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[6, 50, 200])
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+    args = parser.parse_args()
+
+    print(f"{'uavs':>5}  {'pings':>8}  {'codec':>6}  {'sent':>9}  {'received':>10}  {'bytes':>10}  {'iterations':>11}  {'picked up':>9}")
+    for nodes in args.nodes:
+        reference = None
+        for pingMode, codec in SETUPS:
+            runs = [run_headless(args.duration, nodes, seed, codec=codec, ping_mode=pingMode) for seed in args.seeds]
+            # handle_packet runs once per received message, the iterations count every event handled by the simulator
+            row = {key: sum(run[key] for run in runs) / len(runs)
+                   for key in ("messages_sent", "messages_received", "bytes_sent", "iterations", "collected_packets", "carried_packets")}
+            reference = reference or row
+
+            print(f"{nodes:>5}  {pingMode:>8}  {codec:>6}  "
+                  f"{change(row['messages_sent'], reference['messages_sent']):>9}  "
+                  f"{change(row['messages_received'], reference['messages_received']):>10}  "
+                  f"{change(row['bytes_sent'], reference['bytes_sent']):>10}  "
+                  f"{change(row['iterations'], reference['iterations']):>11}  "
+                  f"{row['collected_packets'] + row['carried_packets']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
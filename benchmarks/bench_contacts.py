@@ -0,0 +1,39 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_headless import run_headless
+from app_scenario import load_scenario, scenario_from_globals
+
+# Per lap of the swarm: what sensor contacts cost in messages and pauses, with and without contact deduplication
+COLUMNS = ["coordinates_sent", "proposal_sent", "decisions", "messages_sent", "pauses", "paused_time"]
+
+def bench_contacts(scenario, duration: float, seeds: list) -> None:
+    print(f"{'dedup':>5}  " + "  ".join(f"{column + '/lap':>20}" for column in COLUMNS) + f"  {'delivered':>9}  {'laps':>5}")
+    averages = dict()
+    for dedup in (False, True):
+        runs = [run_headless(duration, None, seed, scenario=scenario, dedup=dedup) for seed in seeds]
+        perLap = {column: sum(run.get(column, 0) / max(run["laps"], 1) for run in runs) / len(runs) for column in COLUMNS}
+        delivered = sum(run["collected_packets"] for run in runs) / len(runs)
+        laps = sum(run["laps"] for run in runs) / len(runs)
+        averages[dedup] = perLap
+        print(f"{str(dedup):>5}  " + "  ".join(f"{perLap[column]:>20.2f}" for column in COLUMNS) + f"  {delivered:>9.1f}  {laps:>5.1f}")
+
+    print(f"{'change':>5}  " + "  ".join(f"{(averages[True][column] / averages[False][column] - 1) * 100 if averages[False][column] else 0:>19.1f}%"
+                                         for column in COLUMNS))
+
+def main():
+    parser = argparse.ArgumentParser(description="Messages and pauses per lap caused by sensor contacts, with and without deduplication")
+    parser.add_argument("--scenario", default=None, help="Scenario file, the one in globals.py if not given")
+    parser.add_argument("--duration", type=float, default=300)
+    parser.add_argument("--seeds", type=int, nargs="+", default=list(range(1, 17)))
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario) if args.scenario else scenario_from_globals()
+    bench_contacts(scenario, args.duration, args.seeds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_decision import DECISION_POLICIES
+from app_headless import run_headless
+
+import globals
+
+# Packets delivered to the ground station per lap under each decision policy, averaged over the seeds
+def main():
+    parser = argparse.ArgumentParser(description="Compares decision policies on packets delivered per lap")
+    parser.add_argument("--policies", nargs="+", choices=list(DECISION_POLICIES), default=list(DECISION_POLICIES))
+    parser.add_argument("--duration", type=float, default=180)
+    parser.add_argument("--nodes", type=int, default=6)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+    parser.add_argument("--capacity", type=int, default=None, help="UAV buffer capacity, unlimited if not given")
+    args = parser.parse_args()
+
+    capacity = globals.UAV_BUFFER_CAPACITY if args.capacity is None else args.capacity
+
+    print(f"{'policy':>10}  {'delivered':>9}  {'laps':>5}  {'per lap':>7}  {'delay (s)':>9}  {'evicted':>7}")
+    for policy in args.policies:
+        runs = []
+        for seed in args.seeds:
+            globals.UAV_BUFFER_CAPACITY = capacity
+            runs.append(run_headless(args.duration, args.nodes, seed, policy=policy))
+
+        delivered = sum(run["collected_packets"] for run in runs) / len(runs)
+        laps = sum(run["laps"] for run in runs) / len(runs)
+        delay = sum(run["delivery_delay"] for run in runs) / len(runs)
+        evicted = sum(run["evicted_packets"] for run in runs) / len(runs)
+
+        print(f"{policy:>10}  {delivered:>9.1f}  {laps:>5.1f}  {delivered / laps if laps else 0:>7.2f}  {delay:>9.2f}  {evicted:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
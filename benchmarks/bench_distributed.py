@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_distributed import check_equivalence, run_distributed
+from app_headless import run_headless
+from app_scenario import load_scenario, scenario_from_globals
+
+# Results compared between runs, everything but the timing of the run itself
+COLUMNS = ["collected_packets", "laps", "proposals", "decisions", "messages_sent", "paused_time", "delivery_delay"]
+
+# Means over the seeds of the single-process run and of distributed runs with every worker count, with the wall time
+# on this machine and with a CPU per worker. Distributed runs must simulate the same run as the single-process run of
+# their seed, the ones where any column differs (check_equivalence) are counted
+def bench_distributed(scenario, duration: float, seeds: list, workerCounts: list) -> None:
+    print(f"{'runner':>10}  " + "  ".join(f"{column:>17}" for column in COLUMNS)
+          + f"  {'wall (s)':>8}  {'CPU/worker (s)':>14}  {'windows':>7}  {'differ':>6}")
+    headless = [run_headless(duration, None, seed, scenario=scenario) for seed in seeds]
+    runs = {"headless": headless}
+    for workers in workerCounts:
+        runs[f"{workers} workers"] = [run_distributed(duration, None, seed, scenario=scenario, workers=workers) for seed in seeds]
+
+    for runner, results in runs.items():
+        means = {column: sum(run[column] for run in results) / len(results) for column in COLUMNS + ["wall_time"]}
+        distributed = runner != "headless"
+        parallel = f"{sum(run['parallel_time'] for run in results) / len(results):.2f}" if distributed else ""
+        windows = f"{sum(run['windows'] for run in results) / len(results):.0f}" if distributed else ""
+        differ = sum(bool(check_equivalence(run, reference)) for run, reference in zip(results, headless)) if distributed else ""
+        print(f"{runner:>10}  " + "  ".join(f"{means[column]:>17.2f}" for column in COLUMNS)
+              + f"  {means['wall_time']:>8.2f}  {parallel:>14}  {windows:>7}  {differ:>6}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares distributed runs with every worker count to the single-process run")
+    parser.add_argument("--scenario", default=None, help="Scenario file, the one in globals.py if not given")
+    parser.add_argument("--duration", type=float, default=300)
+    parser.add_argument("--seeds", type=int, nargs="+", default=list(range(1, 17)))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--delay", type=float, default=None, help="Communication delay in seconds, the lookahead, overrides the scenario")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario) if args.scenario else scenario_from_globals()
+    if args.delay is not None:
+        scenario = scenario.with_changes(communicationDelay=args.delay)
+    bench_distributed(scenario, args.duration, args.seeds, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_headless import run_headless
+from app_routing import cover_points, plan_route, plan_partitioned_routes, route_length, tour_waypoints
+from app_scenario import get_sensor_layout, load_scenario, scenario_from_globals
+
+import globals
+
+# Route over the same waypoints as the planner, in angular order around the ground base
+def angular_route(sensors: np.ndarray, groundBase: tuple, restart: tuple, communicationRange: float) -> list:
+    sensors = cover_points(sensors, communicationRange / 2)
+    angles = np.arctan2(sensors[:, 1] - groundBase[1], sensors[:, 0] - groundBase[0])
+    return tour_waypoints(sensors[np.argsort(angles, kind="stable")], restart)
+
+# Planning time and lap length of random layouts of growing size: angular order, planned shared route, partitioned routes
+def bench_planning(counts: list, uavs: int, communicationRange: float) -> None:
+    groundBase, restart = (0, 0, 0), (0, 0, 10)
+    print(f"{'sensors':>7}  {'angular (m)':>11}  {'planned (m)':>11}  {'time (s)':>8}  {'per UAV (m)':>11}  {'time (s)':>8}")
+    for count in counts:
+        # Area grows with the sensors so density stays the same
+        side = 300 * max(1, (count / 100) ** 0.5)
+        sensors = get_sensor_layout("random", count=count, x_range=(-side, side), y_range=(-side, side), seed=1).coords()
+
+        angular = route_length(angular_route(sensors, groundBase, restart, communicationRange), groundBase)
+        start = time.perf_counter()
+        planned = route_length(plan_route(sensors, groundBase, restart, communicationRange, globals.ROUTE_PLANNING_TIME,
+                                       globals.ROUTE_PLANNING_PASSES), groundBase)
+        plannedTime = time.perf_counter() - start
+        start = time.perf_counter()
+        routes = plan_partitioned_routes(sensors, uavs, groundBase, restart, communicationRange, globals.ROUTE_PLANNING_TIME,
+                                         globals.ROUTE_PLANNING_PASSES)
+        partitionedTime = time.perf_counter() - start
+        longest = max(route_length(route, groundBase) for route in routes)
+
+        print(f"{count:>7}  {angular:>11.0f}  {planned:>11.0f}  {plannedTime:>8.2f}  {longest:>11.0f}  {partitionedTime:>8.2f}")
+
+# Packets delivered and laps flown with a shared route and with partitioned routes, averaged over the seeds
+def bench_simulation(scenario, duration: float, seeds: list) -> None:
+    print(f"{'planner':>11}  {'prediction':>10}  {'delivered':>9}  {'laps':>5}  {'delivery':>8}  {'delay (s)':>9}")
+    for planner in ("shared", "partitioned"):
+        for prediction in (False, True):
+            runs = [run_headless(duration, None, seed, scenario=scenario, planner=planner, prediction=prediction) for seed in seeds]
+            delivered = sum(run["collected_packets"] for run in runs) / len(runs)
+            laps = sum(run["laps"] for run in runs) / len(runs)
+            ratio = sum(run["delivery_ratio"] for run in runs) / len(runs)
+            delay = sum(run["delivery_delay"] for run in runs) / len(runs)
+            print(f"{planner:>11}  {str(prediction):>10}  {delivered:>9.1f}  {laps:>5.1f}  {ratio:>8.3f}  {delay:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares route planning: lap length, planning time and packets delivered")
+    parser.add_argument("--only", choices=["planning", "simulation"], default=None, help="Runs a single part of the benchmark")
+    parser.add_argument("--sensors", type=int, nargs="+", default=[100, 1000, 5000, 10000], help="Sensors of the planning benchmark")
+    parser.add_argument("--uavs", type=int, default=6, help="UAVs the sensors are split between in the planning benchmark")
+    parser.add_argument("--scenario", default=None, help="Scenario file of the simulation benchmark, the one in globals.py if not given")
+    parser.add_argument("--duration", type=float, default=300)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1, 2, 3])
+    args = parser.parse_args()
+
+    if args.only != "simulation":
+        bench_planning(args.sensors, args.uavs, globals.COMMUNICATION_MEDIUM_RANGE)
+    if args.only != "planning":
+        scenario = load_scenario(args.scenario) if args.scenario else scenario_from_globals()
+        bench_simulation(scenario, args.duration, args.seeds)
+
+
+if __name__ == "__main__":
+    main()
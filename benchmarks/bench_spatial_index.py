@@ -0,0 +1,49 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_spatial import SpatialGrid
+
+# Query cost of the sensor spatial index against a full scan, for growing numbers of sensors spread with constant density
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks SpatialGrid radius queries against sensor count")
+    parser.add_argument("--sensors", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--radius", type=float, default=70)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'sensors':>8}  {'build (ms)':>10}  {'grid (us/query)':>15}  {'scan (us/query)':>15}  {'found/query':>11}")
+    for count in args.sensors:
+        # Keeps roughly 8 sensors per 600 x 600 m area, the density of the default scenario
+        side = 600 * np.sqrt(count / 8)
+        sensors = np.column_stack((rng.uniform(-side / 2, side / 2, (count, 2)), np.zeros(count)))
+        queries = np.column_stack((rng.uniform(-side / 2, side / 2, (args.queries, 2)), np.full(args.queries, 10.0)))
+        queries = [tuple(query) for query in queries.tolist()]
+
+        start = time.perf_counter()
+        grid = SpatialGrid(sensors, cellSize=args.radius)
+        buildTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = sum(len(grid.query_radius(query, args.radius)) for query in queries)
+        gridTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in queries:
+            grid.scan_radius(query, args.radius)
+        scanTime = time.perf_counter() - start
+
+        print(f"{count:>8}  {buildTime * 1e3:>10.2f}  {gridTime / len(queries) * 1e6:>15.2f}  "
+              f"{scanTime / len(queries) * 1e6:>15.2f}  {found / len(queries):>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gradysim.simulator.simulation import SimulationConfiguration
+from app_consensus import make_decision
+from app_decision import get_decision_policy
+from app_execution import create_builder
+from app_headless import run_headless
+from app_message import GeneralSender, new_message, get_codec
+from app_positions import UAVPositionStore
+from app_scenario import ListLayout, scenario_from_globals
+
+import globals
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# How much worse than the baseline a result may get before it is flagged: throughput lost, memory gained
+THROUGHPUT_TOLERANCE = 0.15
+MEMORY_TOLERANCE = 0.20
+
+MACRO_NODES = [3, 6, 50, 200]
+MACRO_SENSORS = [8, 100, 1000]
+
+## Micro benchmarks - hot paths of the protocols, timed in isolation
+
+# Calls per second of fn, best of the rounds so background load does not count, and the peak memory it allocates
+# over one round in KiB
+def measure(fn, calls: int, rounds: int = 10) -> dict:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    for _ in range(calls):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ops_per_second": calls / best, "peak_kib": peak / 1024}
+
+def ping_message(sender: int = 2):
+    return new_message(packets=12, senderType=GeneralSender.UAV, senderID=sender, senderPos=(120.5, -40.25, 10), proposal=(-1, 830.4))
+
+def bench_codecs(calls: int) -> dict:
+    results = dict()
+    for name in ("json", "binary"):
+        codec = get_codec(name)
+        encoded = codec.encode(ping_message())
+        results[f"message_encode_{name}"] = measure(lambda: codec.encode(ping_message()), calls)
+        results[f"message_decode_{name}"] = measure(lambda: codec.decode(encoded), calls)
+    return results
+
+# Scoring every UAV for a sensor, what each proposer does on sensor contact
+def bench_scoring(calls: int) -> dict:
+    results = dict()
+    rng = np.random.default_rng(0)
+    policy = get_decision_policy("nearest")
+
+    for uavs in (6, 200):
+        store = UAVPositionStore(uavs)
+        for uav in range(1, uavs + 1):
+            store.update(uav, tuple(rng.uniform(-300, 300, 3)))
+        results[f"uav_scores_{uavs}"] = measure(lambda: store.best((150, 200, 0), policy, 10.0), calls)
+    return results
+
+def bench_decision(calls: int) -> dict:
+    results = dict()
+    for uavs in (6, 200):
+        proposals = {uav: (uav, float(uavs - uav) * 1.5) for uav in range(1, uavs + 1)}
+        results[f"make_decision_{uavs}"] = measure(lambda: make_decision(proposals), calls)
+    return results
+
+# Ping dispatch through UAVProtocol.handle_packet, on a UAV of a freshly built default scenario
+def bench_dispatch(calls: int) -> dict:
+    config = SimulationConfiguration(duration=1, real_time=False, execution_logging=False)
+    simulation = create_builder(config, visualization=False).build()
+    simulation.step_simulation()
+    uav = simulation.get_node(1).protocol_encapsulator.protocol
+
+    ping = get_codec(globals.MESSAGE_CODEC).encode(ping_message())
+    return {"handle_packet_ping": measure(lambda: uav.handle_packet(ping), calls)}
+
+def run_micro(calls: int) -> dict:
+    return {**bench_codecs(calls), **bench_scoring(calls), **bench_decision(calls), **bench_dispatch(calls)}
+
+## Macro benchmarks - the whole scenario run headless, each in a fresh process so its peak memory is its own
+
+# The default sensors, then sensors spread uniformly over the simulation area up to count
+def scatter_sensors(count: int, seed: int) -> list:
+    sensors = list(globals.SENSORS_COORD_LIST[:count])
+    rng = np.random.default_rng(seed)
+    extra = count - len(sensors)
+    xs = rng.uniform(*globals.SIMULATION_RANGE_X, extra)
+    ys = rng.uniform(*globals.SIMULATION_RANGE_Y, extra)
+    return sensors + [(float(x), float(y), 0) for x, y in zip(xs, ys)]
+
+def run_macro_scenario(nodes: int, sensors: int, duration: float, seed: int) -> dict:
+    scenario = scenario_from_globals().with_changes(sensors=ListLayout(scatter_sensors(sensors, seed)))
+    result = run_headless(duration, nodes, seed, scenario=scenario)
+    return {
+        "iterations": result["iterations"],
+        "wall_time": result["wall_time"],
+        "iterations_per_second": result["iterations_per_second"],
+        "speedup": result["speedup"],
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+# Every scenario runs repeats times, the fastest run is kept
+def run_macro(nodes: list, sensors: list, duration: float, seed: int, repeats: int) -> dict:
+    results = dict()
+    for uavs in nodes:
+        for count in sensors:
+            runs = []
+            for _ in range(repeats):
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    runs.append(executor.submit(run_macro_scenario, uavs, count, duration, seed).result())
+            results[f"scenario_{uavs}uav_{count}sensors"] = max(runs, key=lambda run: run["iterations_per_second"])
+            print(f"  scenario {uavs} UAVs, {count} sensors done", flush=True)
+    return results
+
+## Baseline comparison
+
+# Throughput and memory entries of a result, with whether higher is better
+METRICS = {
+    "ops_per_second": True,
+    "peak_kib": False,
+    "iterations_per_second": True,
+    "peak_rss_mib": False,
+}
+
+# Lines describing every result against the baseline, and whether any of them regressed
+def compare(results: dict, baseline: dict) -> tuple:
+    lines = []
+    regressed = False
+
+    for section, benchmarks in results.items():
+        for name, values in benchmarks.items():
+            reference = baseline.get(section, {}).get(name)
+            for metric, higherIsBetter in METRICS.items():
+                if metric not in values:
+                    continue
+                value = values[metric]
+                line = f"{name:<32} {metric:<22} {value:>14.1f}"
+
+                if reference is None or metric not in reference:
+                    lines.append(f"{line}  (no baseline)")
+                    continue
+
+                change = (value - reference[metric]) / reference[metric] if reference[metric] else 0
+                worse = -change > THROUGHPUT_TOLERANCE if higherIsBetter else change > MEMORY_TOLERANCE
+                regressed = regressed or worse
+                lines.append(f"{line}  {change * 100:+7.1f}%{'  REGRESSION' if worse else ''}")
+
+            # Macro runs are seeded, a different number of events means the scenario itself behaves differently now
+            if reference is not None and "iterations" in values and values["iterations"] != reference.get("iterations"):
+                lines.append(f"{name:<32} iterations changed: {reference.get('iterations')} -> {values['iterations']}, throughput is not like for like")
+
+    return lines, regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro and macro benchmarks, compared against a stored baseline")
+    parser.add_argument("--only", choices=["micro", "macro"], default=None, help="Runs a single part of the suite")
+    parser.add_argument("--calls", type=int, default=2000, help="Calls per round of every micro benchmark")
+    parser.add_argument("--nodes", type=int, nargs="+", default=MACRO_NODES)
+    parser.add_argument("--sensors", type=int, nargs="+", default=MACRO_SENSORS)
+    parser.add_argument("--duration", type=float, default=10, help="Simulated seconds of every macro scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3, help="Runs of every macro scenario, the fastest is kept")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Stores the results as the new baseline instead of comparing")
+    args = parser.parse_args()
+
+    results = dict()
+    if args.only != "macro":
+        print("Running micro benchmarks", flush=True)
+        results["micro"] = run_micro(args.calls)
+    if args.only != "micro":
+        print("Running macro benchmarks", flush=True)
+        results["macro"] = run_macro(args.nodes, args.sensors, args.duration, args.seed, args.repeats)
+
+    if args.save_baseline:
+        # Parts that were not run keep their previous baseline
+        baseline = dict()
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        baseline.update(results)
+        baseline["machine"] = {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor()}
+        with open(args.baseline, "w") as file:
+            json.dump(baseline, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    baseline = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    else:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to store one")
+
+    lines, regressed = compare(results, baseline)
+    print("\n".join(lines))
+    if regressed:
+        print("Regressions found")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
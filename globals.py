@@ -4,6 +4,7 @@ SIMULATION_RANGE_X = (-300, 300)
 SIMULATION_RANGE_Y = (-300, 300)
 SIMULATION_RANGE_Z = (0, 50)
 COMMUNICATION_MEDIUM_RANGE = 70
+COMMUNICATION_MEDIUM_DELAY = 0 # seconds between sending and receiving a message, the lookahead of distributed runs
 GROUND_BASE_CORD = (0, 0, 0)
 RESTART_COORD = (0, 0, 10)
 SENSORS_COORD_LIST = [
@@ -29,4 +30,46 @@ BASE_WAYPOINTS_COORD_LIST = [
     ( 150,  200,  10), # waypoint 10
     (   0,  200,  10), # waypoint 1
     RESTART_COORD, # restart coord
-]
\ No newline at end of file
+]
+SENSOR_PACKET_RATE = 1 # packets each sensor generates per second, on average for the random models
+SENSOR_GENERATION_MODEL = "constant" # "constant" (SENSOR_PACKET_RATE every second), "poisson" (independent packets) or "bursty" (bursts at random times)
+SENSOR_BURST_SIZE = 10 # packets of each burst of the bursty model
+UAV_BUFFER_CAPACITY = None # packets a UAV can carry, None for no limit
+UAV_EVICTION_POLICY = "drop-oldest" # what a full UAV gives up: "drop-oldest", "drop-newest" or "fair-share" (even split between sensors)
+UAV_NEAR_FULL = 0.9 # fraction of the capacity from which a UAV is no longer chosen to collect packets
+DECISION_POLICY = "nearest" # how the UAV collecting from a sensor is chosen: "nearest", "load", "route" or "balanced"
+DECISION_WEIGHTS = { # meters of distance to the sensor each term is worth
+    "distance": 1,
+    "load": 0.5, # per packet carried
+    "route": 0.05, # per meter of route left
+    "recent": 30, # for a UAV assigned to a sensor just now
+}
+RECENT_ASSIGNMENT_WINDOW = 30 # seconds over which a past assignment still counts against a UAV
+MESSAGE_CODEC = "binary" # "binary", "delta" (binary with pings carrying position deltas) or "json" (readable, for debugging)
+PING_MODE = "fixed" # "fixed" pings every PING_INTERVAL_MIN, "adaptive" backs off up to PING_INTERVAL_MAX while nothing changes
+PING_INTERVAL_MIN = 1 # seconds
+PING_INTERVAL_MAX = 4
+PING_NEIGHBOUR_CHURN = 0.25 # fraction of the neighbours that may change between pings while backing off
+SENSOR_SERVED_WINDOW = 10 # seconds after a decision for a sensor during which adaptive pings do not speed up for it
+CONTACT_DEDUP = True # sensors answer a UAV once per contact and UAVs take part in one round per sensor and lap
+SENSOR_CONTACT_HOLD = 6 # seconds a sensor ignores the pings of a UAV it answered (round pending), and every ping after handing over its packets
+PING_DEVIATION = 10 # meters a UAV may drift from the flight predicted by its last pings before pinging at the minimum interval
+CONSENSUS_ENGINE = "coordinator" # "coordinator" (biggest UAV id arbitrates every round) or "rotating" (arbitration rotates with the sensor)
+CONSENSUS_QUORUM = "all" # coordinating host decides once "all" peers or a "majority" of them have proposed
+PROPOSAL_TIMEOUT_MIN = 1 # bounds, in seconds, of the adaptive fallback timer for proposals (peers hear a sensor on their 1 s ping)
+PROPOSAL_TIMEOUT_MAX = 3
+TRAJECTORY_PREDICTION = False # UAVs announce their routes and peers predict their positions from them, only the UAV collecting from a sensor stops for consensus
+SIMULATION_SEED = None # seed of the waypoint offsets of every UAV, a new one is drawn (and recorded in the results) when None
+ROUTE_PLANNER = "shared" # "shared" (every UAV flies the scenario route, offset so they do not overlap) or "partitioned" (sensors split between UAVs, each flies its own planned tour)
+ROUTE_PLANNING_PASSES = 10 # times the route planner may look at every waypoint on average while improving a tour, tours usually converge in under 2
+ROUTE_PLANNING_TIME = 2 # safety limit, in seconds, on improving tours (shared between the UAVs when partitioned), routes cut short by it depend on the machine and are logged
+EVENT_LOG_LEVELS = { # lowest level of the protocol events logged per category, "DEBUG", "INFO" or "WARNING" (off)
+    "consensus": "INFO", # rounds, proposals and decisions
+    "mobility": "INFO", # pauses, resumes and new laps, routes at DEBUG
+    "packets": "INFO", # packets collected, acknowledged and evicted
+    "network": "WARNING", # every ping and sensor reply, DEBUG to log them
+}
+EVENT_LOG_BUFFER = 4096 # events kept in memory before they are written to the event log file
+PROFILE_HANDLERS = False # times every protocol callback per protocol class, off costs nothing as protocols are not wrapped
+PROFILE_OUTPUT = None # with a path, protocol callbacks also run under cProfile and the stats are saved there (enables profiling)
+DISTRIBUTED_WORKERS = None # worker processes app_distributed.py splits the nodes between, one per CPU when None